@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from collections import defaultdict
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+from pygame.locals import K_a, K_d, K_LEFT, K_RIGHT
+
+from main import (GameState, update_game, DIFFICULTY_SETTINGS, GAME_MODE_SOLO, GAME_MODE_MULTI,
+                  STATE_PLAYING, SIM_DT)
+
+MODES = {'solo': GAME_MODE_SOLO, 'multi': GAME_MODE_MULTI}
+
+
+def make_inputs():
+    # Todas as combinações de teclas já prontas, para o roteiro não alocar nada por tick
+    combos = {}
+    for p1 in (K_a, K_d):
+        for p2 in (K_LEFT, K_RIGHT):
+            keys = defaultdict(bool)
+            keys[p1] = True; keys[p2] = True
+            combos[(p1, p2)] = keys
+    p1_period = int(1.5 / SIM_DT)
+    p2_period = int(2.0 / SIM_DT)
+
+    def input_fn(tick):
+        p1 = K_a if (tick // p1_period) % 2 == 0 else K_d
+        p2 = K_LEFT if (tick // p2_period) % 2 == 0 else K_RIGHT
+        return combos[(p1, p2)]
+    return input_fn
+
+
+def new_state(difficulty, mode, seconds, seed):
+    random.seed(seed); np.random.seed(seed)
+    state = GameState()
+    state.current_difficulty = difficulty
+    state.game_mode = mode
+    state.reset()
+    state.state_id = STATE_PLAYING
+    state.max_time = seconds + 1.0
+    # Vidas infinitas para a partida não acabar antes do fim do roteiro
+    state.p1.lives = 10 ** 9
+    if mode == GAME_MODE_MULTI: state.p2.lives = 10 ** 9
+    return state
+
+
+def speed_for_tick(tick):
+    # Sobe o nível de velocidade de 1 a 5 a cada 10 segundos simulados
+    return 1 + (int(tick * SIM_DT) // 10) % 5
+
+
+def run_case(difficulty, mode, seconds, seed, alloc_ticks):
+    ticks = int(round(seconds / SIM_DT))
+    input_fn = make_inputs()
+
+    state = new_state(difficulty, mode, seconds, seed)
+    peak = 0
+    start = time.perf_counter()
+    for tick in range(ticks):
+        state.p1.speed_level = state.p2.speed_level = speed_for_tick(tick)
+        update_game(state, SIM_DT, input_fn(tick))
+        n = len(state.stars)
+        if n > peak: peak = n
+    elapsed = time.perf_counter() - start
+    scores = (state.p1.score, state.p2.score)
+
+    # Segunda passada, curta e fora da medição de tempo, com tracemalloc ligado
+    state = new_state(difficulty, mode, seconds, seed)
+    alloc_ticks = min(alloc_ticks, ticks)
+    tracemalloc.start()
+    peaks = 0
+    blocks_before = sys.getallocatedblocks()
+    for tick in range(alloc_ticks):
+        state.p1.speed_level = state.p2.speed_level = speed_for_tick(tick)
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        update_game(state, SIM_DT, input_fn(tick))
+        _, tick_peak = tracemalloc.get_traced_memory()
+        peaks += tick_peak - base
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+
+    return {
+        'difficulty': difficulty,
+        'mode': [k for k, v in MODES.items() if v == mode][0],
+        'seconds': seconds,
+        'ticks': ticks,
+        'elapsed_s': elapsed,
+        'ticks_per_sec': ticks / elapsed if elapsed > 0 else float('inf'),
+        'peak_entities': peak,
+        'alloc_peak_bytes_per_tick': peaks / alloc_ticks if alloc_ticks else 0.0,
+        'net_blocks_per_tick': (blocks_after - blocks_before) / alloc_ticks if alloc_ticks else 0.0,
+        'score_p1': scores[0],
+        'score_p2': scores[1],
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['difficulty'], r['mode']): r for r in json.load(f)['results']}
+    print(f"\nComparação com {baseline_path}:")
+    for r in results:
+        old = baseline.get((r['difficulty'], r['mode']))
+        if not old: continue
+        ratio = r['ticks_per_sec'] / old['ticks_per_sec']
+        print(f"  {r['difficulty']:<15} {r['mode']:<5} ticks/s {old['ticks_per_sec']:>10.0f} -> {r['ticks_per_sec']:>10.0f} ({ratio:.2f}x)")
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark headless da simulação de Defensores da Terra")
+    parser.add_argument('--seconds', type=float, default=60.0, help="segundos simulados por caso")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--alloc-ticks', type=int, default=2000, help="ticks medidos com tracemalloc")
+    parser.add_argument('--difficulty', action='append', choices=list(DIFFICULTY_SETTINGS), help="padrão: todas")
+    parser.add_argument('--mode', action='append', choices=list(MODES), help="padrão: solo e multi")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help="JSON de uma execução anterior")
+    args = parser.parse_args(argv)
+
+    results = []
+    for difficulty in args.difficulty or list(DIFFICULTY_SETTINGS):
+        for mode_name in args.mode or list(MODES):
+            r = run_case(difficulty, MODES[mode_name], args.seconds, args.seed, args.alloc_ticks)
+            results.append(r)
+            print(f"{difficulty:<15} {mode_name:<5} {r['ticks_per_sec']:>10.0f} ticks/s  "
+                  f"pico {r['peak_entities']:>4} entidades  "
+                  f"{r['alloc_peak_bytes_per_tick']:>8.0f} B/tick  {r['net_blocks_per_tick']:+.3f} blocos/tick")
+
+    report = {
+        'seconds': args.seconds,
+        'seed': args.seed,
+        'sim_dt': SIM_DT,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados salvos em {args.out}")
+    if args.compare: compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+POSES = 4
+RENDER_NPCS = 20
+
+
+def configure(width, height):
+    # has to run before the game modules are imported: they copy the window size with `from settings import *`
+    import settings as s
+    s.RES = s.WIDTH, s.HEIGHT = width, height
+    s.HALF_WIDTH, s.HALF_HEIGHT = width // 2, height // 2
+    s.MOUSE_BORDER_RIGHT = width - s.MOUSE_BORDER_LEFT
+    s.view = s.View(s.RES)
+
+
+def make_map(name, seed):
+    from map import mini_map
+    if name == 'default':
+        return [row[:] for row in mini_map]
+    # square map with a wall border and random pillars; the corner by the spawn stays open
+    size = int(name)
+    rng = random.Random(seed)
+    grid = [[rng.randint(1, 5) for _ in range(size)] for _ in range(size)]
+    for y in range(1, size - 1):
+        for x in range(1, size - 1):
+            if rng.random() > 0.12 or (x < 4 and y < 4):
+                grid[y][x] = False
+    return grid
+
+
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {'median_us': times[len(times) // 2] * 1e6, 'min_us': times[0] * 1e6}
+
+
+class Scene:
+    def __init__(self, game, map_name, npcs, seed):
+        from pathfinding import PathFinding
+        from npc import SoldierNPC
+        self.game = game
+        grid = make_map(map_name, seed)
+        game.map.mini_map = grid
+        game.map.world_map = {}
+        game.map.rows, game.map.cols = len(grid), len(grid[0])
+        game.map.get_map()
+        game.pathfinding = PathFinding(game)
+
+        rng = random.Random(seed)
+        free = [(x, y) for y, row in enumerate(grid) for x, value in enumerate(row) if not value]
+        self.poses = [(*rng.choice(free), i * math.tau / POSES + 0.3) for i in range(POSES)]
+        handler = game.object_handler
+        handler.npc_list = [SoldierNPC(game, pos=(x + 0.5, y + 0.5)) for x, y in rng.sample(free, npcs)]
+        handler.npc_positions = {npc.map_pos for npc in handler.npc_list}
+
+    def set_pose(self, i):
+        from pipeline import FrameSnapshot
+        x, y, angle = self.poses[i]
+        player = self.game.player
+        # off the cell centre, where the NPCs stand: an exactly axis-aligned sight line divides by zero
+        player.x, player.y, player.angle = x + 0.37, y + 0.61, angle
+        self.game.frame = FrameSnapshot(self.game)
+
+    def objects(self):
+        return self.game.object_handler.sprite_list + self.game.object_handler.npc_list
+
+
+def run_render_benches(game, res, map_name, seed, repeat, workers=0):
+    from parallel_raycasting import ParallelRayCasting
+    scene = Scene(game, map_name, RENDER_NPCS, seed)
+    rc = game.raycasting
+    renderer = game.object_renderer
+    parallel = ParallelRayCasting(game, workers) if workers else None
+    results = []
+    for pose in range(POSES):
+        scene.set_pose(pose)
+        case = {'res': res, 'map': map_name, 'npcs': RENDER_NPCS, 'pose': pose}
+        results.append({'bench': 'ray_cast', **case, **measure(rc.ray_cast, repeat)})
+        results.append({'bench': 'get_objects_to_render', **case, **measure(rc.get_objects_to_render, repeat)})
+
+        # sprites that pass the visibility test in get_sprite, projected on their own
+        rc.get_objects_to_render()
+        for obj in scene.objects():
+            obj.get_sprite()
+        visible = [obj for obj in scene.objects()
+                   if -obj.IMAGE_HALF_WIDTH < obj.screen_x < (res[0] + obj.IMAGE_HALF_WIDTH) and obj.norm_dist > 0.5]
+
+        def project():
+            for obj in visible:
+                obj.get_sprite_projection()
+
+        def forget():
+            # the scaled images are cached per sprite; forget them so every call scales, as when things move
+            game.object_handler.sprites_to_render = []
+            for obj in visible:
+                obj.projection_key = None
+        results.append({'bench': 'get_sprite_projection', **case, 'visible': len(visible),
+                        **measure(project, repeat, setup=forget)})
+
+        rc.get_objects_to_render()
+        game.object_handler.sprites_to_render = []
+        project()
+        rc.add_sprites(game.object_handler.sprites_to_render)
+        results.append({'bench': 'render_game_objects', **case, 'objects': len(rc.objects_to_render),
+                        **measure(renderer.render_game_objects, repeat)})
+
+        if renderer.floor:
+            # forget the cached pose so every call casts the floor again, as when the player moves
+            def floor():
+                renderer.floor.draw(renderer.view_surface, game.player.x, game.player.y, game.player.angle)
+            results.append({'bench': 'floor_cast', **case,
+                            **measure(floor, repeat, setup=lambda: setattr(renderer.floor, 'pose', None))})
+
+        if parallel:
+            # the whole wall pass, sky and floor included, on one core and split across the pool
+            def serial():
+                renderer.draw_background()
+                rc.ray_cast()
+                rc.get_objects_to_render()
+                renderer.render_game_objects()
+
+            def split():
+                parallel.start(game.frame)
+                parallel.finish(renderer.view_surface)
+            results.append({'bench': 'walls_serial', **case, **measure(serial, repeat)})
+            results.append({'bench': 'walls_parallel', **case, 'workers': workers, **measure(split, repeat)})
+    if parallel:
+        parallel.close()
+    return results
+
+
+def run_npc_benches(game, map_name, npcs, seed, repeat):
+    from pathfinding import PathFinding
+    scene = Scene(game, map_name, npcs, seed)
+    get_path = PathFinding.get_path.__wrapped__  # skip the lru_cache: time the search itself
+    results = []
+    for pose in range(POSES):
+        scene.set_pose(pose)
+        case = {'res': None, 'map': map_name, 'npcs': npcs, 'pose': pose}
+        npc_list = game.object_handler.npc_list
+        goal = game.player.map_pos
+
+        def paths():
+            for npc in npc_list:
+                get_path(game.pathfinding, npc.map_pos, goal)
+        results.append({'bench': 'get_path', **case, **measure(paths, repeat)})
+
+        for npc in npc_list:
+            npc.get_sprite()
+
+        def sight():
+            for npc in npc_list:
+                npc.ray_cast_player_npc()
+        results.append({'bench': 'ray_cast_player_npc', **case, **measure(sight, repeat)})
+    return results
+
+
+def worker(args):
+    width, height = map(int, args.worker.split('x'))
+    configure(width, height)
+    import main
+    game = main.Game(seed=args.seed)
+    results = []
+    for map_name in args.maps:
+        results += run_render_benches(game, (width, height), map_name, args.seed, args.repeat, args.workers)
+    if args.npc_benches:
+        for map_name in args.maps:
+            for npcs in args.npcs:
+                results += run_npc_benches(game, map_name, npcs, args.seed, args.repeat)
+    with open(args.worker_out, 'w') as f:
+        json.dump(results, f)
+
+
+def case_key(r):
+    return r['bench'], tuple(r['res']) if r['res'] else None, r['map'], r['npcs'], r['pose']
+
+
+def summarize(results):
+    # median over the camera poses, one line per bench/resolution/map/NPC count
+    groups = {}
+    for r in results:
+        groups.setdefault(case_key(r)[:4], []).append(r['median_us'])
+    return {k: sorted(v)[len(v) // 2] for k, v in groups.items()}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = summarize(json.load(f)['results'])
+    print(f'\ncompared with {baseline_path}:')
+    for key, us in summarize(results).items():
+        old = baseline.get(key)
+        if old:
+            bench, res, map_name, npcs = key
+            res = f'{res[0]}x{res[1]}' if res else '-'
+            print(f'  {bench:<22} {res:>9} map {map_name:<7} npcs {npcs:>3}  {old:>9.0f} -> {us:>9.0f} us ({old / us:.2f}x)')
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description='headless microbenchmarks for the raycaster hot paths')
+    parser.add_argument('--res', nargs='+', default=['800x450', '1280x720', '1600x900', '1920x1080'])
+    parser.add_argument('--maps', nargs='+', default=['default', '32', '64'], help="'default' or a square map size")
+    parser.add_argument('--npcs', nargs='+', type=int, default=[5, 20, 80])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help='JSON from an earlier run')
+    parser.add_argument('--workers', type=int, default=0, help='also time the wall pass split across this many processes')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-out', help=argparse.SUPPRESS)
+    parser.add_argument('--npc-benches', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(args)
+        return
+
+    # one process per resolution, since the settings are fixed once the game modules are imported
+    results = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for i, res in enumerate(args.res):
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            path = tmp.name
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', res, '--worker-out', path,
+               '--repeat', str(args.repeat), '--seed', str(args.seed), '--maps', *args.maps,
+               '--npcs', *map(str, args.npcs), '--workers', str(args.workers)]
+        if i == len(args.res) - 1:
+            cmd.append('--npc-benches')
+        subprocess.run(cmd, cwd=here, check=True, stdout=subprocess.DEVNULL)
+        with open(path) as f:
+            results += json.load(f)
+        os.remove(path)
+        print(f'{res} done')
+
+    for (bench, res, map_name, npcs), us in summarize(results).items():
+        res = f'{res[0]}x{res[1]}' if res else '-'
+        print(f'{bench:<22} {res:>9} map {map_name:<7} npcs {npcs:>3}  {us:>9.0f} us')
+
+    report = {'repeat': args.repeat, 'seed': args.seed, 'python': sys.version.split()[0], 'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nresults saved to {args.out}')
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,76 @@
+import pygame as pg
+
+
+class Layer:
+    # something drawn over the 3d view. key() changes whenever its picture does and is None while it is
+    # hidden; rect is a fixed box the layer always stays inside
+    def __init__(self, key, rect, draw):
+        self.key = key
+        self.rect = pg.Rect(rect)
+        self.draw = draw
+        self.shown = None
+        self.under = None
+
+
+class Compositor:
+    # a frame is the 3d view with the layers on top. when the view is drawn again, every layer is drawn over
+    # it and the whole window is presented. otherwise only the layers whose key changed are repaired, from a
+    # copy of the view kept under each of them, and display.update sends just those rects to the window
+    def __init__(self, screen, partial=True, max_partial=0.5):
+        self.screen = screen
+        # with vsync the flip is what paces the loop, so every frame is presented whole
+        self.partial = partial
+        self.max_area = screen.get_width() * screen.get_height() * max_partial
+        self.layers = []
+        self.dirty = []
+        self.stale = True
+        self.full = True
+
+    def set_layers(self, layers):
+        bounds = self.screen.get_rect()
+        for layer in layers:
+            layer.rect = layer.rect.clip(bounds)
+        self.layers = layers
+        self.invalidate()
+
+    def invalidate(self):
+        # something was drawn over the whole screen (damage, win, game over): present it all, and the
+        # view has to be drawn again next frame
+        self.stale = self.full = True
+
+    def compose(self, view_drawn):
+        if view_drawn or self.stale:
+            # the copies are all taken before any layer is drawn, so they only hold the view
+            for layer in self.layers:
+                layer.under = self.screen.subsurface(layer.rect).copy()
+            self.draw_layers(self.layers)
+            self.stale = False
+            self.full = True
+            return
+        rects = [layer.rect for layer in self.layers if layer.key() != layer.shown]
+        if not rects:
+            return
+        # layers overlapping a repaired one lose their pixels to the repair and are drawn again too
+        while True:
+            affected = [layer for layer in self.layers if layer.rect.collidelist(rects) != -1]
+            if len(affected) == len(rects):
+                break
+            rects = [layer.rect for layer in affected]
+        for layer in affected:
+            self.screen.blit(layer.under, layer.rect)
+        self.draw_layers(affected)
+        self.dirty += [layer.rect for layer in affected]
+
+    def draw_layers(self, layers):
+        for layer in layers:
+            layer.shown = layer.key()
+            if layer.shown is not None:
+                layer.draw()
+
+    def present(self):
+        if self.full or not self.partial or sum(r.w * r.h for r in self.dirty) > self.max_area:
+            pg.display.flip()
+        elif self.dirty:
+            pg.display.update(self.dirty)
+        self.full = False
+        self.dirty = []
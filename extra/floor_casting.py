@@ -0,0 +1,119 @@
+import numpy as np
+import pygame as pg
+from settings import *
+
+TEXTURE_MASK = TEXTURE_SIZE - 1  # TEXTURE_SIZE is a power of two, so wrapping is a bitwise and
+
+
+def shade(surface, amount):
+    pixels = pg.surfarray.array3d(surface).astype(np.float32) * amount
+    return pg.surfarray.make_surface(pixels.astype(np.uint8))
+
+
+class FloorCaster:
+    # the floor is cast at ray resolution from two small tables, the distance of each screen row (per
+    # resolution) and the direction of each ray (per view angle), then stretched to the column width.
+    # a frame costs a handful of array passes, and nothing at all while the player stands still.
+    # the ceiling, when there is one, mirrors the floor rows, so it only adds a texture lookup
+    def __init__(self, floor_texture, ceiling_texture=None):
+        self.textures = [floor_texture, ceiling_texture]
+        self.has_ceiling = ceiling_texture is not None
+        self.packed = None
+        self.packed_for = None
+        self.rows_for = None
+        self.columns_for = None
+        self.pose = None
+        self.surfaces = {}
+
+    def pack(self, surface):
+        # texels in the target's pixel format, indexed by x * TEXTURE_SIZE + y; built from the channel
+        # shifts rather than convert(), which needs a display the parallel workers do not have
+        masks = surface.get_masks()
+        if self.packed_for != masks:
+            r, g, b = surface.get_shifts()[:3]
+            self.packed = []
+            for texture in self.textures:
+                if texture is None:
+                    self.packed.append(None)
+                    continue
+                rgb = pg.surfarray.array3d(texture).astype(np.uint32)
+                self.packed.append(np.ascontiguousarray(rgb[..., 0] << r | rgb[..., 1] << g | rgb[..., 2] << b).ravel())
+            self.packed_for = masks
+        return self.packed
+
+    def row_distances(self):
+        # a wall at depth d spans SCREEN_DIST / d rows around the horizon, so floor row p is at
+        # depth SCREEN_DIST / 2p
+        if self.rows_for != view.RES:
+            rows = np.arange(view.HALF_HEIGHT, dtype=np.float32) + 0.5
+            self.rows = (0.5 * view.SCREEN_DIST / rows)[:, None]
+            self.rows_for = view.RES
+        return self.rows
+
+    def ray_directions(self, angle, first, last):
+        # the same ray angles as cast_rays, undoing its fishbowl correction, scaled to texels
+        key = angle, first, last, view.RES
+        if self.columns_for != key:
+            ray_angle = angle - HALF_FOV + 0.0001 + np.arange(first, last) * view.DELTA_ANGLE
+            stretch = TEXTURE_SIZE / np.cos(ray_angle - angle)
+            self.dir_x = (np.cos(ray_angle) * stretch).astype(np.float32)[None, :]
+            self.dir_y = (np.sin(ray_angle) * stretch).astype(np.float32)[None, :]
+            self.columns_for = key
+        return self.dir_x, self.dir_y
+
+    def strip_surfaces(self, surface, rays):
+        key = rays, view.RES, surface.get_masks()
+        if key not in self.surfaces:
+            self.surfaces.clear()
+            size = rays * view.SCALE, view.HALF_HEIGHT
+            self.surfaces[key] = (pg.Surface((rays, view.HALF_HEIGHT), 0, surface),
+                                  [pg.Surface(size, 0, surface) for _ in self.textures])
+        return self.surfaces[key]
+
+    def cast(self, surface, ox, oy, angle, first, last):
+        rays = last - first
+        packed = self.pack(surface)
+        rows = self.row_distances()
+        dir_x, dir_y = self.ray_directions(angle, first, last)
+        small, strips = self.strip_surfaces(surface, rays)
+
+        # (row, ray) arrays: row major like the surfaces, which makes blit_array a straight copy
+        u = np.multiply(rows, dir_x)
+        u += ox * TEXTURE_SIZE
+        texel = u.astype(np.int32)
+        texel &= TEXTURE_MASK
+        texel *= TEXTURE_SIZE
+        np.multiply(rows, dir_y, out=u)
+        u += oy * TEXTURE_SIZE
+        v = u.astype(np.int32)
+        v &= TEXTURE_MASK
+        texel += v
+
+        for i, (texels, strip) in enumerate(zip(packed, strips)):
+            if texels is None:
+                continue
+            pixels = np.take(texels, texel)
+            # the ceiling row at the same distance as floor row p is HALF_HEIGHT - 1 - p
+            pg.surfarray.blit_array(small, (pixels if i == 0 else pixels[::-1]).T)
+            pg.transform.scale(small, strip.get_size(), strip)
+        return strips
+
+    def draw(self, surface, ox, oy, angle, first=0, last=None, x=0):
+        # draws the rays [first, last) with the first one at column x of the surface
+        last = view.NUM_RAYS if last is None else last
+        pose = ox, oy, angle, first, last, view.RES, surface.get_masks()
+        if self.pose != pose:
+            self.strips = self.cast(surface, ox, oy, angle, first, last)
+            self.pose = pose
+        floor, ceiling = self.strips
+        surface.blit(floor, (x, view.HALF_HEIGHT))
+        if self.has_ceiling:
+            surface.blit(ceiling, (x, 0))
+
+
+def load_floor_caster(get_texture):
+    if not FLOOR_TEXTURE:
+        return None
+    floor = shade(get_texture(FLOOR_TEXTURE), FLOOR_SHADE)
+    ceiling = shade(get_texture(CEILING_TEXTURE), FLOOR_SHADE) if CEILING_TEXTURE else None
+    return FloorCaster(floor, ceiling)
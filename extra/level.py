@@ -0,0 +1,145 @@
+import mmap
+import struct
+import argparse
+import numpy as np
+
+MAGIC = b'LVL1'
+# magic, width, height, chunk size, reserved, player start x, y
+HEADER = struct.Struct('<4sIIHHff')
+CHUNK_SIZE = 32
+
+
+class Level:
+    # tiles are stored chunk by chunk, CHUNK_SIZE x CHUNK_SIZE bytes each, one byte per tile (0 is empty).
+    # the file is memory mapped, so opening it reads only the header and a chunk is paged in when first read
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.height, self.chunk, _, x, y = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a level file')
+        self.start = x, y
+        self.chunks_x = -(-self.width // self.chunk)
+        self.chunks_y = -(-self.height // self.chunk)
+
+    def chunk_offset(self, cx, cy):
+        return HEADER.size + (cy * self.chunks_x + cx) * self.chunk * self.chunk
+
+    def chunk_bytes(self, cx, cy):
+        start = self.chunk_offset(cx, cy)
+        return self.data[start:start + self.chunk * self.chunk]
+
+    def tile(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0
+        cx, ix = divmod(x, self.chunk)
+        cy, iy = divmod(y, self.chunk)
+        return self.data[self.chunk_offset(cx, cy) + iy * self.chunk + ix]
+
+    def close(self):
+        self.data.close()
+
+
+class LevelRegion:
+    # keeps world_map, the wall dict the rest of the game reads, filled for the chunks around a position only,
+    # so memory follows the region in play rather than the size of the level. the dict is replaced, never
+    # changed, when chunks come and go, so a frame still being cast from the old one is left alone
+    def __init__(self, level, radius=1):
+        self.level = level
+        self.world_map = {}
+        self.radius = radius
+        self.loaded = {}
+        self.center = None
+
+    def update(self, x, y):
+        # returns the chunks loaded and dropped; chunks are kept one ring further than they are loaded,
+        # so walking along a chunk border does not load and drop the same chunks over and over
+        center = cx, cy = int(x) // self.level.chunk, int(y) // self.level.chunk
+        if center == self.center:
+            return [], []
+        self.center = center
+        r = self.radius
+        dropped = [chunk for chunk in self.loaded if max(abs(chunk[0] - cx), abs(chunk[1] - cy)) > r + 1]
+        added = [(i, j) for j in range(max(0, cy - r), min(self.level.chunks_y, cy + r + 1))
+                 for i in range(max(0, cx - r), min(self.level.chunks_x, cx + r + 1)) if (i, j) not in self.loaded]
+        if not (added or dropped):
+            return added, dropped
+        self.world_map = dict(self.world_map)
+        for chunk in dropped:
+            for cell in self.loaded.pop(chunk):
+                del self.world_map[cell]
+        for chunk in added:
+            self.load(chunk)
+        return added, dropped
+
+    def load(self, chunk):
+        size = self.level.chunk
+        x0, y0 = chunk[0] * size, chunk[1] * size
+        data = self.level.chunk_bytes(*chunk)
+        walls = []
+        for j in range(size):
+            row = data[j * size:(j + 1) * size]
+            if not any(row):
+                continue
+            for i, value in enumerate(row):
+                if value:
+                    cell = x0 + i, y0 + j
+                    self.world_map[cell] = value
+                    walls.append(cell)
+        self.loaded[chunk] = walls
+
+    def is_loaded(self, x, y):
+        return (x // self.level.chunk, y // self.level.chunk) in self.loaded
+
+    def chunk_cells(self, chunk):
+        size = self.level.chunk
+        return [(x, y) for y in range(chunk[1] * size, min(self.level.height, (chunk[1] + 1) * size))
+                for x in range(chunk[0] * size, min(self.level.width, (chunk[0] + 1) * size))]
+
+
+def save_level(path, tiles, start, chunk=CHUNK_SIZE):
+    tiles = np.asarray(tiles, dtype=np.uint8)
+    height, width = tiles.shape
+    padded = np.zeros((-(-height // chunk) * chunk, -(-width // chunk) * chunk), np.uint8)
+    padded[:height, :width] = tiles
+    # rows of chunks, then chunks, then the rows of each chunk
+    chunks = padded.reshape(padded.shape[0] // chunk, chunk, padded.shape[1] // chunk, chunk).swapaxes(1, 2)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, width, height, chunk, 0, *start))
+        f.write(np.ascontiguousarray(chunks).tobytes())
+
+
+def random_tiles(size, density, seed):
+    # bordered square map with random pillars and a clear area around the start
+    rng = np.random.default_rng(seed)
+    tiles = np.where(rng.random((size, size)) < density, rng.integers(1, 6, (size, size)), 0).astype(np.uint8)
+    tiles[0, :] = tiles[-1, :] = tiles[:, 0] = tiles[:, -1] = 1
+    tiles[1:4, 1:4] = 0
+    return tiles
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='build .lvl files for the --level option')
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help='write the mini_map list from map.py as a level file')
+    convert.add_argument('out')
+    generate = commands.add_parser('random', help='write a random square level, for testing large maps')
+    generate.add_argument('out')
+    generate.add_argument('--size', type=int, default=4096)
+    generate.add_argument('--density', type=float, default=0.12)
+    generate.add_argument('--seed', type=int, default=1)
+    info = commands.add_parser('info')
+    info.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        from settings import PLAYER_POS
+        from map import mini_map
+        save_level(args.out, [[int(value) for value in row] for row in mini_map], PLAYER_POS)
+    elif args.command == 'random':
+        save_level(args.out, random_tiles(args.size, args.density, args.seed), (1.5, 1.5))
+    else:
+        level = Level(args.path)
+        print(f'{level.width}x{level.height} tiles, {level.chunks_x}x{level.chunks_y} chunks of {level.chunk}, '
+              f'start {level.start}')
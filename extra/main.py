@@ -1,5 +1,14 @@
 import pygame as pg
 import sys
+import os
+import json
+import hashlib
+import argparse
+
+# replay.py and pacing.py are shared with the game in the folder above; appended rather than inserted,
+# so where the two folders use the same module name (main, bench, profiler) the one in this folder wins
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from settings import *
 from map import *
 from player import *
@@ -10,65 +19,281 @@ from object_handler import *
 from weapon import *
 from sound import *
 from pathfinding import *
+from replay import Recorder, Replay
+from profiler import FrameProfiler
+from render_scale import ResolutionController
+from parallel_raycasting import ParallelRayCasting
+from level import Level
+from pacing import FramePacer
+from compositor import Compositor, Layer
+from pipeline import FrameSnapshot, Pipeline
+from random import seed as seed_random, getrandbits
+
+MOVE_KEYS = (pg.K_w, pg.K_a, pg.K_s, pg.K_d)
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, record=None, replay=None, seed=None, out=None, profile=None, scale=1.0, target_ms=None,
+                 workers=0, level=None, fps=FPS, vsync=False, idle_fps=IDLE_FPS, pipeline=False):
         pg.init()
         pg.mouse.set_visible(False)
-        self.screen = pg.display.set_mode(RES)
+        self.screen = self.open_window(vsync and not replay)
         pg.event.set_grab(True)
-        self.clock = pg.time.Clock()
         self.delta_time = 1
         self.global_trigger = False
         self.global_event = pg.USEREVENT + 0
         pg.time.set_timer(self.global_event, 40)
+        # replays run as fast as they can; the 40 ms timer alone does not end an idle wait
+        mode = 'vsync' if self.vsync else 'target'
+        self.pacer = FramePacer(0 if replay else fps, mode, idle_fps, quiet_events=[self.global_event])
+        self.compositor = Compositor(self.screen, partial=not self.vsync)
+
+        # input is read once per frame, from the devices or from a recording
+        self.replay = Replay(replay) if replay else None
+        self.replay_frames = iter(self.replay) if self.replay else None
+        self.replay_out = out
+        if self.replay:
+            seed = self.replay.seed
+        elif seed is None:
+            seed = getrandbits(31)
+        seed_random(seed)
+        self.ticks = self.replay.header['ticks'] if self.replay else pg.time.get_ticks()
+        # recordings and replays keep a fixed render scale: sprite widths decide hits, so it must not drift
+        if self.replay:
+            scale = self.replay.header.get('scale', 1.0)
+        view.set_scale(scale)
+        self.resolution = ResolutionController(self, target_ms) if target_ms and not (record or replay) else None
+        if self.replay:
+            level = self.replay.header.get('level')
+        self.level = Level(level) if level else None
+        self.recorder = Recorder(record, seed, 'extra', ticks=self.ticks, scale=view.scale, level=level) if record else None
+        self.keys = dict.fromkeys(MOVE_KEYS, False)
+        self.mouse_rel = 0
+
+        # F3 toggles the profiler overlay; --profile starts it on and writes a trace on exit
+        self.profiler = FrameProfiler(trace_path=profile)
+        self.profiler.watch(Player, 'update', 'player.update')
+        self.profiler.watch(RayCasting, 'ray_cast', 'raycasting.ray_cast')
+        self.profiler.watch(RayCasting, 'get_objects_to_render', 'raycasting.get_objects_to_render')
+        self.profiler.watch(ObjectHandler, 'update_sprites', 'object_handler.sprites')
+        self.profiler.watch(ObjectHandler, 'update_npcs', 'object_handler.npcs')
+        self.profiler.watch(ObjectRenderer, 'draw', 'object_renderer.draw')
+        self.profiler.watch(Weapon, 'draw', 'weapon.draw')
+        self.profiler.watch(Compositor, 'present', 'compositor.present')
+        if profile:
+            self.profiler.enable()
+        self.parallel_raycasting = None
+        self.pipeline = None
+        self.round_over = None
+        self.sound = None
         self.new_game()
+        if workers:
+            self.parallel_raycasting = ParallelRayCasting(self, workers)
+        if pipeline:
+            self.pipeline = Pipeline(self)
+
+    def open_window(self, vsync):
+        # vsync needs a renderer behind the window, hence SCALED; without driver support it is dropped
+        self.vsync = False
+        if vsync:
+            try:
+                screen = pg.display.set_mode(RES, pg.SCALED, vsync=1)
+                self.vsync = True
+                return screen
+            except pg.error:
+                pass
+        return pg.display.set_mode(RES)
 
     def new_game(self):
-        self.map = Map(self)
+        # the first game loads the textures and sounds and builds the map and its path graph; after a death
+        # or a win those are kept and only the player, the NPCs and the weapon are made again, in the same
+        # order, so the spawns draw the same random numbers as before
+        warm = self.sound is not None
+        if warm:
+            self.map.reset()
+        else:
+            self.map = Map(self)
         self.player = Player(self)
-        self.object_renderer = ObjectRenderer(self)
+        if warm:
+            self.object_renderer.reset()
+        else:
+            self.object_renderer = ObjectRenderer(self)
         self.raycasting = RayCasting(self)
         self.object_handler = ObjectHandler(self)
         self.weapon = Weapon(self)
-        self.sound = Sound(self)
-        self.pathfinding = PathFinding(self)
+        if warm:
+            self.pathfinding.reset()
+        else:
+            self.sound = Sound(self)
+            self.pathfinding = PathFinding(self)
+        self.frame = FrameSnapshot(self)
+        # drawn in this order over the 3d view
+        self.compositor.set_layers([
+            Layer(lambda: self.frame.health, self.object_renderer.health_rect, self.object_renderer.draw_player_health),
+            Layer(lambda: self.frame.weapon_image, self.weapon.rect, self.weapon.draw),
+            Layer(lambda: self.profiler.frame_count if self.profiler.enabled else None,
+                  self.profiler.overlay_rect(self.screen), lambda: self.profiler.draw(self.screen)),
+        ])
         pg.mixer.music.play(-1)
 
     def update(self):
+        # the render scale only changes between frames, never between casting and drawing
+        if self.resolution:
+            self.resolution.update()
         self.player.update()
-        self.raycasting.update()
+        self.map.update()
+        # the walls only need the pose, so the workers cast them while the NPCs think
+        self.raycasting.update(FrameSnapshot(self))
         self.object_handler.update()
         self.weapon.update()
-        pg.display.flip()
-        self.delta_time = self.clock.tick(FPS)
-        pg.display.set_caption(f'{self.clock.get_fps() :.1f}')
+        self.finish_round()
+        self.frame = FrameSnapshot(self)
+        self.compositor.present()
+        self.tick()
+
+    def simulate(self):
+        # one step of the game logic, on the simulation thread of the pipelined loop
+        self.player.update()
+        self.map.update()
+        self.object_handler.update()
+        self.weapon.update()
+        return FrameSnapshot(self)
+
+    def tick(self):
+        self.delta_time = self.pacer.tick(idle=not self.replay and not pg.display.get_active())
+        pace = self.pacer.stats()
+        jitter = f'  ±{pace["jitter_ms"]:.1f} ms' if pace else ''
+        pg.display.set_caption(f'{self.pacer.get_fps() :.1f}{jitter}  {view.scale:.2f}x')
 
     def draw(self):
         # self.screen.fill('black')
-        self.object_renderer.draw()
-        self.weapon.draw()
+        self.compositor.compose(self.object_renderer.draw())
+        if self.frame.damaged:
+            self.object_renderer.show_damage()
         # self.map.draw()
         # self.player.draw()
 
+    def end_round(self, show):
+        # game over or win: the picture stays up for a moment, then a new game starts. both loops restart
+        # once the simulation step that ended the round is done, so the NPCs still to update in that step
+        # draw their random numbers before the new spawns do, and a replay plays the same either way
+        self.round_over = show
+
+    def finish_round(self):
+        if self.round_over:
+            show, self.round_over = self.round_over, None
+            self.restart(show)
+
+    def restart(self, show):
+        show()
+        pg.display.flip()
+        self.delay(1500)
+        self.new_game()
+
+    def delay(self, ms):
+        # replays skip the pause on the game over / win screens; wait sleeps where delay would spin
+        if not self.replay:
+            pg.time.wait(ms)
+
     def check_events(self):
         self.global_trigger = False
-        for event in pg.event.get():
+        if self.replay:
+            self.replay_input()
+            return
+        fire = False
+        for event in self.pacer.events():
             if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
-                pg.quit()
-                sys.exit()
+                self.quit()
+            elif event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.profiler.toggle()
             elif event.type == self.global_event:
                 self.global_trigger = True
+            elif event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
+                fire = True
             self.player.single_fire_event(event)
 
+        self.ticks = pg.time.get_ticks()
+        pressed = pg.key.get_pressed()
+        self.keys = {key: pressed[key] for key in MOVE_KEYS}
+        mx, my = pg.mouse.get_pos()
+        if mx < MOUSE_BORDER_LEFT or mx > MOUSE_BORDER_RIGHT:
+            pg.mouse.set_pos([HALF_WIDTH, HALF_HEIGHT])
+        self.mouse_rel = pg.mouse.get_rel()[0]
+        if self.recorder:
+            self.recorder.frame([self.delta_time, self.ticks, self.global_trigger,
+                                 [key for key in MOVE_KEYS if self.keys[key]], self.mouse_rel, fire])
+
+    def replay_input(self):
+        pg.event.pump()
+        frame = next(self.replay_frames, None)
+        if frame is None:
+            self.quit()
+        self.delta_time, self.ticks, self.global_trigger, keys, self.mouse_rel, fire = frame
+        self.keys = {key: key in keys for key in MOVE_KEYS}
+        if fire:
+            self.player.single_fire_event(pg.event.Event(pg.MOUSEBUTTONDOWN, button=1))
+
+    def state_digest(self):
+        player = self.player
+        state = (player.x, player.y, player.angle, player.health,
+                 [(npc.x, npc.y, npc.health, npc.alive) for npc in self.object_handler.npc_list])
+        return hashlib.sha1(repr(state).encode()).hexdigest()
+
+    def quit(self):
+        if self.recorder:
+            self.recorder.close(self.state_digest())
+        self.profiler.export()
+        if self.parallel_raycasting:
+            self.parallel_raycasting.close()
+        if self.pipeline:
+            self.pipeline.close()
+        match = None
+        if self.replay:
+            report = self.replay.report(self.state_digest())
+            match = report['match']
+            print(f"{report['frames']} frames in {report['elapsed_s']:.2f}s ({report['fps']:.1f} fps)  "
+                  f"p50 {report['p50_ms']:.2f}  p95 {report['p95_ms']:.2f}  p99 {report['p99_ms']:.2f} ms")
+            print({True: 'final state matches the recording', False: 'final state DIFFERS from the recording',
+                   None: 'recording has no final state digest'}[match])
+            if self.replay_out:
+                with open(self.replay_out, 'w') as f:
+                    json.dump(report, f, indent=2)
+        pg.quit()
+        sys.exit(1 if match is False else 0)
+
     def run(self):
+        while self.pipeline:
+            self.pipeline.step()
+            self.profiler.end_frame()
         while True:
             self.check_events()
             self.update()
             self.draw()
+            self.profiler.end_frame()
 
 
 if __name__ == '__main__':
-    game = Game()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', metavar='FILE', help='record the seed and per-frame input')
+    parser.add_argument('--replay', metavar='FILE', help='replay a recording headlessly and report frame times')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--out', help='with --replay, write the report as JSON')
+    parser.add_argument('--profile', metavar='FILE', help='profile from the start and write a JSON trace on exit')
+    parser.add_argument('--scale', type=float, default=1.0, help='render the 3d view at this fraction of the window size')
+    parser.add_argument('--target-ms', type=float, help='adjust the render scale to hold this frame time')
+    parser.add_argument('--level', metavar='FILE', help='play a .lvl file (see level.py) instead of the built-in map')
+    parser.add_argument('--fps', type=int, default=FPS, help='frame rate cap, 0 for none')
+    parser.add_argument('--vsync', action='store_true', help='wait for the monitor refresh instead of --fps')
+    parser.add_argument('--idle-fps', type=int, default=IDLE_FPS, help='frame rate while the window is minimized')
+    parser.add_argument('--workers', type=int, nargs='?', const=os.cpu_count(), default=0,
+                        help='ray cast and texture the walls in this many processes (default: one per core)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='simulate the next frame on a second thread while this one is drawn')
+    args = parser.parse_args()
+    if args.replay:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    game = Game(record=args.record, replay=args.replay, seed=args.seed, out=args.out, profile=args.profile,
+                scale=args.scale, target_ms=args.target_ms, workers=args.workers, level=args.level,
+                fps=args.fps, vsync=args.vsync, idle_fps=args.idle_fps, pipeline=args.pipeline)
     game.run()
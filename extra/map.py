@@ -1,4 +1,6 @@
 import pygame as pg
+from settings import *
+from level import LevelRegion
 
 _ = False
 mini_map = [
@@ -40,11 +42,49 @@ mini_map = [
 class Map:
     def __init__(self, game):
         self.game = game
-        self.mini_map = mini_map
+        self.level = game.level
         self.world_map = {}
-        self.rows = len(self.mini_map)
-        self.cols = len(self.mini_map[0])
-        self.get_map()
+        if self.level:
+            # a level file is streamed: only the chunks around the player are in world_map
+            self.mini_map = None
+            self.rows, self.cols = self.level.height, self.level.width
+            self.start = self.level.start
+            self.region = None
+            self.reset()
+            # NPCs spawn in the chunks loaded around the start, where they can find a path to the player
+            size = self.level.chunk
+            xs, ys = [i for i, _ in self.region.loaded], [j for _, j in self.region.loaded]
+            self.spawn_area = (min(xs) * size, min(ys) * size,
+                               min(self.cols, (max(xs) + 1) * size), min(self.rows, (max(ys) + 1) * size))
+        else:
+            self.mini_map = mini_map
+            self.rows = len(self.mini_map)
+            self.cols = len(self.mini_map[0])
+            self.start = PLAYER_POS
+            self.region = None
+            self.spawn_area = 0, 0, self.cols, self.rows
+            self.get_map()
+
+    def reset(self):
+        # a new game: the built-in map never changes, a streamed level goes back to the chunks around the start
+        if self.level:
+            self.region = LevelRegion(self.level)
+            self.region.update(*self.start)
+            self.world_map = self.region.world_map
+
+    def update(self):
+        if self.region:
+            added, dropped = self.region.update(self.game.player.x, self.game.player.y)
+            if added or dropped:
+                # a new dict: the one the main thread may be casting the last frame against stays as it was
+                self.world_map = self.region.world_map
+                self.game.pathfinding.update_chunks(added, dropped)
+
+    def is_wall(self, x, y):
+        # also answers for chunks that are not loaded
+        if self.region:
+            return bool(self.level.tile(x, y))
+        return (x, y) in self.world_map
 
     def get_map(self):
         for j, row in enumerate(self.mini_map):
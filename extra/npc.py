@@ -31,7 +31,8 @@ class NPC(AnimatedSprite):
         # self.draw_ray_cast()
 
     def check_wall(self, x, y):
-        return (x, y) not in self.game.map.world_map
+        # is_wall also knows the walls of chunks that are not loaded
+        return not self.game.map.is_wall(x, y)
 
     def check_wall_collision(self, dx, dy):
         if self.check_wall(int(self.x + dx * self.size), int(self.y)):
@@ -70,7 +71,7 @@ class NPC(AnimatedSprite):
 
     def check_hit_in_npc(self):
         if self.ray_cast_value and self.game.player.shot:
-            if HALF_WIDTH - self.sprite_half_width < self.screen_x < HALF_WIDTH + self.sprite_half_width:
+            if view.HALF_WIDTH - self.sprite_half_width < self.screen_x < view.HALF_WIDTH + self.sprite_half_width:
                 self.game.sound.npc_pain.play()
                 self.game.player.shot = False
                 self.pain = True
@@ -119,13 +120,15 @@ class NPC(AnimatedSprite):
 
         wall_dist_v, wall_dist_h = 0, 0
         player_dist_v, player_dist_h = 0, 0
+        is_wall = self.game.map.is_wall
 
         ox, oy = self.game.player.pos
         x_map, y_map = self.game.player.map_pos
 
         ray_angle = self.theta
 
-        sin_a = math.sin(ray_angle)
+        # an NPC straight to the right of the player, on the same row, would divide by zero below
+        sin_a = math.sin(ray_angle) or 1e-6
         cos_a = math.cos(ray_angle)
 
         # horizontals
@@ -142,7 +145,7 @@ class NPC(AnimatedSprite):
             if tile_hor == self.map_pos:
                 player_dist_h = depth_hor
                 break
-            if tile_hor in self.game.map.world_map:
+            if is_wall(*tile_hor):
                 wall_dist_h = depth_hor
                 break
             x_hor += dx
@@ -163,7 +166,7 @@ class NPC(AnimatedSprite):
             if tile_vert == self.map_pos:
                 player_dist_v = depth_vert
                 break
-            if tile_vert in self.game.map.world_map:
+            if is_wall(*tile_vert):
                 wall_dist_v = depth_vert
                 break
             x_vert += dx
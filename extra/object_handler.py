@@ -14,12 +14,16 @@ class ObjectHandler:
         add_sprite = self.add_sprite
         add_npc = self.add_npc
         self.npc_positions = {}
+        # the projected sprites of the last update; a new list every frame, the renderer may still hold the old one
+        self.sprites_to_render = []
 
         # spawn npc
         self.enemies = 20  # npc count
         self.npc_types = [SoldierNPC, CacoDemonNPC, CyberDemonNPC]
         self.weights = [70, 20, 10]
-        self.restricted_area = {(i, j) for i in range(10) for j in range(10)}
+        # no spawns in the corner of the built-in map where the player starts, or around the start of a level
+        x0, y0 = (int(game.map.start[0]) - 5, int(game.map.start[1]) - 5) if game.level else (0, 0)
+        self.restricted_area = {(x0 + i, y0 + j) for i in range(10) for j in range(10)}
         self.spawn_npc()
 
         # sprite map
@@ -57,25 +61,30 @@ class ObjectHandler:
         # add_npc(CyberDemonNPC(game, pos=(14.5, 25.5)))
 
     def spawn_npc(self):
+        x0, y0, x1, y1 = self.game.map.spawn_area
         for i in range(self.enemies):
                 npc = choices(self.npc_types, self.weights)[0]
-                pos = x, y = randrange(self.game.map.cols), randrange(self.game.map.rows)
-                while (pos in self.game.map.world_map) or (pos in self.restricted_area):
-                    pos = x, y = randrange(self.game.map.cols), randrange(self.game.map.rows)
+                pos = x, y = randrange(x0, x1), randrange(y0, y1)
+                while self.game.map.is_wall(x, y) or (pos in self.restricted_area):
+                    pos = x, y = randrange(x0, x1), randrange(y0, y1)
                 self.add_npc(npc(self.game, pos=(x + 0.5, y + 0.5)))
 
     def check_win(self):
         if not len(self.npc_positions):
-            self.game.object_renderer.win()
-            pg.display.flip()
-            pg.time.delay(1500)
-            self.game.new_game()
+            self.game.end_round(self.game.object_renderer.win)
 
     def update(self):
+        self.sprites_to_render = []
         self.npc_positions = {npc.map_pos for npc in self.npc_list if npc.alive}
+        self.update_sprites()
+        self.update_npcs()
+        self.check_win()
+
+    def update_sprites(self):
         [sprite.update() for sprite in self.sprite_list]
+
+    def update_npcs(self):
         [npc.update() for npc in self.npc_list]
-        self.check_win()
 
     def add_npc(self, npc):
         self.npc_list.append(npc)
@@ -1,5 +1,7 @@
 import pygame as pg
 from settings import *
+from floor_casting import load_floor_caster
+from raycasting import mip_pyramid
 
 
 class ObjectRenderer:
@@ -9,45 +11,111 @@ class ObjectRenderer:
         self.wall_textures = self.load_wall_textures()
         self.sky_image = self.get_texture('resources/textures/sky.png', (WIDTH, HALF_HEIGHT))
         self.sky_offset = 0
+        self.view_sky = self.sky_image
+        self.floor = load_floor_caster(self.get_texture)
+        self.view_surface = self.screen
         self.blood_screen = self.get_texture('resources/textures/blood_screen.png', RES)
         self.digit_size = 90
         self.digit_images = [self.get_texture(f'resources/textures/digits/{i}.png', [self.digit_size] * 2)
                              for i in range(11)]
         self.digits = dict(zip(map(str, range(11)), self.digit_images))
+        # room for '100%'; the counter is put together again only when the health changes
+        self.health_rect = pg.Rect(0, 0, 4 * self.digit_size, self.digit_size)
+        self.health_image = pg.Surface(self.health_rect.size, pg.SRCALPHA)
+        self.health_shown = None
+        self.view_key = None
+        self.damage_pending = False
         self.game_over_image = self.get_texture('resources/textures/game_over.png', RES)
         self.win_image = self.get_texture('resources/textures/win.png', RES)
 
+    def reset(self):
+        # a new game keeps every texture; the sky starts over from where a fresh renderer would have it
+        self.sky_offset = 0
+        self.view_key = None
+        self.damage_pending = False
+
     def draw(self):
-        self.draw_background()
-        self.render_game_objects()
-        self.draw_player_health()
+        # returns whether the 3d view was drawn; it is kept when neither the walls nor any sprite changed
+        self.update_view_surface()
+        raycasting, frame = self.game.raycasting, self.game.frame
+        raycasting.add_sprites(frame.sprites)
+        view_key = raycasting.pose, frame.sprites
+        if view_key == self.view_key and not self.game.compositor.stale:
+            return False
+        self.view_key = view_key
+        parallel = self.game.parallel_raycasting
+        if parallel:
+            parallel.finish(self.view_surface)
+            parallel.render_sprites(self.view_surface, self.game.raycasting.objects_to_render)
+        else:
+            self.draw_background()
+            self.render_game_objects()
+        self.present_view()
+        return True
+
+    def update_view_surface(self):
+        # the 3d view goes to an internal surface when the render scale is below 1, the HUD stays at full res
+        if self.view_surface.get_size() == view.RES:
+            return
+        self.view_surface = self.screen if view.RES == RES else pg.Surface(view.RES).convert()
+        self.view_sky = pg.transform.scale(self.sky_image, (view.WIDTH, view.HALF_HEIGHT))
+
+    def present_view(self):
+        if self.view_surface is not self.screen:
+            pg.transform.scale(self.view_surface, RES, self.screen)
 
     def win(self):
         self.screen.blit(self.win_image, (0, 0))
+        self.game.compositor.invalidate()
 
     def game_over(self):
         self.screen.blit(self.game_over_image, (0, 0))
+        self.game.compositor.invalidate()
 
     def draw_player_health(self):
-        health = str(self.game.player.health)
-        for i, char in enumerate(health):
-            self.screen.blit(self.digits[char], (i * self.digit_size, 0))
-        self.screen.blit(self.digits['10'], ((i + 1) * self.digit_size, 0))
+        if self.health_shown != self.game.frame.health:
+            self.health_shown = self.game.frame.health
+            self.health_image.fill((0, 0, 0, 0))
+            # max over the cleared image copies the digits as they are; a plain blit would blend their
+            # edges twice, once here and once onto the screen
+            health = str(self.health_shown)
+            for i, char in enumerate(health):
+                self.health_image.blit(self.digits[char], (i * self.digit_size, 0), special_flags=pg.BLEND_RGBA_MAX)
+            self.health_image.blit(self.digits['10'], ((i + 1) * self.digit_size, 0), special_flags=pg.BLEND_RGBA_MAX)
+        self.screen.blit(self.health_image, self.health_rect)
 
     def player_damage(self):
+        # the simulation thread of the pipelined loop leaves the screen alone: the frame it hands over
+        # carries the hit and the flash is drawn over that frame instead
+        if self.game.pipeline:
+            self.damage_pending = True
+        else:
+            self.show_damage()
+
+    def show_damage(self):
         self.screen.blit(self.blood_screen, (0, 0))
+        self.game.compositor.invalidate()
+
+    def scroll_sky(self, rel):
+        self.sky_offset = (self.sky_offset + 4.5 * rel) % WIDTH
 
     def draw_background(self):
-        self.sky_offset = (self.sky_offset + 4.5 * self.game.player.rel) % WIDTH
-        self.screen.blit(self.sky_image, (-self.sky_offset, 0))
-        self.screen.blit(self.sky_image, (-self.sky_offset + WIDTH, 0))
+        frame = self.game.frame
+        self.scroll_sky(frame.rel)
+        offset = int(self.sky_offset * view.WIDTH / WIDTH)
+        if not (self.floor and self.floor.has_ceiling):
+            self.view_surface.blit(self.view_sky, (-offset, 0))
+            self.view_surface.blit(self.view_sky, (-offset + view.WIDTH, 0))
         # floor
-        pg.draw.rect(self.screen, FLOOR_COLOR, (0, HALF_HEIGHT, WIDTH, HEIGHT))
+        if self.floor:
+            self.floor.draw(self.view_surface, frame.x, frame.y, frame.angle)
+        else:
+            pg.draw.rect(self.view_surface, FLOOR_COLOR, (0, view.HALF_HEIGHT, view.WIDTH, view.HEIGHT))
 
     def render_game_objects(self):
         list_objects = sorted(self.game.raycasting.objects_to_render, key=lambda t: t[0], reverse=True)
         for depth, image, pos in list_objects:
-            self.screen.blit(image, pos)
+            self.view_surface.blit(image, pos)
 
     @staticmethod
     def get_texture(path, res=(TEXTURE_SIZE, TEXTURE_SIZE)):
@@ -55,10 +123,11 @@ class ObjectRenderer:
         return pg.transform.scale(texture, res)
 
     def load_wall_textures(self):
+        # each wall as a mip pyramid, full size first (see wall_column)
         return {
-            1: self.get_texture('resources/textures/1.png'),
-            2: self.get_texture('resources/textures/2.png'),
-            3: self.get_texture('resources/textures/3.png'),
-            4: self.get_texture('resources/textures/4.png'),
-            5: self.get_texture('resources/textures/5.png'),
+            1: mip_pyramid(self.get_texture('resources/textures/1.png')),
+            2: mip_pyramid(self.get_texture('resources/textures/2.png')),
+            3: mip_pyramid(self.get_texture('resources/textures/3.png')),
+            4: mip_pyramid(self.get_texture('resources/textures/4.png')),
+            5: mip_pyramid(self.get_texture('resources/textures/5.png')),
         }
\ No newline at end of file
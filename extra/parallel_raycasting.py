@@ -0,0 +1,158 @@
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import pygame as pg
+from settings import *
+from raycasting import cast_rays, wall_column, mip_pyramid
+from floor_casting import FloorCaster
+from level import Level, LevelRegion
+
+# opaque 32 bit, the cheapest format to blit to the window
+PIXEL_FORMAT = 'RGBX'
+
+_worker = {}
+
+
+def _init_worker(frame_name, depth_name, texture_name, texture_ids, sky_size, floor_textures, world_map, level_path):
+    # everything shared is opened once per process; textures and the map are only read
+    frame = shared_memory.SharedMemory(name=frame_name)
+    depth = shared_memory.SharedMemory(name=depth_name)
+    texture_block = shared_memory.SharedMemory(name=texture_name)
+    textures, start = {}, 0
+    for texture_id in texture_ids:
+        size = TEXTURE_SIZE * TEXTURE_SIZE * 4
+        # only the full size textures are shared; the smaller levels are filtered again here
+        textures[texture_id] = mip_pyramid(pg.image.frombuffer(texture_block.buf[start:start + size],
+                                                               (TEXTURE_SIZE, TEXTURE_SIZE), PIXEL_FORMAT))
+        start += size
+    sky = pg.image.frombuffer(texture_block.buf[start:start + sky_size[0] * sky_size[1] * 4], sky_size, PIXEL_FORMAT)
+    start += sky_size[0] * sky_size[1] * 4
+    planes = []
+    for _ in range(floor_textures):
+        size = TEXTURE_SIZE * TEXTURE_SIZE * 4
+        planes.append(pg.image.frombuffer(texture_block.buf[start:start + size], (TEXTURE_SIZE, TEXTURE_SIZE), PIXEL_FORMAT))
+        start += size
+    floor = FloorCaster(*planes) if planes else None
+    # a streamed level is mapped again here and each worker keeps the chunks around the player itself
+    region = LevelRegion(Level(level_path)) if level_path else None
+    _worker.update(frame=frame, depth=depth.buf.cast('d'), blocks=(depth, texture_block), textures=textures,
+                   sky=sky, view_sky=None, floor=floor, region=region, world_map=world_map, surface=None)
+
+
+def _frame_surface(w):
+    # the shared framebuffer seen at the current view size, rebuilt only when the render scale changes
+    if w.get('surface') is None or w['surface'].get_size() != view.RES:
+        w['surface'] = pg.image.frombuffer(w['frame'].buf[:view.WIDTH * view.HEIGHT * 4], view.RES, PIXEL_FORMAT)
+        w['view_sky'] = pg.transform.scale(w['sky'], (view.WIDTH, view.HALF_HEIGHT))
+    return w['surface']
+
+
+def _render_strip(task):
+    first, last, window, scale, ox, oy, angle, sky_offset = task
+    if view.window != window or view.scale != scale:
+        view.window = window
+        view.set_scale(scale)
+    w = _worker
+    world_map = w['world_map']
+    if w['region']:
+        w['region'].update(ox, oy)
+        world_map = w['region'].world_map
+    x0, x1 = first * view.SCALE, last * view.SCALE
+    strip = _frame_surface(w).subsurface((x0, 0, x1 - x0, view.HEIGHT))
+
+    floor = w['floor']
+    if not (floor and floor.has_ceiling):
+        strip.blit(w['view_sky'], (-sky_offset - x0, 0))
+        strip.blit(w['view_sky'], (-sky_offset + view.WIDTH - x0, 0))
+    if floor:
+        floor.draw(strip, ox, oy, angle, first, last)
+    else:
+        pg.draw.rect(strip, FLOOR_COLOR, (0, view.HALF_HEIGHT, x1 - x0, view.HEIGHT))
+
+    depth_buffer = w['depth']
+    for ray, (depth, proj_height, texture, offset) in enumerate(cast_rays(ox, oy, angle, world_map, first, last),
+                                                                 first):
+        image, (x, y) = wall_column(w['textures'], ray, proj_height, texture, offset)
+        strip.blit(image, (x - x0, y))
+        depth_buffer[ray] = depth
+
+
+class ParallelRayCasting:
+    # splits the screen columns into strips that a process pool ray casts and textures straight into a
+    # shared framebuffer, together with the sky and the floor; sprites are drawn on top by the main process,
+    # clipped against the per column wall depth
+    def __init__(self, game, workers=None):
+        self.game = game
+        self.workers = workers or os.cpu_count() or 1
+        # two strips per worker evens out strips full of near walls, which cost more to scale
+        self.strips = self.workers * 2
+        width, height = RES
+        self.frame = shared_memory.SharedMemory(create=True, size=width * height * 4)
+        self.depth_block = shared_memory.SharedMemory(create=True, size=(width // COLUMN_WIDTH) * 8)
+        self.depth = self.depth_block.buf.cast('d')
+
+        renderer = game.object_renderer
+        pixels = [pg.image.tobytes(levels[0], PIXEL_FORMAT) for levels in renderer.wall_textures.values()]
+        pixels.append(pg.image.tobytes(renderer.sky_image, PIXEL_FORMAT))
+        planes = [texture for texture in renderer.floor.textures if texture is not None] if renderer.floor else []
+        pixels += [pg.image.tobytes(texture, PIXEL_FORMAT) for texture in planes]
+        self.texture_block = shared_memory.SharedMemory(create=True, size=sum(map(len, pixels)))
+        start = 0
+        for data in pixels:
+            self.texture_block.buf[start:start + len(data)] = data
+            start += len(data)
+
+        # spawn rather than fork, so the workers do not inherit the SDL window and audio
+        self.pool = mp.get_context('spawn').Pool(
+            self.workers, initializer=_init_worker,
+            initargs=(self.frame.name, self.depth_block.name, self.texture_block.name,
+                      list(renderer.wall_textures), renderer.sky_image.get_size(), len(planes),
+                      None if game.level else game.map.world_map, game.level.path if game.level else None))
+        self.surface = None
+        self.pending = None
+
+    def start(self, frame):
+        # runs while the main process updates sprites and NPCs, or draws the rest of the frame
+        offset = int(self.game.object_renderer.sky_offset * view.WIDTH / WIDTH)
+        bounds = [view.NUM_RAYS * i // self.strips for i in range(self.strips + 1)]
+        tasks = [(first, last, view.window, view.scale, frame.x, frame.y, frame.angle, offset)
+                 for first, last in zip(bounds, bounds[1:]) if first < last]
+        self.pending = self.pool.map_async(_render_strip, tasks, chunksize=1)
+
+    def finish(self, surface):
+        # with nothing pending the frame still holds the last walls, the player has not moved
+        if self.pending:
+            self.pending.get()
+            self.pending = None
+        if self.surface is None or self.surface.get_size() != view.RES:
+            self.surface = pg.image.frombuffer(self.frame.buf[:view.WIDTH * view.HEIGHT * 4], view.RES, PIXEL_FORMAT)
+        surface.blit(self.surface, (0, 0))
+
+    def render_sprites(self, surface, objects):
+        # far to near, each sprite only over the columns where no wall is closer
+        SCALE, depth = view.SCALE, self.depth
+        for dist, image, (x, y) in sorted(objects, key=lambda t: t[0], reverse=True):
+            x, width = int(x), image.get_width()
+            first, last = max(0, x // SCALE), min(view.NUM_RAYS, (x + width) // SCALE + 1)
+            run = None
+            for ray in range(first, last + 1):
+                visible = ray < last and depth[ray] > dist
+                if visible and run is None:
+                    run = ray
+                elif not visible and run is not None:
+                    left, right = max(x, run * SCALE), min(x + width, ray * SCALE)
+                    if right > left:
+                        surface.blit(image, (left, y), (left - x, 0, right - left, image.get_height()))
+                    run = None
+
+    def close(self):
+        if self.pending:
+            self.pending.wait()
+        self.pool.terminate()
+        self.pool.join()
+        # the views into the shared blocks have to go before the blocks can be closed
+        self.surface = None
+        self.depth.release()
+        for block in (self.frame, self.depth_block, self.texture_block):
+            block.close()
+            block.unlink()
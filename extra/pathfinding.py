@@ -10,6 +10,13 @@ class PathFinding:
         self.graph = {}
         self.get_graph()
 
+    def reset(self):
+        # a new game keeps the graph of the built-in map; the lazy one of a streamed level belongs to the
+        # chunks that were loaded. cached paths were searched around the old NPCs, so they go either way
+        if self.game.map.region:
+            self.graph = {}
+        PathFinding.get_path.cache_clear()
+
     @lru_cache
     def get_path(self, start, goal):
         self.visited = self.bfs(start, goal, self.graph)
@@ -29,7 +36,9 @@ class PathFinding:
             cur_node = queue.popleft()
             if cur_node == goal:
                 break
-            next_nodes = graph[cur_node]
+            next_nodes = graph.get(cur_node)
+            if next_nodes is None:
+                next_nodes = self.link(*cur_node)
 
             for next_node in next_nodes:
                 if next_node not in visited and next_node not in self.game.object_handler.npc_positions:
@@ -41,7 +50,41 @@ class PathFinding:
         return [(x + dx, y + dy) for dx, dy in self.ways if (x + dx, y + dy) not in self.game.map.world_map]
 
     def get_graph(self):
+        if self.game.map.region:
+            return
         for y, row in enumerate(self.map):
             for x, col in enumerate(row):
                 if not col:
-                    self.graph[(x, y)] = self.graph.get((x, y), []) + self.get_next_nodes(x, y)
\ No newline at end of file
+                    self.graph[(x, y)] = self.graph.get((x, y), []) + self.get_next_nodes(x, y)
+
+    def update_chunks(self, added, dropped):
+        # on a streamed level bfs fills the graph in as it goes (see link); here only the cells whose
+        # neighbours came or went are forgotten, so crossing into new chunks costs next to nothing
+        region = self.game.map.region
+        for chunk in dropped:
+            for cell in region.chunk_cells(chunk):
+                self.graph.pop(cell, None)
+        for chunk in added + dropped:
+            for cell in self.chunk_ring(chunk):
+                self.graph.pop(cell, None)
+        PathFinding.get_path.cache_clear()
+
+    def link(self, x, y):
+        region = self.game.map.region
+        world_map = self.game.map.world_map
+        if region is None:
+            return self.get_next_nodes(x, y)
+        if not region.is_loaded(x, y) or (x, y) in world_map:
+            return []
+        size, loaded = region.level.chunk, region.loaded
+        nodes = [(x + dx, y + dy) for dx, dy in self.ways
+                 if ((x + dx) // size, (y + dy) // size) in loaded and (x + dx, y + dy) not in world_map]
+        self.graph[(x, y)] = nodes
+        return nodes
+
+    def chunk_ring(self, chunk):
+        # the cells just outside the chunk, whose neighbour lists include cells of the chunk
+        size = self.game.map.level.chunk
+        x0, y0 = chunk[0] * size - 1, chunk[1] * size - 1
+        x1, y1 = x0 + size + 1, y0 + size + 1
+        return {(x, y) for x in range(x0, x1 + 1) for y in (y0, y1)} | {(x, y) for y in range(y0, y1 + 1) for x in (x0, x1)}
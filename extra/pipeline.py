@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+
+
+class FrameSnapshot:
+    # what the renderer reads from a simulated frame. the sprite list is made new by every simulation step
+    # and the images in it are never drawn on, and a streamed level swaps in a new wall dict rather than
+    # changing this one, so nothing here changes after the snapshot is taken
+    def __init__(self, game):
+        player = game.player
+        self.x, self.y, self.angle, self.rel = player.x, player.y, player.angle, player.rel
+        self.world_map = game.map.world_map
+        self.health = player.health
+        self.weapon_image = game.weapon.images[0]
+        self.sprites = game.object_handler.sprites_to_render
+        renderer = game.object_renderer
+        self.damaged, renderer.damage_pending = renderer.damage_pending, False
+
+
+class Pipeline:
+    # simulates frame N+1 on a worker thread while the main thread draws and presents frame N. the two
+    # sides only meet between frames: input is read, the render scale changed and a finished round
+    # restarted while the worker is idle, and the worker hands back a FrameSnapshot
+    def __init__(self, game):
+        self.game = game
+        self.worker = ThreadPoolExecutor(1, thread_name_prefix='simulation')
+
+    def step(self):
+        game = self.game
+        game.check_events()
+        scale = view.scale
+        if game.resolution:
+            game.resolution.update()
+        simulated = self.worker.submit(game.simulate)
+        # a frame projected at another render scale is dropped rather than drawn wrong
+        if view.scale == scale:
+            game.raycasting.update(game.frame)
+            game.draw()
+            game.compositor.present()
+        game.frame = simulated.result()
+        game.finish_round()
+        game.tick()
+
+    def close(self):
+        self.worker.shutdown()
@@ -6,13 +6,13 @@ import math
 class Player:
     def __init__(self, game):
         self.game = game
-        self.x, self.y = PLAYER_POS
+        self.x, self.y = game.map.start
         self.angle = PLAYER_ANGLE
         self.shot = False
         self.health = PLAYER_MAX_HEALTH
         self.rel = 0
         self.health_recovery_delay = 700
-        self.time_prev = pg.time.get_ticks()
+        self.time_prev = game.ticks
         # diagonal movement correction
         self.diag_move_corr = 1 / math.sqrt(2)
 
@@ -21,17 +21,14 @@ class Player:
             self.health += 1
 
     def check_health_recovery_delay(self):
-        time_now = pg.time.get_ticks()
+        time_now = self.game.ticks
         if time_now - self.time_prev > self.health_recovery_delay:
             self.time_prev = time_now
             return True
 
     def check_game_over(self):
         if self.health < 1:
-            self.game.object_renderer.game_over()
-            pg.display.flip()
-            pg.time.delay(1500)
-            self.game.new_game()
+            self.game.end_round(self.game.object_renderer.game_over)
 
     def get_damage(self, damage):
         self.health -= damage
@@ -54,7 +51,7 @@ class Player:
         speed_sin = speed * sin_a
         speed_cos = speed * cos_a
 
-        keys = pg.key.get_pressed()
+        keys = self.game.keys
         num_key_pressed = -1
         if keys[pg.K_w]:
             num_key_pressed += 1
@@ -103,10 +100,7 @@ class Player:
         pg.draw.circle(self.game.screen, 'green', (self.x * 100, self.y * 100), 15)
 
     def mouse_control(self):
-        mx, my = pg.mouse.get_pos()
-        if mx < MOUSE_BORDER_LEFT or mx > MOUSE_BORDER_RIGHT:
-            pg.mouse.set_pos([HALF_WIDTH, HALF_HEIGHT])
-        self.rel = pg.mouse.get_rel()[0]
+        self.rel = self.game.mouse_rel
         self.rel = max(-MOUSE_MAX_REL, min(MOUSE_MAX_REL, self.rel))
         self.angle += self.rel * MOUSE_SENSITIVITY * self.game.delta_time
 
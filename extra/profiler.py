@@ -0,0 +1,145 @@
+import json
+import time
+from bisect import bisect_left
+from collections import deque
+import pygame as pg
+
+# histogram bucket upper edges, ms
+BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, float('inf'))
+_UNSET = object()
+
+
+class Section:
+    def __init__(self, name):
+        self.name = name
+        self.hist = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=240)
+        self.total = 0.0
+        self.frames = 0
+
+    def add(self, ms):
+        self.hist[bisect_left(BUCKETS, ms)] += 1
+        self.recent.append(ms)
+        self.total += ms
+        self.frames += 1
+
+    def mean(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def p95(self):
+        if not self.recent:
+            return 0.0
+        s = sorted(self.recent)
+        return s[min(len(s) - 1, int(0.95 * len(s)))]
+
+    def to_json(self):
+        return {'frames': self.frames, 'mean_ms': self.total / self.frames if self.frames else 0.0,
+                'recent_mean_ms': self.mean(), 'recent_p95_ms': self.p95(),
+                'buckets_ms': [b if b != float('inf') else None for b in BUCKETS], 'histogram': self.hist}
+
+
+class FrameProfiler:
+    # methods are wrapped on their classes only while enabled, so it costs nothing when off
+    # and survives new_game() recreating the objects
+    def __init__(self, trace_path=None, max_frames=3000):
+        self.enabled = False
+        self.trace_path = trace_path
+        self.targets = []
+        self.patched = []
+        self.sections = {'frame': Section('frame')}
+        self.frame = {}
+        self.trace = deque(maxlen=max_frames * 10)
+        self.origin = time.perf_counter()
+        self.last = None
+        self.frame_count = 0
+        self.font = None
+        self.lines = []
+
+    def watch(self, owner, attr, name):
+        self.targets.append((owner, attr, name))
+        self.sections.setdefault(name, Section(name))
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.last = None
+        for owner, attr, name in self.targets:
+            original = vars(owner).get(attr, _UNSET)
+            setattr(owner, attr, self.timed(name, getattr(owner, attr)))
+            self.patched.append((owner, attr, original))
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for owner, attr, original in reversed(self.patched):
+            if original is _UNSET:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
+        self.patched.clear()
+
+    def timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                self.frame[name] = self.frame.get(name, 0.0) + (end - start) * 1000
+                self.trace.append((name, start, end))
+        return wrapper
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.last is not None:
+            self.sections['frame'].add((now - self.last) * 1000)
+            self.trace.append(('frame', self.last, now))
+            for name, ms in self.frame.items():
+                self.sections[name].add(ms)
+        self.frame = {}
+        self.last = now
+        self.frame_count += 1
+
+    def draw(self, screen):
+        # text is re-rendered twice a second or so, bars every frame
+        if self.font is None:
+            pg.font.init()
+            self.font = pg.font.SysFont('monospace', 18)
+        if not self.lines or self.frame_count % 30 == 0:
+            self.lines = [self.font.render(f'{s.name:<36}{s.mean():7.2f}{s.p95():7.2f} ms', True, 'yellow')
+                          for s in self.sections.values()]
+        rect = self.overlay_rect(screen)
+        x, y = rect.x + 10, rect.y + 10
+        pg.draw.rect(screen, 'black', rect)
+        for line, section in zip(self.lines, self.sections.values()):
+            screen.blit(line, (x, y))
+            peak = max(section.hist) or 1
+            for i, count in enumerate(section.hist):
+                h = int(16 * count / peak)
+                pg.draw.rect(screen, 'orange', (x + 480 + i * 10, y + 16 - h, 8, h))
+            y += 22
+
+    def overlay_rect(self, screen):
+        return pg.Rect(screen.get_width() - 630, 90, 620, 22 * len(self.sections) + 20)
+
+    def export(self, path=None):
+        path = path or self.trace_path
+        if not path:
+            return
+        # chrome://tracing / Perfetto format, plus the histograms
+        events = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+                  for name, start, end in self.trace]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events,
+                       'sections': {name: s.to_json() for name, s in self.sections.items()}}, f)
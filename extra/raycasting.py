@@ -3,103 +3,157 @@ import math
 from settings import *
 
 
+def cast_rays(ox, oy, angle, world_map, first=0, last=None):
+    # (depth, proj_height, texture, offset) for the rays in [first, last), so a strip can be cast on its own
+    result = []
+    texture_vert, texture_hor = 1, 1
+    x_map, y_map = int(ox), int(oy)
+
+    SCREEN_DIST, DELTA_ANGLE = view.SCREEN_DIST, view.DELTA_ANGLE
+    ray_angle = angle - HALF_FOV + 0.0001 + first * DELTA_ANGLE
+    for ray in range(first, view.NUM_RAYS if last is None else last):
+        sin_a = math.sin(ray_angle)
+        cos_a = math.cos(ray_angle)
+
+        # horizontals
+        y_hor, dy = (y_map + 1, 1) if sin_a > 0 else (y_map - 1e-6, -1)
+
+        depth_hor = (y_hor - oy) / sin_a
+        x_hor = ox + depth_hor * cos_a
+
+        delta_depth = dy / sin_a
+        dx = delta_depth * cos_a
+
+        for i in range(MAX_DEPTH):
+            tile_hor = int(x_hor), int(y_hor)
+            if tile_hor in world_map:
+                texture_hor = world_map[tile_hor]
+                break
+            x_hor += dx
+            y_hor += dy
+            depth_hor += delta_depth
+
+        # verticals
+        x_vert, dx = (x_map + 1, 1) if cos_a > 0 else (x_map - 1e-6, -1)
+
+        depth_vert = (x_vert - ox) / cos_a
+        y_vert = oy + depth_vert * sin_a
+
+        delta_depth = dx / cos_a
+        dy = delta_depth * sin_a
+
+        for i in range(MAX_DEPTH):
+            tile_vert = int(x_vert), int(y_vert)
+            if tile_vert in world_map:
+                texture_vert = world_map[tile_vert]
+                break
+            x_vert += dx
+            y_vert += dy
+            depth_vert += delta_depth
+
+        # depth, texture offset
+        if depth_vert < depth_hor:
+            depth, texture = depth_vert, texture_vert
+            y_vert %= 1
+            offset = y_vert if cos_a > 0 else (1 - y_vert)
+        else:
+            depth, texture = depth_hor, texture_hor
+            x_hor %= 1
+            offset = (1 - x_hor) if sin_a > 0 else x_hor
+
+        # remove fishbowl effect
+        depth *= math.cos(angle - ray_angle)
+
+        # projection
+        proj_height = SCREEN_DIST / (depth + 0.0001)
+
+        # ray casting result
+        result.append((depth, proj_height, texture, offset))
+
+        ray_angle += DELTA_ANGLE
+    return result
+
+
+MIP_LEVELS = (TEXTURE_SIZE // MIN_MIP_SIZE).bit_length()
+# for a column int(proj_height) pixels tall, the smallest pyramid level that is still taller
+_mip_level = [max(k for k in range(MIP_LEVELS) if TEXTURE_SIZE >> k > h) for h in range(TEXTURE_SIZE)]
+
+
+def mip_pyramid(texture):
+    # the texture followed by copies halved down to MIN_MIP_SIZE, each one box filtered from the last
+    levels = [texture]
+    for _ in range(MIP_LEVELS - 1):
+        width, height = levels[-1].get_size()
+        levels.append(pg.transform.smoothscale(levels[-1], (width // 2, height // 2)))
+    return levels
+
+
+def wall_column(textures, ray, proj_height, texture, offset):
+    # textures maps each wall to its mip pyramid
+    SCALE, HEIGHT, HALF_HEIGHT = view.SCALE, view.HEIGHT, view.HALF_HEIGHT
+    levels = textures[texture]
+    if proj_height < HEIGHT:
+        # far walls come from the smallest level still as tall as the column, so the scale drops at most
+        # every other texel instead of skipping most of them and shimmering as the player moves
+        level = levels[_mip_level[int(proj_height)]] if proj_height < TEXTURE_SIZE else levels[0]
+        size = level.get_height()
+        wall_column = level.subsurface(
+            offset * (size - SCALE), 0, SCALE, size
+        )
+        wall_column = pg.transform.scale(wall_column, (SCALE, proj_height))
+        wall_pos = (ray * SCALE, HALF_HEIGHT - proj_height // 2)
+    else:
+        texture_height = TEXTURE_SIZE * HEIGHT / proj_height
+        wall_column = levels[0].subsurface(
+            offset * (TEXTURE_SIZE - SCALE), HALF_TEXTURE_SIZE - texture_height // 2,
+            SCALE, texture_height
+        )
+        wall_column = pg.transform.scale(wall_column, (SCALE, HEIGHT))
+        wall_pos = (ray * SCALE, 0)
+    return wall_column, wall_pos
+
+
 class RayCasting:
     def __init__(self, game):
         self.game = game
         self.ray_casting_result = []
         self.objects_to_render = []
         self.textures = self.game.object_renderer.wall_textures
+        # the walls, floor and sky only depend on the pose; objects_to_render starts with wall_count columns
+        self.pose = None
+        self.wall_count = 0
 
     def get_objects_to_render(self):
         self.objects_to_render = []
         for ray, values in enumerate(self.ray_casting_result):
             depth, proj_height, texture, offset = values
-
-            if proj_height < HEIGHT:
-                wall_column = self.textures[texture].subsurface(
-                    offset * (TEXTURE_SIZE - SCALE), 0, SCALE, TEXTURE_SIZE
-                )
-                wall_column = pg.transform.scale(wall_column, (SCALE, proj_height))
-                wall_pos = (ray * SCALE, HALF_HEIGHT - proj_height // 2)
-            else:
-                texture_height = TEXTURE_SIZE * HEIGHT / proj_height
-                wall_column = self.textures[texture].subsurface(
-                    offset * (TEXTURE_SIZE - SCALE), HALF_TEXTURE_SIZE - texture_height // 2,
-                    SCALE, texture_height
-                )
-                wall_column = pg.transform.scale(wall_column, (SCALE, HEIGHT))
-                wall_pos = (ray * SCALE, 0)
-
-            self.objects_to_render.append((depth, wall_column, wall_pos))
-
-    def ray_cast(self):
-        self.ray_casting_result = []
-        texture_vert, texture_hor = 1, 1
-        ox, oy = self.game.player.pos
-        x_map, y_map = self.game.player.map_pos
-
-        ray_angle = self.game.player.angle - HALF_FOV + 0.0001
-        for ray in range(NUM_RAYS):
-            sin_a = math.sin(ray_angle)
-            cos_a = math.cos(ray_angle)
-
-            # horizontals
-            y_hor, dy = (y_map + 1, 1) if sin_a > 0 else (y_map - 1e-6, -1)
-
-            depth_hor = (y_hor - oy) / sin_a
-            x_hor = ox + depth_hor * cos_a
-
-            delta_depth = dy / sin_a
-            dx = delta_depth * cos_a
-
-            for i in range(MAX_DEPTH):
-                tile_hor = int(x_hor), int(y_hor)
-                if tile_hor in self.game.map.world_map:
-                    texture_hor = self.game.map.world_map[tile_hor]
-                    break
-                x_hor += dx
-                y_hor += dy
-                depth_hor += delta_depth
-
-            # verticals
-            x_vert, dx = (x_map + 1, 1) if cos_a > 0 else (x_map - 1e-6, -1)
-
-            depth_vert = (x_vert - ox) / cos_a
-            y_vert = oy + depth_vert * sin_a
-
-            delta_depth = dx / cos_a
-            dy = delta_depth * sin_a
-
-            for i in range(MAX_DEPTH):
-                tile_vert = int(x_vert), int(y_vert)
-                if tile_vert in self.game.map.world_map:
-                    texture_vert = self.game.map.world_map[tile_vert]
-                    break
-                x_vert += dx
-                y_vert += dy
-                depth_vert += delta_depth
-
-            # depth, texture offset
-            if depth_vert < depth_hor:
-                depth, texture = depth_vert, texture_vert
-                y_vert %= 1
-                offset = y_vert if cos_a > 0 else (1 - y_vert)
-            else:
-                depth, texture = depth_hor, texture_hor
-                x_hor %= 1
-                offset = (1 - x_hor) if sin_a > 0 else x_hor
-
-            # remove fishbowl effect
-            depth *= math.cos(self.game.player.angle - ray_angle)
-
-            # projection
-            proj_height = SCREEN_DIST / (depth + 0.0001)
-
-            # ray casting result
-            self.ray_casting_result.append((depth, proj_height, texture, offset))
-
-            ray_angle += DELTA_ANGLE
-
-    def update(self):
-        self.ray_cast()
-        self.get_objects_to_render()
\ No newline at end of file
+            wall_column_image, wall_pos = wall_column(self.textures, ray, proj_height, texture, offset)
+            self.objects_to_render.append((depth, wall_column_image, wall_pos))
+        self.wall_count = len(self.objects_to_render)
+
+    def ray_cast(self, pose=None, world_map=None):
+        ox, oy, angle = pose or (*self.game.player.pos, self.game.player.angle)
+        self.ray_casting_result = cast_rays(ox, oy, angle, self.game.map.world_map if world_map is None else world_map)
+
+    def add_sprites(self, sprites):
+        # the sprites projected by the simulation step go after the walls, in place of the last frame's
+        del self.objects_to_render[self.wall_count:]
+        self.objects_to_render += sprites
+
+    def update(self, frame):
+        # frame is the FrameSnapshot being drawn, not the player, which may already be a step ahead
+        pose = frame.x, frame.y, frame.angle, view.RES
+        if pose == self.pose:
+            # standing still: last frame's walls are kept
+            return
+        self.pose = pose
+        parallel = self.game.parallel_raycasting
+        if parallel:
+            # the walls are cast and drawn by the workers
+            self.game.object_renderer.scroll_sky(frame.rel)
+            self.objects_to_render = []
+            self.wall_count = 0
+            parallel.start(frame)
+            return
+        self.ray_cast(pose[:3], frame.world_map)
+        self.get_objects_to_render()
@@ -0,0 +1,30 @@
+from collections import deque
+from settings import *
+
+
+class ResolutionController:
+    # nudges the render scale so the frame's work time (without the pacer's wait) stays near the target
+    def __init__(self, game, target_ms=1000 / 60, window=15, cooldown=30):
+        self.game = game
+        self.target_ms = target_ms
+        self.samples = deque(maxlen=window)
+        self.cooldown = cooldown
+        self.wait = cooldown
+
+    def update(self):
+        self.samples.append(self.game.pacer.get_rawtime())
+        self.wait -= 1
+        if self.wait > 0 or len(self.samples) < self.samples.maxlen:
+            return
+        frame_ms = sorted(self.samples)[len(self.samples) // 2]
+        scale = view.scale
+        if frame_ms > self.target_ms * 1.05:
+            # drop faster than it recovers, a stutter is worse than a softer picture
+            scale -= 2 * RENDER_SCALE_STEP if frame_ms > self.target_ms * 1.5 else RENDER_SCALE_STEP
+        elif frame_ms < self.target_ms * 0.8:
+            scale += RENDER_SCALE_STEP
+        scale = min(MAX_RENDER_SCALE, max(MIN_RENDER_SCALE, round(scale, 2)))
+        if scale != view.scale:
+            view.set_scale(scale)
+            self.samples.clear()
+            self.wait = self.cooldown
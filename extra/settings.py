@@ -5,7 +5,8 @@ RES = WIDTH, HEIGHT = 1600, 900
 # RES = WIDTH, HEIGHT = 1920, 1080
 HALF_WIDTH = WIDTH // 2
 HALF_HEIGHT = HEIGHT // 2
-FPS = 0
+FPS = 120  # 0 runs uncapped
+IDLE_FPS = 10  # while the window is minimized
 
 PLAYER_POS = 1.5, 5  # mini_map
 PLAYER_ANGLE = 0
@@ -20,16 +21,43 @@ MOUSE_BORDER_LEFT = 100
 MOUSE_BORDER_RIGHT = WIDTH - MOUSE_BORDER_LEFT
 
 FLOOR_COLOR = (30, 30, 30)
+FLOOR_TEXTURE = 'resources/textures/1.png'  # None keeps the flat FLOOR_COLOR
+CEILING_TEXTURE = None  # None keeps the scrolling sky
+FLOOR_SHADE = 0.45
 
 FOV = math.pi / 3
 HALF_FOV = FOV / 2
-NUM_RAYS = WIDTH // 2
-HALF_NUM_RAYS = NUM_RAYS // 2
-DELTA_ANGLE = FOV / NUM_RAYS
 MAX_DEPTH = 20
-
-SCREEN_DIST = HALF_WIDTH / math.tan(HALF_FOV)
-SCALE = WIDTH // NUM_RAYS
+COLUMN_WIDTH = 2  # pixels per ray
 
 TEXTURE_SIZE = 256
-HALF_TEXTURE_SIZE = TEXTURE_SIZE // 2
\ No newline at end of file
+HALF_TEXTURE_SIZE = TEXTURE_SIZE // 2
+MIN_MIP_SIZE = 8  # smallest level of a wall texture pyramid
+
+# dynamic resolution: the 3d view renders at RES * scale and is upscaled to the window
+MIN_RENDER_SCALE = 0.4
+MAX_RENDER_SCALE = 1.0
+RENDER_SCALE_STEP = 0.05
+
+
+class View:
+    # the internal render resolution and everything derived from it, recomputed together in set_scale()
+    def __init__(self, res, scale=1.0):
+        self.window = res
+        self.set_scale(scale)
+
+    def set_scale(self, scale):
+        self.scale = min(MAX_RENDER_SCALE, max(MIN_RENDER_SCALE, scale))
+        width = max(COLUMN_WIDTH, int(self.window[0] * self.scale) // COLUMN_WIDTH * COLUMN_WIDTH)
+        height = max(2, int(self.window[1] * self.scale) // 2 * 2)
+        self.RES = self.WIDTH, self.HEIGHT = width, height
+        self.HALF_WIDTH = width // 2
+        self.HALF_HEIGHT = height // 2
+        self.NUM_RAYS = width // COLUMN_WIDTH
+        self.HALF_NUM_RAYS = self.NUM_RAYS // 2
+        self.DELTA_ANGLE = FOV / self.NUM_RAYS
+        self.SCREEN_DIST = self.HALF_WIDTH / math.tan(HALF_FOV)
+        self.SCALE = width // self.NUM_RAYS
+
+
+view = View(RES)
@@ -3,6 +3,18 @@ from settings import *
 import os
 from collections import deque
 
+# decoded images by path and the frame lists of animation folders. a new game builds its sprites again but
+# never decodes them again; the surfaces are shared, so they are only ever read
+_images = {}
+_folders = {}
+
+
+def load_image(path):
+    image = _images.get(path)
+    if image is None:
+        image = _images[path] = pg.image.load(path).convert_alpha()
+    return image
+
 
 class SpriteObject:
     def __init__(self, game, path='resources/sprites/static_sprites/candlebra.png',
@@ -10,7 +22,7 @@ class SpriteObject:
         self.game = game
         self.player = game.player
         self.x, self.y = pos
-        self.image = pg.image.load(path).convert_alpha()
+        self.image = load_image(path)
         self.IMAGE_WIDTH = self.image.get_width()
         self.IMAGE_HALF_WIDTH = self.image.get_width() // 2
         self.IMAGE_RATIO = self.IMAGE_WIDTH / self.image.get_height()
@@ -18,18 +30,25 @@ class SpriteObject:
         self.sprite_half_width = 0
         self.SPRITE_SCALE = scale
         self.SPRITE_HEIGHT_SHIFT = shift
+        self.projection = None
+        self.projection_key = None
 
     def get_sprite_projection(self):
-        proj = SCREEN_DIST / self.norm_dist * self.SPRITE_SCALE
+        proj = view.SCREEN_DIST / self.norm_dist * self.SPRITE_SCALE
         proj_width, proj_height = proj * self.IMAGE_RATIO, proj
 
-        image = pg.transform.scale(self.image, (proj_width, proj_height))
+        # the scaled image is kept while the frame and the size stay the same, so the renderer can also
+        # tell that the sprite did not change
+        if self.projection_key != (self.image, proj_width, proj_height):
+            self.projection = pg.transform.scale(self.image, (proj_width, proj_height))
+            self.projection_key = self.image, proj_width, proj_height
+        image = self.projection
 
         self.sprite_half_width = proj_width // 2
         height_shift = proj_height * self.SPRITE_HEIGHT_SHIFT
-        pos = self.screen_x - self.sprite_half_width, HALF_HEIGHT - proj_height // 2 + height_shift
+        pos = self.screen_x - self.sprite_half_width, view.HALF_HEIGHT - proj_height // 2 + height_shift
 
-        self.game.raycasting.objects_to_render.append((self.norm_dist, image, pos))
+        self.game.object_handler.sprites_to_render.append((self.norm_dist, image, pos))
 
     def get_sprite(self):
         dx = self.x - self.player.x
@@ -41,12 +60,12 @@ class SpriteObject:
         if (dx > 0 and self.player.angle > math.pi) or (dx < 0 and dy < 0):
             delta += math.tau
 
-        delta_rays = delta / DELTA_ANGLE
-        self.screen_x = (HALF_NUM_RAYS + delta_rays) * SCALE
+        delta_rays = delta / view.DELTA_ANGLE
+        self.screen_x = (view.HALF_NUM_RAYS + delta_rays) * view.SCALE
 
         self.dist = math.hypot(dx, dy)
         self.norm_dist = self.dist * math.cos(delta)
-        if -self.IMAGE_HALF_WIDTH < self.screen_x < (WIDTH + self.IMAGE_HALF_WIDTH) and self.norm_dist > 0.5:
+        if -self.IMAGE_HALF_WIDTH < self.screen_x < (view.WIDTH + self.IMAGE_HALF_WIDTH) and self.norm_dist > 0.5:
             self.get_sprite_projection()
 
     def update(self):
@@ -60,7 +79,7 @@ class AnimatedSprite(SpriteObject):
         self.animation_time = animation_time
         self.path = path.rsplit('/', 1)[0]
         self.images = self.get_images(self.path)
-        self.animation_time_prev = pg.time.get_ticks()
+        self.animation_time_prev = game.ticks
         self.animation_trigger = False
 
     def update(self):
@@ -75,15 +94,15 @@ class AnimatedSprite(SpriteObject):
 
     def check_animation_time(self):
         self.animation_trigger = False
-        time_now = pg.time.get_ticks()
+        time_now = self.game.ticks
         if time_now - self.animation_time_prev > self.animation_time:
             self.animation_time_prev = time_now
             self.animation_trigger = True
 
     def get_images(self, path):
-        images = deque()
-        for file_name in os.listdir(path):
-            if os.path.isfile(os.path.join(path, file_name)):
-                img = pg.image.load(path + '/' + file_name).convert_alpha()
-                images.append(img)
-        return images
+        # each sprite rotates a deque of its own over the shared frames
+        images = _folders.get(path)
+        if images is None:
+            images = _folders[path] = [load_image(path + '/' + file_name) for file_name in os.listdir(path)
+                                       if os.path.isfile(os.path.join(path, file_name))]
+        return deque(images)
@@ -1,13 +1,21 @@
 from sprite_object import *
 
+# the smoothscaled frames by folder and scale, made once like the images they come from
+_scaled = {}
+
 
 class Weapon(AnimatedSprite):
     def __init__(self, game, path='resources/sprites/weapon/shotgun/0.png', scale=0.4, animation_time=90):
         super().__init__(game=game, path=path, scale=scale, animation_time=animation_time)
-        self.images = deque(
-            [pg.transform.smoothscale(img, (self.image.get_width() * scale, self.image.get_height() * scale))
-             for img in self.images])
+        frames = _scaled.get((self.path, scale))
+        if frames is None:
+            frames = _scaled[self.path, scale] = [
+                pg.transform.smoothscale(img, (self.image.get_width() * scale, self.image.get_height() * scale))
+                for img in self.images]
+        self.images = deque(frames)
         self.weapon_pos = (HALF_WIDTH - self.images[0].get_width() // 2, HEIGHT - self.images[0].get_height())
+        self.rect = pg.Rect(self.weapon_pos, (max(img.get_width() for img in self.images),
+                                              max(img.get_height() for img in self.images)))
         self.reloading = False
         self.num_images = len(self.images)
         self.frame_counter = 0
@@ -25,7 +33,7 @@ class Weapon(AnimatedSprite):
                     self.frame_counter = 0
 
     def draw(self):
-        self.game.screen.blit(self.images[0], self.weapon_pos)
+        self.game.screen.blit(self.game.frame.weapon_image, self.weapon_pos)
 
     def update(self):
         self.check_animation_time()
@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+from OpenGL.GL import *
+
+# Estado de um desenho. A ordem dos campos é a ordem de ordenação da fila:
+# opacos antes de transparentes, fundo (sem teste de profundidade) primeiro,
+# e dentro de cada grupo os desenhos com a mesma textura ficam juntos.
+# texture = 0 desenha sem textura.
+Material = namedtuple('Material', 'blend depth_test lighting texture')
+
+
+class GLState:
+    # Cópia do estado fixo do OpenGL; só chama o driver quando o valor muda
+    def __init__(self):
+        self.caps = {}
+        self.texture = None
+        self.blend = None
+        self.depth_write = None
+        self.size = None
+        self.calls = 0
+        self.skipped = 0
+
+    def invalidate(self):
+        # Para quando alguém mexeu no estado por fora (carga de texturas, novo contexto)
+        self.caps.clear()
+        self.texture = self.blend = self.depth_write = self.size = None
+
+    def set(self, cap, on):
+        on = bool(on)
+        if self.caps.get(cap) is on:
+            self.skipped += 1
+            return
+        if on: glEnable(cap)
+        else: glDisable(cap)
+        self.caps[cap] = on
+        self.calls += 1
+
+    def enable(self, cap): self.set(cap, True)
+
+    def disable(self, cap): self.set(cap, False)
+
+    def bind_texture(self, tex):
+        if self.texture == tex:
+            self.skipped += 1
+            return
+        glBindTexture(GL_TEXTURE_2D, tex)
+        self.texture = tex
+        self.calls += 1
+
+    def blend_func(self, src, dst):
+        if self.blend == (src, dst):
+            self.skipped += 1
+            return
+        glBlendFunc(src, dst)
+        self.blend = (src, dst)
+        self.calls += 1
+
+    def depth_mask(self, on):
+        on = bool(on)
+        if self.depth_write is on:
+            self.skipped += 1
+            return
+        glDepthMask(GL_TRUE if on else GL_FALSE)
+        self.depth_write = on
+        self.calls += 1
+
+    def point_size(self, size):
+        if self.size == size:
+            self.skipped += 1
+            return
+        glPointSize(size)
+        self.size = size
+        self.calls += 1
+
+    def apply(self, mat):
+        self.set(GL_BLEND, mat.blend)
+        self.set(GL_DEPTH_TEST, mat.depth_test)
+        self.set(GL_LIGHTING, mat.lighting)
+        self.set(GL_TEXTURE_2D, mat.texture)
+        if mat.texture: self.bind_texture(mat.texture)
+        # Transparentes não escrevem profundidade
+        self.depth_mask(not mat.blend)
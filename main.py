@@ -3,32 +3,49 @@ import os
 import math
 import time
 import random
-import ctypes
 import subprocess
+import argparse
+import hashlib
+import json
+from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import List, Tuple, Optional
+from typing import Optional
 
 import pygame
 from pygame.locals import *
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from OpenGL.GLUT import *
 from PIL import Image
-
-try:
-    glutInit()
-except:
-    pass
-
-if not hasattr(sys.modules[__name__], "GLUT_BITMAP_HELVETICA_18"):
-    GLUT_BITMAP_HELVETICA_18 = ctypes.c_void_p(0x0008)
-    GLUT_BITMAP_HELVETICA_12 = ctypes.c_void_p(0x0006)
-    GLUT_BITMAP_TIMES_ROMAN_24 = ctypes.c_void_p(0x0005)
+import numpy as np
+
+import meshes
+from text_renderer import TextRenderer, FONT_SMALL, FONT_MEDIUM, FONT_TITLE
+from gl_state import GLState, Material
+import gl_state
+import text_renderer
+from profiler import FrameProfiler
+from replay import Recorder, Replay
+from pacing import FramePacer
+from net import NET_PORT
 
 COLS = 12
 SCREEN_W = 800
 SCREEN_H = 800
+FALLING_STARS_COUNT = 200
+FOV_Y = 60
+
+# Passo fixo da simulação e limite de tempo acumulado por quadro
+SIM_DT = 1.0 / 120.0
+MAX_FRAME_TIME = 0.25
+
+# Níveis de detalhe das esferas: (segmentos, raio mínimo projetado em pixels)
+SPHERE_LODS = ((48, 200), (32, 80), (16, 20), (10, 6), (6, 0))
+
+# Céu: esfera em volta da câmera (dentro do plano far) e repetições da textura (horizontal, vertical),
+# cerca de uma por campo de visão como era a imagem de fundo fixa
+SKY_RADIUS = 100.0
+SKY_TEX_REPEAT = (6, 3)
 
 STATE_MENU = 0
 STATE_DIFFICULTY_SELECT = 1
@@ -36,6 +53,8 @@ STATE_PLAYING = 2
 STATE_PAUSED = 3
 STATE_GAMEOVER = 4
 STATE_WIN = 5
+# Jogo em rede esperando as duas vagas serem ocupadas
+STATE_WAITING = 6
 
 GAME_MODE_SOLO = 0
 GAME_MODE_MULTI = 1
@@ -48,6 +67,13 @@ DIFFICULTY_SETTINGS = {
     'Dante Must Die': {'spawn_interval': 0.7, 'speed': 20.0, 'spawn_min': 2, 'spawn_max': 3}
 }
 
+ENTITY_ENEMY = 0
+ENTITY_PICKUP = 1
+
+PARTICLE_CAPACITY = 1024
+PARTICLE_SIZE = 6.0
+BURST_SIZE = 24
+
 TEXTURE_CACHE = {}
 
 def get_asset_path(filename, folder='images'):
@@ -81,19 +107,182 @@ def load_sound(filename):
     except:
         return None
 
-def launch_extra_game():
+def open_window(vsync=False):
+    # Com vsync o flip espera o monitor; se o driver não aceitar, abre sem e avisa quem chamou
+    if vsync:
+        try:
+            pygame.display.set_mode((SCREEN_W, SCREEN_H), DOUBLEBUF | OPENGL, vsync=1)
+            return True
+        except pygame.error:
+            pass
+    pygame.display.set_mode((SCREEN_W, SCREEN_H), DOUBLEBUF | OPENGL)
+    return False
+
+def launch_extra_game(vsync=False):
     try:
         game_path = os.path.join("extra", "main.py")
         if not os.path.exists(game_path):
             print("Erro: extra/main.py não encontrado.")
             return
         subprocess.run([sys.executable, "main.py"], cwd="extra")
-        pygame.display.set_mode((SCREEN_W, SCREEN_H), DOUBLEBUF | OPENGL)
+        open_window(vsync)
         glEnable(GL_DEPTH_TEST)
         glEnable(GL_TEXTURE_2D)
     except Exception as e:
         print(f"Erro ao iniciar Extras: {e}")
 
+class EntityPool:
+    # Entidades em colunas NumPy pré-alocadas; posições livres ficam numa pilha.
+    # Cada grupo (lado da pista) guarda seus índices ordenados por z, da frente para trás.
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.pos = np.zeros((0, 3), np.float32)
+        self.prev_pos = np.zeros((0, 3), np.float32)
+        self.kind = np.zeros(0, np.int8)
+        self.size = np.zeros(0, np.float32)
+        self.rot = np.zeros(0, np.float32)
+        self.prev_rot = np.zeros(0, np.float32)
+        self.alive = np.zeros(0, bool)
+        # Id que não se repete quando uma posição é reaproveitada; é ele que identifica a entidade na rede
+        self.uid = np.zeros(0, np.int64)
+        self.next_uid = 1
+        self.free = np.zeros(0, np.int32)
+        self.free_top = 0
+        self.count = 0
+        self.lanes = ([], [])
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        # Só é chamado com a pilha de livres vazia
+        old = self.capacity
+        extra = capacity - old
+        self.pos = np.concatenate([self.pos, np.zeros((extra, 3), np.float32)])
+        self.prev_pos = np.concatenate([self.prev_pos, np.zeros((extra, 3), np.float32)])
+        self.kind = np.concatenate([self.kind, np.zeros(extra, np.int8)])
+        self.size = np.concatenate([self.size, np.zeros(extra, np.float32)])
+        self.rot = np.concatenate([self.rot, np.zeros(extra, np.float32)])
+        self.prev_rot = np.concatenate([self.prev_rot, np.zeros(extra, np.float32)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, bool)])
+        self.uid = np.concatenate([self.uid, np.zeros(extra, np.int64)])
+        self.free = np.empty(capacity, np.int32)
+        self.free[:extra] = np.arange(capacity - 1, old - 1, -1)
+        self.free_top = extra
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, x, y, z, kind, size, group=0):
+        if self.free_top == 0: self._grow(self.capacity * 2)
+        self.free_top -= 1
+        i = self.free[self.free_top]
+        self.pos[i] = self.prev_pos[i] = (x, y, z)
+        self.kind[i] = kind
+        self.size[i] = size
+        self.rot[i] = self.prev_rot[i] = 0.0
+        self.alive[i] = True
+        self.uid[i] = self.next_uid
+        self.next_uid += 1
+        self.count += 1
+        # Entidades novas nascem no fundo da pista, então a busca começa pelo fim
+        lane = self.lanes[group]
+        j = len(lane)
+        while j > 0 and self.pos[lane[j - 1], 2] < z: j -= 1
+        lane.insert(j, i)
+        return i
+
+    def front_count(self, group, z_min):
+        # Todos do grupo andam juntos, então a ordem por z se mantém e quem tem
+        # z >= z_min forma um prefixo da fila
+        lane = self.lanes[group]; z = self.pos[:, 2]
+        k = 0
+        while k < len(lane) and z[lane[k]] >= z_min: k += 1
+        return k
+
+    def front(self, group, k):
+        return np.array(self.lanes[group][:k], np.int32)
+
+    def kill_front(self, group, front, dead):
+        lane = self.lanes[group]
+        lane[:len(front)] = front[~dead].tolist()
+        self._release(front[dead])
+
+    def remove(self, indices):
+        # Fora da ordem das pistas (o cliente de rede apaga o que sumiu do snapshot)
+        gone = set(indices.tolist())
+        for lane in self.lanes: lane[:] = [i for i in lane if i not in gone]
+        self._release(indices)
+
+    def _release(self, indices):
+        n = len(indices)
+        if not n: return
+        self.alive[indices] = False
+        self.free[self.free_top:self.free_top + n] = indices
+        self.free_top += n
+        self.count -= n
+
+    def active(self):
+        return np.flatnonzero(self.alive)
+
+    def save_previous(self):
+        np.copyto(self.prev_pos, self.pos)
+        np.copyto(self.prev_rot, self.rot)
+
+    def lerp_pos(self, indices, alpha):
+        prev = self.prev_pos[indices]
+        return prev + (self.pos[indices] - prev) * alpha
+
+    def lerp_rot(self, indices, alpha):
+        prev = self.prev_rot[indices]
+        return prev + (self.rot[indices] - prev) * alpha
+
+    def clear(self):
+        self.lanes[0].clear(); self.lanes[1].clear()
+        self._release(self.active())
+
+class ParticleSystem:
+    # Buffer circular de capacidade fixa: emitir sobrescreve as partículas mais
+    # antigas e a atualização/desenho sempre percorrem o buffer inteiro
+    def __init__(self, capacity=PARTICLE_CAPACITY):
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 3), np.float32)
+        self.vel = np.zeros((capacity, 3), np.float32)
+        self.color = np.zeros((capacity, 4), np.float32)
+        self.life = np.ones(capacity, np.float32)
+        self.age = self.life.copy()
+        self.head = 0
+        self.alive_count = 0
+        # Se for uma lista, cada explosão emitida é anotada nela (o servidor de rede as repassa aos clientes)
+        self.log = None
+
+    def emit(self, origin, color, count=BURST_SIZE, speed=4.0, life=0.6):
+        if self.log is not None: self.log.append((tuple(map(float, origin)), color, count, speed, life))
+        count = min(count, self.capacity)
+        slots = (self.head + np.arange(count)) % self.capacity
+        self.head = (self.head + count) % self.capacity
+        direction = np.random.normal(size=(count, 3)).astype(np.float32)
+        direction /= np.linalg.norm(direction, axis=1, keepdims=True) + 1e-6
+        self.pos[slots] = origin
+        self.vel[slots] = direction * (speed * np.random.uniform(0.3, 1.0, (count, 1)))
+        self.color[slots, :3] = color
+        self.color[slots, 3] = 1.0
+        self.age[slots] = 0.0
+        self.life[slots] = life * np.random.uniform(0.6, 1.0, count)
+        self.alive_count = min(self.alive_count + count, self.capacity)
+
+    def update(self, dt):
+        if not self.alive_count: return
+        self.age += dt
+        self.pos += self.vel * dt
+        self.vel *= max(0.0, 1.0 - 2.0 * dt)
+        np.clip(1.0 - self.age / self.life, 0.0, 1.0, out=self.color[:, 3])
+        self.alive_count = int(np.count_nonzero(self.color[:, 3]))
+
+    def clear(self):
+        self.age[:] = self.life
+        self.color[:, 3] = 0.0
+        self.alive_count = 0
+
 @dataclass
 class PlayerState:
     x: float = COLS / 2
@@ -103,6 +292,10 @@ class PlayerState:
     score: int = 0
     dead: bool = False
     speed_level: int = 1 
+    prev_x: Optional[float] = None
+
+    def __post_init__(self):
+        if self.prev_x is None: self.prev_x = self.x
 
     def get_speed_factor(self):
         return 1.0 + (self.speed_level - 1) * 0.25
@@ -118,9 +311,10 @@ class GameState:
     cam_pitch: float = 0.0
     cam_yaw: float = 0.0
     
-    stars: List[list] = field(default_factory=list)
-    explosions: List[list] = field(default_factory=list)
-    falling_stars: List[list] = field(default_factory=list) 
+    stars: EntityPool = field(default_factory=EntityPool)
+    explosions: ParticleSystem = field(default_factory=ParticleSystem)
+    falling_stars: np.ndarray = field(default_factory=lambda: np.zeros((0, 4), np.float32))
+    falling_stars_count: int = FALLING_STARS_COUNT
     
     state_id: int = STATE_MENU
     game_mode: int = GAME_MODE_SOLO
@@ -178,10 +372,30 @@ CUBE_FACES = [
     ((0, -1, 0), ((-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, -0.5, 0.5), (-0.5, -0.5, 0.5))),
 ]
 
+def gen_falling_stars(state):
+    # Colunas: x, y, z, velocidade de queda
+    n = state.falling_stars_count
+    stars = np.empty((n, 4), np.float32)
+    stars[:, 0] = np.random.uniform(-25, 35, n)
+    stars[:, 1] = np.random.uniform(-15, 25, n)
+    stars[:, 2] = np.random.uniform(-20, 5, n)
+    stars[:, 3] = np.random.uniform(0.02, 0.15, n)
+    state.falling_stars = stars
+
 class Renderer:
     def __init__(self, state: GameState):
         self.state = state
         self.lists = {}
+        self.models = {}
+        self.batch_colors = {}
+        self.focal_px = SCREEN_H / 2 / math.tan(math.radians(FOV_Y / 2))
+        self.cam_pos = (COLS / 2, 3.0, 12.0)
+        self.gl = GLState()
+        self.text = TextRenderer(gl=self.gl)
+        self.queue = []
+        self.alpha = 1.0
+        self.profiler = None
+        self.pacer = None
 
     def init_gl(self):
         glEnable(GL_DEPTH_TEST)
@@ -204,8 +418,11 @@ class Renderer:
         self.state.snd_life = load_sound("life.WAV")
         self.state.snd_win_music = load_sound("musicaVitoria.wav")
         
-        self._gen_falling_stars()
+        gen_falling_stars(self.state)
         self._compile_lists()
+        self.text.init_gl()
+        # As cargas acima ligam texturas direto no driver
+        self.gl.invalidate()
         self.resize(SCREEN_W, SCREEN_H)
 
     def resize(self, w, h):
@@ -213,14 +430,10 @@ class Renderer:
         glViewport(0, 0, w, h)
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
-        gluPerspective(60, w / h, 0.1, 200.0) 
+        gluPerspective(FOV_Y, w / h, 0.1, 200.0)
+        self.focal_px = h / 2 / math.tan(math.radians(FOV_Y / 2))
         glMatrixMode(GL_MODELVIEW)
 
-    def _gen_falling_stars(self):
-        self.state.falling_stars = []
-        for _ in range(200):
-            self.state.falling_stars.append([random.uniform(-25, 35), random.uniform(-15, 25), random.uniform(-20, 5), random.uniform(0.02, 0.15)])
-
     def _emit_cube(self):
         glBegin(GL_QUADS)
         for n, f in CUBE_FACES:
@@ -237,13 +450,10 @@ class Renderer:
         glTexCoord2f(0, 1); glVertex3f(-0.5,  0.5, 0)
         glEnd()
 
-    def _draw_text_centered(self, text, y_pos, font=GLUT_BITMAP_HELVETICA_18):
-        char_width = 9 
-        if font == GLUT_BITMAP_TIMES_ROMAN_24: char_width = 14
-        width = len(text) * char_width
-        x = (SCREEN_W - width) / 2
-        glRasterPos2f(x, y_pos)
-        for c in text: glutBitmapCharacter(font, ord(c))
+    def _draw_text_centered(self, text, y_pos, font=FONT_MEDIUM, color=(1, 1, 1)):
+        width, _ = self.text.measure(text, font)
+        x = (SCREEN_W - width) // 2
+        self.text.draw(text, x, y_pos, font, color)
 
     def _compile_lists(self):
         sid = glGenLists(1)
@@ -265,46 +475,78 @@ class Renderer:
         glEndList()
         self.lists['ship'] = sid
 
-        eid = glGenLists(1)
-        glNewList(eid, GL_COMPILE)
-        glColor3f(0.2, 1.0, 0.2)
-        glPushMatrix()
-        glScalef(0.4, 0.35, 0.35)
-        gluSphere(gluNewQuadric(), 1.0, 16, 16)
-        glPopMatrix()
-        glColor3f(0.0, 0.0, 0.0)
-        glPushMatrix(); glTranslatef(-0.15, 0.05, 0.25); glRotatef(-20, 0, 1, 0); glScalef(0.12, 0.08, 0.05); gluSphere(gluNewQuadric(), 1.0, 10, 10); glPopMatrix()
-        glPushMatrix(); glTranslatef(0.15, 0.05, 0.25); glRotatef(20, 0, 1, 0); glScalef(0.12, 0.08, 0.05); gluSphere(gluNewQuadric(), 1.0, 10, 10); glPopMatrix()
-        glColor3f(0.2, 0.8, 0.2)
-        glPushMatrix(); glTranslatef(0, -0.5, 0); glRotatef(-90, 1, 0, 0); gluCylinder(gluNewQuadric(), 0.1, 0.2, 0.5, 10, 1); glPopMatrix()
-        glEndList()
-        self.lists['et_3d'] = eid
-
-        cid = glGenLists(1)
-        glNewList(cid, GL_COMPILE)
-        glColor3f(1.0, 0.84, 0.0)
-        glPushMatrix()
-        gluCylinder(gluNewQuadric(), 0.35, 0.35, 0.1, 20, 1)
-        glPopMatrix()
-        gluDisk(gluNewQuadric(), 0, 0.35, 20, 1)
-        glPushMatrix()
-        glTranslatef(0, 0, 0.1)
-        gluDisk(gluNewQuadric(), 0, 0.35, 20, 1)
-        glPopMatrix()
+        # Esfera unitária pré-compilada em cada nível de detalhe (sol e terra)
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_NORMAL_ARRAY); glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        for seg, _ in SPHERE_LODS:
+            m = meshes.sphere(1.0, seg, seg)
+            lid = glGenLists(1)
+            glVertexPointer(3, GL_FLOAT, 0, m.verts); glNormalPointer(GL_FLOAT, 0, m.normals); glTexCoordPointer(2, GL_FLOAT, 0, m.texcoords)
+            glNewList(lid, GL_COMPILE)
+            glDrawArrays(GL_TRIANGLES, 0, m.count)
+            glEndList()
+            self.lists[('sphere', seg)] = lid
+
+        # Céu com os polos no eixo y, visto de dentro
+        sky = meshes.transformed(meshes.sphere(SKY_RADIUS, 48, 24), rotate=(-90, (1, 0, 0)))
+        # Meio ladrilho de deslocamento: a visão inicial (-z) cai no centro de uma cópia inteira da imagem
+        sky_uv = sky.texcoords * np.array(SKY_TEX_REPEAT, np.float32) + np.array([0.5, 0.0], np.float32)
+        if self.state.galaxy_texture:
+            # A imagem não emenda consigo mesma; espelhada, as bordas coincidem
+            glBindTexture(GL_TEXTURE_2D, self.state.galaxy_texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_MIRRORED_REPEAT)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_MIRRORED_REPEAT)
+        glVertexPointer(3, GL_FLOAT, 0, sky.verts); glNormalPointer(GL_FLOAT, 0, sky.normals); glTexCoordPointer(2, GL_FLOAT, 0, sky_uv)
+        lid = glGenLists(1)
+        glNewList(lid, GL_COMPILE)
+        if self.state.galaxy_texture: glColor3f(1, 1, 1)
+        else: glColor3f(0.1, 0.1, 0.2)
+        glDrawArrays(GL_TRIANGLES, 0, sky.count)
         glEndList()
-        self.lists['coin_3d'] = cid
-
-    def draw(self):
+        self.lists['sky'] = lid
+        self.sky_material = Material(False, False, False, self.state.galaxy_texture or 0)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY); glDisableClientState(GL_NORMAL_ARRAY); glDisableClientState(GL_VERTEX_ARRAY)
+
+        # Modelos das entidades ficam em arrays para o desenho em lote, um por nível de detalhe
+        for seg, _ in SPHERE_LODS:
+            body = meshes.sphere(1.0, min(seg, 16), min(seg, 16))
+            eye_seg = max(4, min(seg, 16) * 5 // 8)
+            eye = meshes.sphere(1.0, eye_seg, eye_seg)
+            self.models[('et_3d', seg)] = meshes.merge(
+                meshes.transformed(body, scale=(0.4, 0.35, 0.35), color=(0.2, 1.0, 0.2)),
+                meshes.transformed(eye, translate=(-0.15, 0.05, 0.25), rotate=(-20, (0, 1, 0)), scale=(0.12, 0.08, 0.05), color=(0.0, 0.0, 0.0)),
+                meshes.transformed(eye, translate=(0.15, 0.05, 0.25), rotate=(20, (0, 1, 0)), scale=(0.12, 0.08, 0.05), color=(0.0, 0.0, 0.0)),
+                meshes.transformed(meshes.cylinder(0.1, 0.2, 0.5, max(4, min(seg, 10))), translate=(0, -0.5, 0), rotate=(-90, (1, 0, 0)), color=(0.2, 0.8, 0.2)),
+            )
+        gold = (1.0, 0.84, 0.0)
+        self.models['coin_3d'] = meshes.merge(
+            meshes.transformed(meshes.cylinder(0.35, 0.35, 0.1, 20), color=gold),
+            meshes.transformed(meshes.disk(0.35, 20), color=gold),
+            meshes.transformed(meshes.disk(0.35, 20), translate=(0, 0, 0.1), color=gold),
+        )
+
+    def _submit(self, material, fn, *args):
+        self.queue.append((material, fn, args))
+
+    def _flush_queue(self):
+        # Ordena por estado/material para trocar o mínimo de estado entre desenhos
+        self.queue.sort(key=lambda d: d[0])
+        for material, fn, args in self.queue:
+            self.gl.apply(material)
+            fn(*args)
+        self.queue.clear()
+
+    def draw(self, alpha=1.0):
+        # alpha: fração do passo de simulação já decorrida, para interpolar posições
+        self.alpha = alpha
+        self.gl.depth_mask(True)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
         st = self.state
         
-        if st.state_id not in [STATE_MENU, STATE_DIFFICULTY_SELECT]:
-            self._draw_galaxy_bg()
-
         if st.state_id in [STATE_MENU, STATE_DIFFICULTY_SELECT]:
             gluLookAt(0, 0, 25, 0, 0, 0, 0, 1, 0)
-            self._draw_falling_stars()
+            self._submit(Material(False, True, False, 0), self._draw_falling_stars)
+            self._flush_queue()
             self._draw_menu_ui()
         else:
             center_x = COLS / 2
@@ -320,40 +562,31 @@ class Renderer:
             cam_pos_y = st.camera_y
             cam_pos_z = st.camera_z
             
-            gluLookAt(cam_pos_x, cam_pos_y, cam_pos_z, 
-                      cam_pos_x + look_x, cam_pos_y + look_y, cam_pos_z + look_z, 
-                      0, 1, 0)
+            # Só a rotação da câmera para o céu; a translação depois completa a mesma matriz do gluLookAt
+            gluLookAt(0, 0, 0, look_x, look_y, look_z, 0, 1, 0)
+            self._draw_galaxy_bg()
+            glTranslatef(-cam_pos_x, -cam_pos_y, -cam_pos_z)
+            self.cam_pos = (cam_pos_x, cam_pos_y, cam_pos_z)
             
             glLightfv(GL_LIGHT0, GL_POSITION, [center_x, 20.0, 5.0, 1.0])
             
-            self._draw_falling_stars()
-            self._draw_sun()
-            self._draw_earth_ingame(center_x)
+            unlit = Material(False, True, False, 0)
+            lit = Material(False, True, True, 0)
+            self._submit(unlit, self._draw_falling_stars)
+            self._submit(Material(False, True, False, st.sun_texture or 0), self._draw_sun)
+            self._submit(Material(False, True, True, st.earth_texture or 0), self._draw_earth_ingame, center_x)
             
             if st.game_mode == GAME_MODE_MULTI:
-                self._draw_separator()
+                self._submit(unlit, self._draw_separator)
 
             if st.p1.active and not st.p1.dead:
-                self._draw_ship(st.p1, (0.4, 0.6, 1.0))
+                self._submit(lit, self._draw_ship, st.p1, (0.4, 0.6, 1.0))
             if st.p2.active and not st.p2.dead:
-                self._draw_ship(st.p2, (1.0, 0.6, 0.4))
+                self._submit(lit, self._draw_ship, st.p2, (1.0, 0.6, 0.4))
                 
-            for s in st.stars:
-                glPushMatrix()
-                glTranslatef(s[0], s[1], s[2])
-                glRotatef(s[9], 0.0, 0.0, 1.0)
-                glRotatef(s[9]*0.5, 0.0, 1.0, 0.0)
-                sz = s[4]
-                glScalef(sz, sz, sz)
-                if s[3] == 'enemy':
-                    if self.lists.get('et_3d'): glCallList(self.lists['et_3d'])
-                    else: self._emit_cube()
-                elif s[3] == 'pickup':
-                    if self.lists.get('coin_3d'): glCallList(self.lists['coin_3d'])
-                    else: self._emit_cube()
-                glPopMatrix()
-            
-            self._draw_explosions()
+            self._submit(lit, self._draw_entities)
+            self._submit(Material(True, True, False, 0), self._draw_explosions)
+            self._flush_queue()
             self._draw_hud()
             
             if st.state_id == STATE_PAUSED:
@@ -367,70 +600,125 @@ class Renderer:
                     elif st.p2.score > st.p1.score: win_text = "JOGADOR 2 VENCEU!"
                     else: win_text = "EMPATE!"
                 self._draw_end_screen(win_text, (0.2, 1.0, 0.2), "JOGAR NOVAMENTE", "MENU PRINCIPAL")
+            elif st.state_id == STATE_WAITING:
+                self._draw_overlay("AGUARDANDO JOGADORES", [], 0)
+
+        if self.profiler and self.profiler.enabled:
+            self._draw_profiler()
+
+    def _draw_profiler(self):
+        self._setup_2d()
+        lines = self.profiler.overlay_lines()
+        pace = self.pacer.stats() if self.pacer else None
+        if pace:
+            lines = lines + [f"ritmo {pace['mode']:<8} {pace['fps']:5.1f} q/s  jitter {pace['jitter_ms']:5.2f} ms  "
+                             f"p99 {pace['p99_ms']:5.1f} ms  atrasados {pace['late']}  ocupado {pace['busy']:.0%}"]
+        top = SCREEN_H - 10 - (len(lines) - 1) * 16
+        for i, line in enumerate(lines):
+            self.text.draw(line, 10, top + i * 16, FONT_SMALL, (1.0, 1.0, 0.3))
+        self._teardown_2d()
+
+    def _draw_entities(self):
+        pool = self.state.stars
+        if not len(pool): return
+        idx = pool.active()
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_NORMAL_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
+        enemies = idx[pool.kind[idx] == ENTITY_ENEMY]
+        if len(enemies):
+            pos = pool.lerp_pos(enemies, self.alpha)
+            rot = pool.lerp_rot(enemies, self.alpha)
+            size = pool.size[enemies]
+            dist = np.linalg.norm(pos - np.asarray(self.cam_pos, np.float32), axis=1)
+            levels = self._sphere_lods(0.4 * size, dist)
+            for seg, _ in SPHERE_LODS:
+                sel = levels == seg
+                if sel.any(): self._draw_batch(('et_3d', seg), pos[sel], rot[sel], size[sel])
+        coins = idx[pool.kind[idx] == ENTITY_PICKUP]
+        if len(coins): self._draw_batch('coin_3d', pool.lerp_pos(coins, self.alpha), pool.lerp_rot(coins, self.alpha), pool.size[coins])
+        glDisableClientState(GL_COLOR_ARRAY); glDisableClientState(GL_NORMAL_ARRAY); glDisableClientState(GL_VERTEX_ARRAY)
+
+    def _sphere_lods(self, radius, dist):
+        # Raio projetado na tela (pixels) -> segmentos do nível de detalhe
+        r = np.asarray(radius, np.float32); d = np.asarray(dist, np.float32)
+        px = self.focal_px * r / np.sqrt(np.maximum(d * d - r * r, 1e-6))
+        levels = np.full(px.shape, SPHERE_LODS[-1][0])
+        for seg, min_px in reversed(SPHERE_LODS):
+            levels[px >= min_px] = seg
+        return levels
+
+    def _draw_sphere(self, center, radius):
+        seg = int(self._sphere_lods(radius, math.dist(center, self.cam_pos)))
+        glScalef(radius, radius, radius)
+        self.gl.enable(GL_RESCALE_NORMAL)
+        glCallList(self.lists[('sphere', seg)])
+
+    def _draw_batch(self, name, positions, angles, sizes):
+        mesh = self.models[name]
+        verts, normals = meshes.instance_arrays(mesh, positions, angles, sizes)
+        colors = self.batch_colors.get(name)
+        if colors is None or len(colors) < len(verts):
+            # Cresce em potências de 2 para não realocar a cada quadro
+            cap = 1
+            while cap * mesh.count < len(verts): cap *= 2
+            colors = self.batch_colors[name] = np.tile(mesh.colors, (cap, 1))
+        glVertexPointer(3, GL_FLOAT, 0, verts)
+        glNormalPointer(GL_FLOAT, 0, normals)
+        glColorPointer(3, GL_FLOAT, 0, colors)
+        glDrawArrays(GL_TRIANGLES, 0, len(verts))
 
     def _draw_separator(self):
-        glDisable(GL_LIGHTING)
-        glDisable(GL_TEXTURE_2D)
         glColor3f(1, 1, 1)
         glLineWidth(2.0)
         glBegin(GL_LINES)
         glVertex3f(COLS/2, 0, 5)
         glVertex3f(COLS/2, 0, -100)
         glEnd()
-        glEnable(GL_LIGHTING)
 
     def _draw_galaxy_bg(self):
-        glMatrixMode(GL_PROJECTION); glPushMatrix(); glLoadIdentity(); glOrtho(0, 1, 0, 1, -1, 1)
-        glMatrixMode(GL_MODELVIEW); glPushMatrix(); glLoadIdentity()
-        glDisable(GL_DEPTH_TEST); glDisable(GL_LIGHTING); glEnable(GL_TEXTURE_2D)
-        if self.state.galaxy_texture: glBindTexture(GL_TEXTURE_2D, self.state.galaxy_texture); glColor3f(1, 1, 1)
-        else: glColor3f(0.1, 0.1, 0.2)
-        glBegin(GL_QUADS); glTexCoord2f(0,0); glVertex2f(0, 0); glTexCoord2f(1,0); glVertex2f(1, 0); glTexCoord2f(1,1); glVertex2f(1, 1); glTexCoord2f(0,1); glVertex2f(0, 1); glEnd()
-        glEnable(GL_LIGHTING); glEnable(GL_DEPTH_TEST)
-        glPopMatrix(); glMatrixMode(GL_PROJECTION); glPopMatrix(); glMatrixMode(GL_MODELVIEW)
+        # Desenhado antes de tudo e sem teste de profundidade, por isso fica fora da fila
+        self.gl.apply(self.sky_material)
+        glCallList(self.lists['sky'])
 
     def _draw_falling_stars(self):
-        glDisable(GL_LIGHTING); glDisable(GL_TEXTURE_2D); glPointSize(2); glBegin(GL_POINTS); glColor3f(1, 1, 1)
-        for s in self.state.falling_stars: glVertex3f(s[0], s[1], s[2])
-        glEnd(); glEnable(GL_LIGHTING)
+        stars = self.state.falling_stars
+        if not len(stars): return
+        self.gl.point_size(2); glColor3f(1, 1, 1)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stars.strides[0], stars)
+        glDrawArrays(GL_POINTS, 0, len(stars))
+        glDisableClientState(GL_VERTEX_ARRAY)
 
     def _draw_sun(self):
-        glEnable(GL_TEXTURE_2D)
-        if self.state.sun_texture:
-            glBindTexture(GL_TEXTURE_2D, self.state.sun_texture)
-        else:
-            glDisable(GL_TEXTURE_2D)
         glPushMatrix()
         glTranslatef(COLS/2, 50, -20) 
         glRotatef(self.state.moon_angle * 0.5, 0, 1, 0)
         glColor3f(1, 1, 1)
-        glDisable(GL_LIGHTING) 
-        quad = gluNewQuadric()
-        gluQuadricTexture(quad, GL_TRUE)
-        gluSphere(quad, 20, 40, 40)
-        glEnable(GL_LIGHTING)
+        self._draw_sphere((COLS/2, 50, -20), 20)
         glPopMatrix()
-        glDisable(GL_TEXTURE_2D)
 
     def _draw_ship(self, p, color):
-        glDisable(GL_TEXTURE_2D); glPushMatrix(); glTranslatef(p.x, 0.2, p.z); glColor3f(*color)
+        x = p.prev_x + (p.x - p.prev_x) * self.alpha
+        self.gl.disable(GL_RESCALE_NORMAL); glPushMatrix(); glTranslatef(x, 0.2, p.z); glColor3f(*color)
         if self.lists.get('ship'): glCallList(self.lists['ship'])
         glPopMatrix()
 
     def _draw_earth_ingame(self, cam_x):
-        glEnable(GL_TEXTURE_2D)
-        if self.state.earth_texture: glBindTexture(GL_TEXTURE_2D, self.state.earth_texture)
-        else: glDisable(GL_TEXTURE_2D)
         glPushMatrix(); glTranslatef(cam_x, -95, 20); glRotatef(self.state.moon_angle, 0, 1, 0)
-        glColor3f(1,1,1); q = gluNewQuadric(); gluQuadricTexture(q, GL_TRUE); gluSphere(q, 90, 50, 50)
-        glPopMatrix(); glDisable(GL_TEXTURE_2D)
+        glColor3f(1,1,1); self._draw_sphere((cam_x, -95, 20), 90)
+        glPopMatrix()
 
     def _draw_explosions(self):
-        glDisable(GL_LIGHTING); glDisable(GL_TEXTURE_2D); glEnable(GL_BLEND); glBlendFunc(GL_SRC_ALPHA, GL_ONE)
-        for e in self.state.explosions:
-            alpha = 1.0 - (e[4]/e[5]); glColor4f(1, 0.8, 0.3, alpha)
-            glPushMatrix(); glTranslatef(e[0],e[1],e[2]); glScalef(e[3]+e[4]*2, e[3]+e[4]*2, e[3]+e[4]*2); self._emit_cube(); glPopMatrix()
-        glDisable(GL_BLEND); glEnable(GL_LIGHTING)
+        ps = self.state.explosions
+        if not ps.alive_count: return
+        # Partículas mortas têm alpha 0 e não somam nada com a mistura aditiva
+        self.gl.blend_func(GL_SRC_ALPHA, GL_ONE)
+        self.gl.point_size(PARTICLE_SIZE); glPointParameterfv(GL_POINT_DISTANCE_ATTENUATION, (0.0, 0.05, 0.0))
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, ps.pos)
+        glColorPointer(4, GL_FLOAT, 0, ps.color)
+        glDrawArrays(GL_POINTS, 0, ps.capacity)
+        glDisableClientState(GL_COLOR_ARRAY); glDisableClientState(GL_VERTEX_ARRAY)
+        glPointParameterfv(GL_POINT_DISTANCE_ATTENUATION, (1.0, 0.0, 0.0))
 
     def _draw_menu_ui(self):
         self._setup_2d()
@@ -445,87 +733,79 @@ class Renderer:
             opts = ["Facil", "Normal", "Dificil", "Dante Must Die"]
             sel = self.state.difficulty_selection
 
-        glColor3f(0.3, 0.7, 1.0)
-        self._draw_text_centered(title, 150, GLUT_BITMAP_TIMES_ROMAN_24)
+        self._draw_text_centered(title, 150, FONT_TITLE, (0.3, 0.7, 1.0))
         
         # Centralização Vertical
         total_h = len(opts) * 40
         start_y = (SCREEN_H - total_h) / 2 + 50
         
         for i, opt in enumerate(opts):
-            if i == sel: glColor3f(0.8, 0.2, 1.0) 
-            else: glColor3f(0.7, 0.7, 0.7)
+            color = (0.8, 0.2, 1.0) if i == sel else (0.7, 0.7, 0.7)
             
             # Centralização Horizontal
-            self._draw_text_centered(opt, start_y + i * 40)
+            self._draw_text_centered(opt, start_y + i * 40, color=color)
             
         self._teardown_2d()
 
     def _draw_end_screen(self, title_text, title_color, opt1, opt2):
         self._setup_2d()
-        glEnable(GL_BLEND); glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA); glColor4f(0,0,0,0.85)
-        glBegin(GL_QUADS); glVertex2f(0,0); glVertex2f(SCREEN_W,0); glVertex2f(SCREEN_W, SCREEN_H); glVertex2f(0, SCREEN_H); glEnd(); glDisable(GL_BLEND)
-        glColor3f(*title_color)
-        self._draw_text_centered(title_text, SCREEN_H/2 - 80, GLUT_BITMAP_TIMES_ROMAN_24)
+        self._draw_dim(0.85)
+        self._draw_text_centered(title_text, SCREEN_H/2 - 80, FONT_TITLE, title_color)
         st = self.state
         score_txt = f"P1: {st.p1.score}" + (f"  P2: {st.p2.score}" if st.game_mode == GAME_MODE_MULTI else "")
-        glColor3f(1, 1, 1)
         self._draw_text_centered(score_txt, SCREEN_H/2 - 40)
         sel = st.end_screen_selection
-        if sel == 0: glColor3f(0.8, 0.2, 1.0)
-        else: glColor3f(0.5, 0.5, 0.5)
-        self._draw_text_centered(opt1, SCREEN_H/2 + 30)
-        if sel == 1: glColor3f(0.8, 0.2, 1.0)
-        else: glColor3f(0.5, 0.5, 0.5)
-        self._draw_text_centered(opt2, SCREEN_H/2 + 70)
+        self._draw_text_centered(opt1, SCREEN_H/2 + 30, color=(0.8, 0.2, 1.0) if sel == 0 else (0.5, 0.5, 0.5))
+        self._draw_text_centered(opt2, SCREEN_H/2 + 70, color=(0.8, 0.2, 1.0) if sel == 1 else (0.5, 0.5, 0.5))
         self._teardown_2d()
 
     def _draw_overlay(self, title, options, selection):
         self._setup_2d()
-        glEnable(GL_BLEND); glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA); glColor4f(0,0,0,0.7)
-        glBegin(GL_QUADS); glVertex2f(0,0); glVertex2f(SCREEN_W,0); glVertex2f(SCREEN_W, SCREEN_H); glVertex2f(0, SCREEN_H); glEnd()
-        glColor3f(1,1,1)
-        self._draw_text_centered(title, SCREEN_H/2 - 60, GLUT_BITMAP_TIMES_ROMAN_24)
+        self._draw_dim(0.7)
+        self._draw_text_centered(title, SCREEN_H/2 - 60, FONT_TITLE)
         
         total_h = len(options) * 40
         start_y = (SCREEN_H - total_h) / 2 + 30
         
         for i, opt in enumerate(options):
-            if i == selection: glColor3f(0.8, 0.2, 1.0)
-            else: glColor3f(0.5, 0.5, 0.5)
-            self._draw_text_centered(opt, start_y + i*40)
+            self._draw_text_centered(opt, start_y + i*40, color=(0.8, 0.2, 1.0) if i == selection else (0.5, 0.5, 0.5))
         self._teardown_2d()
 
+    def _draw_dim(self, alpha):
+        gl = self.gl
+        gl.disable(GL_TEXTURE_2D); gl.enable(GL_BLEND); gl.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA); glColor4f(0,0,0,alpha)
+        glBegin(GL_QUADS); glVertex2f(0,0); glVertex2f(SCREEN_W,0); glVertex2f(SCREEN_W, SCREEN_H); glVertex2f(0, SCREEN_H); glEnd()
+
     def _draw_hud(self):
         self._setup_2d(); st = self.state
         if st.p1.active and not st.p1.dead: self._draw_player_hud(20, st.p1, (0.4, 0.6, 1.0), "P1")
         if st.p2.active and not st.p2.dead: self._draw_player_hud(SCREEN_W - 160, st.p2, (1.0, 0.6, 0.4), "P2")
-        glColor3f(1,1,1); time_left = max(0, int(st.max_time - st.time_elapsed))
+        time_left = max(0, int(st.max_time - st.time_elapsed))
         txt = f"Tempo: {time_left}s"
         self._draw_text_centered(txt, 40)
         self._teardown_2d()
 
     def _draw_player_hud(self, x, p, color, label):
         if self.state.life_texture:
-            glEnable(GL_TEXTURE_2D); glBindTexture(GL_TEXTURE_2D, self.state.life_texture); glColor3f(1,1,1)
+            gl = self.gl
+            gl.disable(GL_BLEND); gl.enable(GL_TEXTURE_2D); gl.bind_texture(self.state.life_texture); glColor3f(1,1,1)
+            glBegin(GL_QUADS)
             for i in range(p.lives):
                 xp = x + i * 25
-                glBegin(GL_QUADS); glTexCoord2f(0,0); glVertex2f(xp, 20); glTexCoord2f(1,0); glVertex2f(xp+20, 20); glTexCoord2f(1,1); glVertex2f(xp+20, 40); glTexCoord2f(0,1); glVertex2f(xp, 40); glEnd()
-            glDisable(GL_TEXTURE_2D)
+                glTexCoord2f(0,0); glVertex2f(xp, 20); glTexCoord2f(1,0); glVertex2f(xp+20, 20); glTexCoord2f(1,1); glVertex2f(xp+20, 40); glTexCoord2f(0,1); glVertex2f(xp, 40)
+            glEnd()
         else:
-            glColor3f(*color); glRasterPos2f(x, 40); s = f"Lives: {p.lives}"
-            for c in s: glutBitmapCharacter(GLUT_BITMAP_HELVETICA_18, ord(c))
-        glColor3f(1,1,1); glRasterPos2f(x, 60)
-        for c in f"{label} Score: {p.score}": glutBitmapCharacter(GLUT_BITMAP_HELVETICA_12, ord(c))
-        glColor3f(0.5, 0.8, 1.0); glRasterPos2f(x, 80)
-        for c in f"Speed: {p.speed_level}": glutBitmapCharacter(GLUT_BITMAP_HELVETICA_12, ord(c))
+            self.text.draw(f"Lives: {p.lives}", x, 40, FONT_MEDIUM, color)
+        self.text.draw(f"{label} Score: {p.score}", x, 60, FONT_SMALL)
+        self.text.draw(f"Speed: {p.speed_level}", x, 80, FONT_SMALL, (0.5, 0.8, 1.0))
 
     def _setup_2d(self):
         glMatrixMode(GL_PROJECTION); glPushMatrix(); glLoadIdentity(); glOrtho(0, SCREEN_W, SCREEN_H, 0, -1, 1)
-        glMatrixMode(GL_MODELVIEW); glPushMatrix(); glLoadIdentity(); glDisable(GL_LIGHTING); glDisable(GL_DEPTH_TEST)
+        glMatrixMode(GL_MODELVIEW); glPushMatrix(); glLoadIdentity(); self.gl.disable(GL_LIGHTING); self.gl.disable(GL_DEPTH_TEST)
 
     def _teardown_2d(self):
-        glEnable(GL_DEPTH_TEST); glEnable(GL_LIGHTING); glMatrixMode(GL_PROJECTION); glPopMatrix(); glMatrixMode(GL_MODELVIEW); glPopMatrix()
+        self.text.flush()
+        glMatrixMode(GL_PROJECTION); glPopMatrix(); glMatrixMode(GL_MODELVIEW); glPopMatrix()
 
 def spawn_entities(state, dt):
     diff = DIFFICULTY_SETTINGS[state.current_difficulty]
@@ -536,7 +816,9 @@ def spawn_entities(state, dt):
         
         def spawn_in_range(min_x, max_x):
             lane = random.uniform(min_x, max_x)
-            state.stars.append([lane, 0, random.uniform(-100, -60), 'pickup' if random.random() < 0.1 else 'enemy', 0.6, 0,0,0, 1, 0])
+            z = random.uniform(-100, -60)
+            group = 1 if state.game_mode == GAME_MODE_MULTI and lane >= COLS/2 else 0
+            state.stars.spawn(lane, 0, z, ENTITY_PICKUP if random.random() < 0.1 else ENTITY_ENEMY, 0.6, group)
 
         for _ in range(count):
             if state.game_mode == GAME_MODE_SOLO:
@@ -548,9 +830,7 @@ def spawn_entities(state, dt):
                      spawn_in_range(0, COLS/2)
                      spawn_in_range(COLS/2, COLS)
 
-def handle_input(state, dt_raw):
-    keys = pygame.key.get_pressed()
-    
+def handle_input(state, dt_raw, keys):
     speed_p1 = 10.0 * dt_raw * state.p1.get_speed_factor()
     max_x_p1 = (COLS/2) - 0.7 if state.game_mode == GAME_MODE_MULTI else COLS
     if state.p1.active and not state.p1.dead:
@@ -563,14 +843,26 @@ def handle_input(state, dt_raw):
         if keys[K_LEFT]: state.p2.x = max(min_x_p2, state.p2.x - speed_p2)
         if keys[K_RIGHT]: state.p2.x = min(COLS, state.p2.x + speed_p2)
 
-def update_game(state, real_dt):
-    for s in state.falling_stars:
-        s[1] -= s[3]
-        if s[1] < -10: s[1], s[0] = 20, random.uniform(-20, 30)
+def update_falling_stars(state, dt):
+    # A velocidade das estrelas era por quadro a 60 FPS; agora é por segundo
+    fs = state.falling_stars
+    fs[:, 1] -= fs[:, 3] * (dt * 60.0)
+    wrap = fs[:, 1] < -10
+    n_wrap = np.count_nonzero(wrap)
+    if n_wrap:
+        fs[wrap, 1] = 20
+        fs[wrap, 0] = np.random.uniform(-20, 30, n_wrap)
+
+def update_game(state, real_dt, keys=None):
+    update_falling_stars(state, real_dt)
+
+    state.stars.save_previous()
+    state.p1.prev_x, state.p2.prev_x = state.p1.x, state.p2.x
 
     if state.state_id != STATE_PLAYING: return
 
-    handle_input(state, real_dt)
+    if keys is None: keys = pygame.key.get_pressed()
+    handle_input(state, real_dt, keys)
     
     state.time_elapsed += real_dt
     if state.time_elapsed >= state.max_time:
@@ -591,141 +883,288 @@ def update_game(state, real_dt):
         if state.snd_gameover: state.snd_gameover.play()
         return
 
-    toremove = []
-    for s in state.stars:
-        current_speed_factor = 1.0
-        if state.game_mode == GAME_MODE_MULTI:
-            if s[0] < COLS/2: current_speed_factor = state.p1.get_speed_factor()
-            else: current_speed_factor = state.p2.get_speed_factor()
+    pool = state.stars
+    idx = pool.active()
+    x = pool.pos[idx, 0]
+    left = x < COLS/2
+    if state.game_mode == GAME_MODE_MULTI:
+        speed_factor = np.where(left, state.p1.get_speed_factor(), state.p2.get_speed_factor())
+    else:
+        speed_factor = state.p1.get_speed_factor()
+    dt_local = real_dt * speed_factor
+    pool.pos[idx, 2] += diff['speed'] * dt_local
+    pool.rot[idx] += 90 * dt_local
+
+    # Fase larga: só o começo da fila de cada grupo, já perto do jogador ou
+    # passando do fim da pista, chega aos testes de colisão
+    for group, p in ((0, state.p1), (1, state.p2)):
+        alive = p.active and not p.dead
+        k = pool.front_count(group, min(p.z - 1.0, 5.0) if alive else 5.0)
+        if not k: continue
+        front = pool.front(group, k)
+        x = pool.pos[front, 0]
+        z = pool.pos[front, 2]
+        is_enemy = pool.kind[front] == ENTITY_ENEMY
+
+        if alive:
+            hit = (np.abs(x - p.x) < 1.2) & (np.abs(z - p.z) < 1.0)
+            n_enemy = int(np.count_nonzero(hit & is_enemy))
+            n_pickup = int(np.count_nonzero(hit)) - n_enemy
+            p.score += n_enemy + 2 * n_pickup
+            if n_enemy and state.snd_item: state.snd_item.play()
+            if n_pickup and state.snd_coin: state.snd_coin.play()
+            for i in front[hit]:
+                color = (0.4, 1.0, 0.3) if pool.kind[i] == ENTITY_ENEMY else (1.0, 0.84, 0.0)
+                state.explosions.emit(pool.pos[i], color)
         else:
-            current_speed_factor = state.p1.get_speed_factor()
+            hit = np.zeros(k, bool)
 
-        dt_local = real_dt * current_speed_factor
-        
-        s[2] += diff['speed'] * dt_local
-        s[9] += 90 * dt_local
-        
-        hit = False
-        target_players = active_players
-        if state.game_mode == GAME_MODE_MULTI:
-            if s[0] < COLS/2: target_players = [state.p1] if state.p1.active and not state.p1.dead else []
-            else: target_players = [state.p2] if state.p2.active and not state.p2.dead else []
-
-        for p in target_players:
-            if abs(s[0] - p.x) < 1.2 and abs(s[2] - p.z) < 1.0:
-                if s[3] == 'enemy':
-                    p.score += 1
-                    if state.snd_item: state.snd_item.play()
-                    toremove.append(s); hit = True
-                elif s[3] == 'pickup':
-                    p.score += 2
-                    if state.snd_coin: state.snd_coin.play()
-                    toremove.append(s); hit = True
-                if hit: break
-        if hit: continue
-        
-        if s[2] > 5.0:
-            if s[3] == 'enemy':
-                victim = None
-                if state.game_mode == GAME_MODE_MULTI:
-                    if s[0] < COLS/2 and state.p1.active and not state.p1.dead: victim = state.p1
-                    elif s[0] >= COLS/2 and state.p2.active and not state.p2.dead: victim = state.p2
-                else:
-                    if state.p1.active and not state.p1.dead: victim = state.p1
-                
-                if victim:
-                    victim.lives -= 1
-                    if victim.lives <= 0: victim.dead = True
-                    if state.snd_life: state.snd_life.play()
-            toremove.append(s)
-
-    for r in toremove:
-        if r in state.stars: state.stars.remove(r)
-    for e in state.explosions: e[4] += real_dt
-    state.explosions = [e for e in state.explosions if e[4] < e[5]]
-
-def main():
-    pygame.init(); pygame.mixer.init()
-    pygame.display.set_mode((SCREEN_W, SCREEN_H), DOUBLEBUF | OPENGL)
-    pygame.display.set_caption("Defensores da Terra")
-    state = GameState(); renderer = Renderer(state); renderer.init_gl()
-    clock = pygame.time.Clock(); running = True
-    
-    mouse_drag = False
+        passed = ~hit & (z > 5.0)
+        if alive:
+            n = int(np.count_nonzero(passed & is_enemy))
+            if n:
+                p.lives = max(p.lives - n, 0)
+                if p.lives <= 0: p.dead = True
+                if state.snd_life: state.snd_life.play()
+                state.explosions.emit((p.x, 0.2, p.z), (1.0, 0.25, 0.2), count=BURST_SIZE * 2, speed=6.0, life=0.9)
 
-    while running:
-        real_dt = clock.tick(60) / 1000.0
-        for event in pygame.event.get():
-            if event.type == QUIT: running = False
-            if event.type == VIDEORESIZE: renderer.resize(event.w, event.h)
-            
-            if event.type == MOUSEBUTTONDOWN and event.button == 1:
-                pygame.mouse.get_rel()
-                mouse_drag = True
-            elif event.type == MOUSEBUTTONUP and event.button == 1:
-                mouse_drag = False
-            elif event.type == MOUSEMOTION and mouse_drag:
-                dx, dy = event.rel
-                state.cam_yaw += dx * 0.3
-                state.cam_pitch -= dy * 0.3
-                state.cam_pitch = max(-89, min(89, state.cam_pitch))
-
-            if event.type == KEYDOWN:
-                if state.state_id == STATE_PLAYING:
-                    if event.key == K_w: state.p1.speed_level = min(5, state.p1.speed_level + 1)
-                    elif event.key == K_s: state.p1.speed_level = max(1, state.p1.speed_level - 1)
-                    
-                    if state.game_mode == GAME_MODE_MULTI:
-                        if event.key == K_UP: state.p2.speed_level = min(5, state.p2.speed_level + 1)
-                        elif event.key == K_DOWN: state.p2.speed_level = max(1, state.p2.speed_level - 1)
-                    
-                    if event.key == K_r:
-                        state.cam_yaw = 0.0
-                        state.cam_pitch = 0.0
-                
-                if state.state_id == STATE_MENU:
-                    if event.key in [K_w, K_UP]: state.menu_selection = (state.menu_selection - 1) % 4
-                    elif event.key in [K_s, K_DOWN]: state.menu_selection = (state.menu_selection + 1) % 4
-                    elif event.key == K_RETURN:
-                        if state.menu_selection == 0: state.game_mode, state.state_id = GAME_MODE_SOLO, STATE_DIFFICULTY_SELECT
-                        elif state.menu_selection == 1: state.game_mode, state.state_id = GAME_MODE_MULTI, STATE_DIFFICULTY_SELECT
-                        elif state.menu_selection == 2: launch_extra_game()
-                        elif state.menu_selection == 3: running = False
-                
-                elif state.state_id == STATE_DIFFICULTY_SELECT:
-                    if event.key in [K_w, K_UP]: state.difficulty_selection = (state.difficulty_selection - 1) % 4
-                    elif event.key in [K_s, K_DOWN]: state.difficulty_selection = (state.difficulty_selection + 1) % 4
-                    elif event.key == K_RETURN:
-                        state.current_difficulty = DIFFICULTY_ORDER[state.difficulty_selection]
-                        state.reset(); state.state_id = STATE_PLAYING
-                    elif event.key == K_ESCAPE: state.state_id = STATE_MENU
-                
-                elif state.state_id == STATE_PLAYING:
-                    if event.key in [K_p, K_ESCAPE]: state.state_id = STATE_PAUSED
-                
-                elif state.state_id == STATE_PAUSED:
-                    if event.key in [K_w, K_UP, K_a, K_LEFT, K_s, K_DOWN, K_d, K_RIGHT]: state.pause_selection = (state.pause_selection - 1) % 3
-                    elif event.key == K_RETURN:
-                        if state.pause_selection == 0: state.state_id = STATE_PLAYING
-                        elif state.pause_selection == 1: 
-                            state.reset()
-                            state.state_id = STATE_PLAYING
-                        else: state.state_id = STATE_MENU
-                        if state.snd_win_music: state.snd_win_music.stop()
-
-                elif state.state_id in [STATE_GAMEOVER, STATE_WIN]:
-                    if event.key in [K_w, K_UP, K_a, K_LEFT, K_s, K_DOWN, K_d, K_RIGHT]: state.end_screen_selection = 1 - state.end_screen_selection
-                    elif event.key == K_RETURN:
-                        if state.snd_win_music: state.snd_win_music.stop()
-                        if state.end_screen_selection == 0: 
-                            state.reset(); state.state_id = STATE_PLAYING
-                        else: 
-                            state.state_id = STATE_MENU
-
-        update_game(state, real_dt)
-        renderer.draw()
-        pygame.display.flip()
+        pool.kill_front(group, front, hit | passed)
+
+    state.explosions.update(real_dt)
+
+NO_KEYS = defaultdict(bool)
+
+PROFILED_SECTIONS = ['draw'] + [n for n in vars(Renderer) if n.startswith('_draw_') and n not in ('_draw_profiler', '_draw_text_centered')]
+
+def run_headless(state, seconds, input_fn=None):
+    # Roda a simulação sem janela nem limite de FPS; devolve ticks por segundo
+    ticks = int(round(seconds / SIM_DT))
+    start = time.perf_counter()
+    for tick in range(ticks):
+        update_game(state, SIM_DT, input_fn(tick) if input_fn else NO_KEYS)
+    elapsed = time.perf_counter() - start
+    return ticks / elapsed if elapsed > 0 else float('inf')
+
+RECORDED_KEYS = (K_a, K_d, K_LEFT, K_RIGHT)
+
+@dataclass
+class LoopState:
+    running: bool = True
+    mouse_drag: bool = False
+    replaying: bool = False
+    accumulator: float = 0.0
+    vsync: bool = False
+
+def handle_view_event(state, loop, event, renderer=None, profiler=None):
+    # O que é só da janela: fechar, redimensionar, girar a câmera e o F3; o cliente de rede trata só isto
+    if event.type == QUIT: loop.running = False
+    if event.type == VIDEORESIZE and renderer: renderer.resize(event.w, event.h)
+
+    if event.type == MOUSEBUTTONDOWN and event.button == 1:
+        pygame.mouse.get_rel()
+        loop.mouse_drag = True
+    elif event.type == MOUSEBUTTONUP and event.button == 1:
+        loop.mouse_drag = False
+    elif event.type == MOUSEMOTION and loop.mouse_drag:
+        dx, dy = event.rel
+        state.cam_yaw += dx * 0.3
+        state.cam_pitch -= dy * 0.3
+        state.cam_pitch = max(-89, min(89, state.cam_pitch))
+
+    if event.type == KEYDOWN and event.key == K_F3 and profiler: profiler.toggle()
+
+def handle_event(state, loop, event, renderer=None, profiler=None):
+    handle_view_event(state, loop, event, renderer, profiler)
+
+    if event.type == KEYDOWN:
+        if state.state_id == STATE_PLAYING:
+            if event.key == K_w: state.p1.speed_level = min(5, state.p1.speed_level + 1)
+            elif event.key == K_s: state.p1.speed_level = max(1, state.p1.speed_level - 1)
+
+            if state.game_mode == GAME_MODE_MULTI:
+                if event.key == K_UP: state.p2.speed_level = min(5, state.p2.speed_level + 1)
+                elif event.key == K_DOWN: state.p2.speed_level = max(1, state.p2.speed_level - 1)
+
+            if event.key == K_r:
+                state.cam_yaw = 0.0
+                state.cam_pitch = 0.0
+
+        if state.state_id == STATE_MENU:
+            if event.key in [K_w, K_UP]: state.menu_selection = (state.menu_selection - 1) % 4
+            elif event.key in [K_s, K_DOWN]: state.menu_selection = (state.menu_selection + 1) % 4
+            elif event.key == K_RETURN:
+                if state.menu_selection == 0: state.game_mode, state.state_id = GAME_MODE_SOLO, STATE_DIFFICULTY_SELECT
+                elif state.menu_selection == 1: state.game_mode, state.state_id = GAME_MODE_MULTI, STATE_DIFFICULTY_SELECT
+                elif state.menu_selection == 2:
+                    if renderer and not loop.replaying: launch_extra_game(loop.vsync); renderer.gl.invalidate()
+                elif state.menu_selection == 3: loop.running = False
+
+        elif state.state_id == STATE_DIFFICULTY_SELECT:
+            if event.key in [K_w, K_UP]: state.difficulty_selection = (state.difficulty_selection - 1) % 4
+            elif event.key in [K_s, K_DOWN]: state.difficulty_selection = (state.difficulty_selection + 1) % 4
+            elif event.key == K_RETURN:
+                state.current_difficulty = DIFFICULTY_ORDER[state.difficulty_selection]
+                state.reset(); state.state_id = STATE_PLAYING
+            elif event.key == K_ESCAPE: state.state_id = STATE_MENU
+
+        elif state.state_id == STATE_PLAYING:
+            if event.key in [K_p, K_ESCAPE]: state.state_id = STATE_PAUSED
+
+        elif state.state_id == STATE_PAUSED:
+            if event.key in [K_w, K_UP, K_a, K_LEFT, K_s, K_DOWN, K_d, K_RIGHT]: state.pause_selection = (state.pause_selection - 1) % 3
+            elif event.key == K_RETURN:
+                if state.pause_selection == 0: state.state_id = STATE_PLAYING
+                elif state.pause_selection == 1: 
+                    state.reset()
+                    state.state_id = STATE_PLAYING
+                else: state.state_id = STATE_MENU
+                if state.snd_win_music: state.snd_win_music.stop()
+
+        elif state.state_id in [STATE_GAMEOVER, STATE_WIN]:
+            if event.key in [K_w, K_UP, K_a, K_LEFT, K_s, K_DOWN, K_d, K_RIGHT]: state.end_screen_selection = 1 - state.end_screen_selection
+            elif event.key == K_RETURN:
+                if state.snd_win_music: state.snd_win_music.stop()
+                if state.end_screen_selection == 0: 
+                    state.reset(); state.state_id = STATE_PLAYING
+                else: 
+                    state.state_id = STATE_MENU
+
+def encode_events(events):
+    # Só os eventos que handle_event usa
+    out = []
+    for e in events:
+        if e.type == QUIT: out.append(['q'])
+        elif e.type == KEYDOWN: out.append(['k', e.key])
+        elif e.type == MOUSEBUTTONDOWN and e.button == 1: out.append(['d'])
+        elif e.type == MOUSEBUTTONUP and e.button == 1: out.append(['u'])
+        elif e.type == MOUSEMOTION: out.append(['m', *e.rel])
+    return out
+
+def decode_events(data):
+    events = []
+    for e in data:
+        if e[0] == 'q': events.append(pygame.event.Event(QUIT))
+        elif e[0] == 'k': events.append(pygame.event.Event(KEYDOWN, key=e[1]))
+        elif e[0] == 'd': events.append(pygame.event.Event(MOUSEBUTTONDOWN, button=1))
+        elif e[0] == 'u': events.append(pygame.event.Event(MOUSEBUTTONUP, button=1))
+        elif e[0] == 'm': events.append(pygame.event.Event(MOUSEMOTION, rel=(e[1], e[2])))
+    return events
+
+def run_frame(state, loop, frame_dt, events, keys, renderer=None, profiler=None):
+    for event in events:
+        handle_event(state, loop, event, renderer, profiler)
+    loop.accumulator += frame_dt
+    while loop.accumulator >= SIM_DT:
+        update_game(state, SIM_DT, keys)
+        loop.accumulator -= SIM_DT
+
+def state_digest(state):
+    # Resumo do estado de jogo, para conferir se uma reprodução chegou ao mesmo lugar que a gravação
+    h = hashlib.sha1()
+    h.update(repr((state.state_id, state.game_mode, state.current_difficulty, state.time_elapsed,
+                   state.p1, state.p2, state.cam_yaw, state.cam_pitch)).encode())
+    idx = state.stars.active()
+    for column in (state.stars.pos, state.stars.kind, state.stars.size, state.stars.rot):
+        h.update(np.ascontiguousarray(column[idx]).tobytes())
+    h.update(state.explosions.pos.tobytes())
+    return h.hexdigest()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Defensores da Terra")
+    parser.add_argument('--record', metavar='ARQUIVO', help="grava a semente e as entradas de cada quadro")
+    parser.add_argument('--replay', metavar='ARQUIVO', help="reproduz uma gravação sem janela")
+    parser.add_argument('--render', action='store_true', help="com --replay, reproduz numa janela, desenhando")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--out', help="com --replay, salva o relatório em JSON")
+    parser.add_argument('--fps', type=int, default=60, help="quadros por segundo durante o jogo (0: sem limite)")
+    parser.add_argument('--vsync', action='store_true', help="sincroniza os quadros com o monitor")
+    parser.add_argument('--idle-fps', type=int, default=30,
+                        help="quadros por segundo em menus e pausa (0: só redesenha quando chega um evento)")
+    parser.add_argument('--stars', type=int, default=FALLING_STARS_COUNT, metavar='N',
+                        help=f"estrelas caindo no fundo (padrão {FALLING_STARS_COUNT}; 0 desliga)")
+    parser.add_argument('--server', type=int, nargs='?', const=NET_PORT, metavar='PORTA',
+                        help=f"servidor de dois jogadores sem janela (porta {NET_PORT})")
+    parser.add_argument('--connect', metavar='HOST[:PORTA]', help="joga contra outro jogador num servidor")
+    parser.add_argument('--net-test', type=float, metavar='SEGUNDOS',
+                        help="servidor e dois clientes sem janela pelo loopback, com métricas")
+    parser.add_argument('--difficulty', choices=DIFFICULTY_ORDER, default='Normal', help="dificuldade do servidor")
+    parser.add_argument('--loss', type=float, default=0.0, help="perda de pacotes simulada (0 a 1)")
+    parser.add_argument('--latency', type=float, default=0.0, help="atraso simulado por envio, em ms")
+    parser.add_argument('--jitter', type=float, default=0.0, help="variação simulada do atraso, em ms")
+    args = parser.parse_args(argv)
+    if args.stars < 0: parser.error("--stars não pode ser negativo")
+
+    if args.net_test or args.server is not None or args.connect:
+        # netplay importa este módulo, por isso só entra aqui
+        import netplay
+        netplay.run(args)
+        return
+
+    rec = Replay(args.replay) if args.replay else None
+    seed = rec.seed if rec else (args.seed if args.seed is not None else random.randrange(2 ** 31))
+    # As estrelas usam o mesmo gerador das explosões, então a quantidade vai junto com a semente
+    stars = rec.header.get('stars', FALLING_STARS_COUNT) if rec else args.stars
+    random.seed(seed); np.random.seed(seed)
+    headless = rec is not None and not args.render
+    if headless:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+    pygame.init(); pygame.mixer.init()
+    state = GameState(falling_stars_count=stars); renderer = profiler = None; vsync = False
+    if headless:
+        # Sem contexto GL; as estrelas são geradas mesmo assim para o gerador seguir a mesma sequência
+        gen_falling_stars(state)
+    else:
+        vsync = open_window(args.vsync)
+        pygame.display.set_caption("Defensores da Terra")
+        renderer = Renderer(state); renderer.init_gl()
+
+        # F3 liga/desliga o perfil; DEFENSORES_PROFILE=arquivo.csv|.json já começa ligado e gravando
+        profiler = renderer.profiler = FrameProfiler(log_path=os.environ.get('DEFENSORES_PROFILE'))
+        profiler.attach(renderer, PROFILED_SECTIONS)
+        profiler.attach(sys.modules[__name__], ['update_game'])
+        profiler.watch_gl(sys.modules[__name__], gl_state, text_renderer)
+        if profiler.log_path: profiler.enable()
+
+    recorder = Recorder(args.record, seed, 'defensores', stars=stars) if args.record else None
+    loop = LoopState(replaying=rec is not None, vsync=vsync)
+    pacer = FramePacer(args.fps, 'vsync' if vsync else 'target', idle_fps=args.idle_fps)
+    if renderer: renderer.pacer = pacer
+    frames = iter(rec) if rec else None
+
+    while loop.running:
+        if rec:
+            frame = next(frames, None)
+            if frame is None: break
+            frame_dt, events = frame[0], decode_events(frame[1])
+            keys = defaultdict(bool, {k: True for k in frame[2]})
+            if renderer: pygame.event.pump()
+        else:
+            # Fora do jogo a cena só muda com a entrada e a animação das estrelas; minimizada, nada aparece
+            idle = state.state_id != STATE_PLAYING or not pygame.display.get_active()
+            frame_dt = min(pacer.tick(idle) / 1000.0, MAX_FRAME_TIME)
+            events = pacer.events()
+            keys = pygame.key.get_pressed()
+            if recorder: recorder.frame([frame_dt, encode_events(events), [k for k in RECORDED_KEYS if keys[k]]])
+        run_frame(state, loop, frame_dt, events, keys, renderer, profiler)
+        if renderer and (rec or pygame.display.get_active()):
+            renderer.draw(loop.accumulator / SIM_DT)
+            pygame.display.flip()
+            profiler.end_frame()
+
+    if recorder: recorder.close(state_digest(state))
+    if profiler and profiler.log_path: profiler.write_log()
     pygame.quit()
+    if rec:
+        report = rec.report(state_digest(state))
+        print(f"{report['frames']} quadros em {report['elapsed_s']:.2f}s ({report['fps']:.0f} quadros/s)  "
+              f"p50 {report['p50_ms']:.2f}  p95 {report['p95_ms']:.2f}  p99 {report['p99_ms']:.2f} ms")
+        print({True: "Estado final igual ao gravado", False: "Estado final DIFERENTE do gravado",
+               None: "Gravação sem resumo do estado final"}[report['match']])
+        if args.out:
+            with open(args.out, 'w') as f: json.dump(report, f, indent=2)
+        if report['match'] is False: sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,109 @@
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass
+class Mesh:
+    verts: np.ndarray
+    normals: np.ndarray
+    texcoords: Optional[np.ndarray] = None
+    colors: Optional[np.ndarray] = None
+
+    @property
+    def count(self):
+        return len(self.verts)
+
+
+def _quads_to_tris(grid):
+    # grade (linhas+1, colunas+1, k) -> dois triângulos por célula
+    a = grid[:-1, :-1]; b = grid[:-1, 1:]; c = grid[1:, 1:]; d = grid[1:, :-1]
+    return np.stack([a, d, c, a, c, b], axis=2).reshape(-1, grid.shape[-1])
+
+
+def sphere(radius, slices, stacks):
+    # Mesma parametrização do gluSphere (polos no eixo z) para manter as texturas
+    theta = np.linspace(0.0, 2.0 * math.pi, slices + 1)
+    rho = np.linspace(0.0, math.pi, stacks + 1)
+    t, r = np.meshgrid(theta, rho)
+    n = np.stack([np.sin(r) * np.sin(t), np.sin(r) * np.cos(t), np.cos(r)], axis=-1)
+    uv = np.stack([1.0 - t / (2.0 * math.pi), 1.0 - r / math.pi], axis=-1)
+    normals = _quads_to_tris(n).astype(np.float32)
+    return Mesh(normals * radius, normals, _quads_to_tris(uv).astype(np.float32))
+
+
+def cylinder(base, top, height, slices):
+    theta = np.linspace(0.0, 2.0 * math.pi, slices + 1)
+    rad = np.array([base, top])[:, None]
+    z = np.array([0.0, height])[:, None]
+    sin_t, cos_t = np.sin(theta)[None, :], np.cos(theta)[None, :]
+    v = np.stack([rad * sin_t, rad * cos_t, np.broadcast_to(z, (2, slices + 1))], axis=-1)
+    nz = (base - top) / height
+    n = np.stack([np.broadcast_to(sin_t, (2, slices + 1)), np.broadcast_to(cos_t, (2, slices + 1)),
+                  np.full((2, slices + 1), nz)], axis=-1)
+    n /= np.linalg.norm(n, axis=-1, keepdims=True)
+    return Mesh(_quads_to_tris(v).astype(np.float32), _quads_to_tris(n).astype(np.float32))
+
+
+def disk(outer, slices):
+    theta = np.linspace(0.0, 2.0 * math.pi, slices + 1)
+    ring = np.stack([outer * np.sin(theta), outer * np.cos(theta), np.zeros_like(theta)], axis=-1)
+    tris = np.empty((slices, 3, 3))
+    tris[:, 0] = 0.0
+    tris[:, 1] = ring[1:]
+    tris[:, 2] = ring[:-1]
+    verts = tris.reshape(-1, 3).astype(np.float32)
+    normals = np.tile(np.array([0.0, 0.0, 1.0], np.float32), (len(verts), 1))
+    return Mesh(verts, normals)
+
+
+def rotation(angle_deg, axis):
+    x, y, z = np.asarray(axis, float) / np.linalg.norm(axis)
+    a = math.radians(angle_deg)
+    c, s = math.cos(a), math.sin(a)
+    return np.array([
+        [c + x * x * (1 - c), x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+        [y * x * (1 - c) + z * s, c + y * y * (1 - c), y * z * (1 - c) - x * s],
+        [z * x * (1 - c) - y * s, z * y * (1 - c) + x * s, c + z * z * (1 - c)],
+    ])
+
+
+def transformed(mesh, translate=(0, 0, 0), rotate=None, scale=(1, 1, 1), color=None):
+    # Equivale a glTranslatef + glRotatef + glScalef aplicados aos vértices
+    m = np.diag(np.asarray(scale, float))
+    if rotate is not None:
+        m = rotation(*rotate) @ m
+    verts = mesh.verts @ m.T + np.asarray(translate, float)
+    normals = mesh.normals @ np.linalg.inv(m)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    colors = mesh.colors
+    if color is not None:
+        colors = np.tile(np.asarray(color, np.float32), (mesh.count, 1))
+    return Mesh(verts.astype(np.float32), normals.astype(np.float32), mesh.texcoords, colors)
+
+
+def merge(*meshes):
+    return Mesh(
+        np.concatenate([m.verts for m in meshes]),
+        np.concatenate([m.normals for m in meshes]),
+        None,
+        np.concatenate([m.colors for m in meshes]).astype(np.float32),
+    )
+
+
+def instance_arrays(mesh, positions, angles, sizes):
+    # Mesma transformação que glTranslatef, glRotatef(a, z), glRotatef(a/2, y) e glScalef(s), por entidade
+    a = np.radians(angles)
+    b = a * 0.5
+    ca, sa, cb, sb = np.cos(a), np.sin(a), np.cos(b), np.sin(b)
+    rot = np.empty((len(a), 3, 3))
+    rot[:, 0, 0] = ca * cb; rot[:, 0, 1] = -sa; rot[:, 0, 2] = ca * sb
+    rot[:, 1, 0] = sa * cb; rot[:, 1, 1] = ca;  rot[:, 1, 2] = sa * sb
+    rot[:, 2, 0] = -sb;     rot[:, 2, 1] = 0.0; rot[:, 2, 2] = cb
+    verts = np.einsum('nij,vj->nvi', rot * np.asarray(sizes)[:, None, None], mesh.verts)
+    verts += np.asarray(positions)[:, None, :]
+    normals = np.einsum('nij,vj->nvi', rot, mesh.normals)
+    return (np.ascontiguousarray(verts.reshape(-1, 3), dtype=np.float32),
+            np.ascontiguousarray(normals.reshape(-1, 3), dtype=np.float32))
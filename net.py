@@ -0,0 +1,418 @@
+import heapq
+import random
+import socket
+import struct
+import time
+import zlib
+from bisect import insort
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from replay import percentile
+
+NET_PORT = 5151
+
+PACKET_INPUT = 1
+PACKET_SNAPSHOT = 2
+FLAG_ZLIB = 1
+
+# Entrada: tipo, sequência, último snapshot decodificado, teclas seguradas
+INPUT_HEADER = struct.Struct('!BIIB')
+# Snapshot: tipo, flags, vaga do jogador, tick, tick da base, última entrada e próximo evento esperados
+SNAPSHOT_HEADER = struct.Struct('!BBBIIII')
+NO_BASE = 0xFFFFFFFF
+
+# Snapshots guardados dos dois lados para servir de base às diferenças
+HISTORY = 64
+CLIENT_TIMEOUT = 5.0
+# Abaixo disso o zlib não compensa o próprio cabeçalho
+COMPRESS_MIN = 96
+# Limites de um snapshot decodificado; acima deles o pacote está corrompido
+MAX_FIELDS = 64
+MAX_PAYLOAD = 1 << 20
+
+
+def _put(out, n):
+    # Zigzag + varint: inteiros pequenos, com ou sem sinal, ocupam um byte
+    _put_u(out, (n << 1) ^ (n >> 63))
+
+def _put_u(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def u(self):
+        result = shift = 0
+        while True:
+            b = self.data[self.pos]; self.pos += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80: return result
+            shift += 7
+
+    def s(self):
+        n = self.u()
+        return (n >> 1) ^ -(n & 1)
+
+
+@dataclass
+class Snapshot:
+    # Tudo já em inteiros (ponto fixo): escalares numa ordem fixa, entidades por id estável e eventos
+    # (tick, campos...) que o cliente reproduz uma vez cada
+    tick: int
+    scalars: Tuple[int, ...]
+    entities: Dict[int, Tuple[int, ...]]
+    events: List[Tuple[int, ...]] = field(default_factory=list)
+
+
+def encode_snapshot(snap, base=None):
+    # Só o que mudou desde a base (um snapshot que o cliente confirmou ter): máscara dos escalares e a
+    # diferença de cada um, ids que sumiram e, por entidade nova ou alterada, máscara e diferenças dos campos.
+    # Sem base, a diferença é contra zero. Eventos vão inteiros.
+    out = bytearray()
+    prev = base.scalars if base else (0,) * len(snap.scalars)
+    _put_u(out, len(snap.scalars))
+    _put_u(out, sum(1 << i for i, (v, p) in enumerate(zip(snap.scalars, prev)) if v != p))
+    for v, p in zip(snap.scalars, prev):
+        if v != p: _put(out, v - p)
+
+    old = base.entities if base else {}
+    removed = sorted(uid for uid in old if uid not in snap.entities)
+    _put_u(out, len(removed))
+    last = 0
+    for uid in removed:
+        _put_u(out, uid - last); last = uid
+
+    changed = [(uid, f) for uid, f in sorted(snap.entities.items()) if old.get(uid) != f]
+    width = len(next(iter(snap.entities.values()), ()))
+    _put_u(out, width)
+    _put_u(out, len(changed))
+    last = 0
+    for uid, fields in changed:
+        _put_u(out, uid - last); last = uid
+        before = old.get(uid) or (0,) * width
+        _put_u(out, sum(1 << i for i, (v, p) in enumerate(zip(fields, before)) if v != p))
+        for v, p in zip(fields, before):
+            if v != p: _put(out, v - p)
+
+    _put_u(out, len(snap.events))
+    for event in snap.events:
+        _put_u(out, snap.tick - event[0])
+        _put_u(out, len(event) - 1)
+        for v in event[1:]: _put(out, v)
+    return bytes(out)
+
+
+def decode_snapshot(tick, payload, base=None):
+    r = _Reader(payload)
+    n = r.u()
+    if n > MAX_FIELDS: raise ValueError(f'{n} escalares')
+    prev = base.scalars if base else (0,) * n
+    mask = r.u()
+    scalars = tuple(p + r.s() if mask >> i & 1 else p for i, p in enumerate(prev))
+
+    entities = dict(base.entities) if base else {}
+    last = 0
+    for _ in range(r.u()):
+        last += r.u()
+        del entities[last]
+    width = r.u()
+    if width > MAX_FIELDS: raise ValueError(f'{width} campos por entidade')
+    last = 0
+    for _ in range(r.u()):
+        last += r.u()
+        before = entities.get(last) or (0,) * width
+        mask = r.u()
+        entities[last] = tuple(p + r.s() if mask >> i & 1 else p for i, p in enumerate(before))
+
+    events = []
+    for _ in range(r.u()):
+        t = tick - r.u()
+        events.append((t, *[r.s() for _ in range(r.u())]))
+    return Snapshot(tick, scalars, entities, events)
+
+
+class Endpoint:
+    # Socket UDP não bloqueante. Perda, atraso e variação simulados valem para o que este lado envia, para
+    # testar a rede inteira no loopback; o sorteio tem gerador próprio e não mexe no random do jogo
+    def __init__(self, bind=('0.0.0.0', 0), loss=0.0, latency=0.0, jitter=0.0, seed=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(bind)
+        self.sock.setblocking(False)
+        self.loss, self.latency, self.jitter = loss, latency, jitter
+        self.rng = random.Random(seed)
+        self.queue = []
+        self.order = 0
+        self.bytes_sent = self.bytes_received = 0
+        self.packets_sent = self.packets_received = self.dropped = 0
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def send(self, data, addr):
+        # A banda conta o que saiu da aplicação, inclusive o que a perda simulada descartou
+        self.bytes_sent += len(data); self.packets_sent += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay <= 0:
+            self._send(data, addr)
+            return
+        self.order += 1
+        heapq.heappush(self.queue, (time.perf_counter() + delay, self.order, data, addr))
+
+    def _send(self, data, addr):
+        try: self.sock.sendto(data, addr)
+        except OSError: pass
+
+    def flush(self):
+        now = time.perf_counter()
+        while self.queue and self.queue[0][0] <= now:
+            _, _, data, addr = heapq.heappop(self.queue)
+            self._send(data, addr)
+
+    def receive(self):
+        self.flush()
+        packets = []
+        while True:
+            try: data, addr = self.sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError): break
+            except ConnectionResetError: continue
+            self.bytes_received += len(data); self.packets_received += 1
+            packets.append((data, addr))
+        return packets
+
+    def close(self):
+        self.sock.close()
+
+
+@dataclass
+class _Peer:
+    addr: tuple
+    slot: int
+    last_seen: float
+    input_seq: int = -1
+    next_event: int = 0
+    held: int = 0
+    acked: int = NO_BASE
+
+
+def _pack_snapshot(snap, base, slot, input_seq, next_event):
+    payload = encode_snapshot(snap, base)
+    flags = 0
+    if len(payload) >= COMPRESS_MIN:
+        packed = zlib.compress(payload, 1)
+        if len(packed) < len(payload): payload, flags = packed, FLAG_ZLIB
+    return SNAPSHOT_HEADER.pack(PACKET_SNAPSHOT, flags, slot, snap.tick, base.tick if base else NO_BASE,
+                                input_seq & 0xFFFFFFFF, next_event) + payload
+
+
+class NetServer:
+    # Lado do servidor: cada endereço novo ocupa uma vaga livre; poll() devolve as teclas apertadas, na ordem e
+    # uma vez cada, e send() manda a cada jogador o snapshot em diferença contra o último que ele confirmou
+    def __init__(self, port, slots=2, window=1200, **link):
+        self.link = Endpoint(('0.0.0.0', port), **link)
+        self.slots = slots
+        self.peers = {}
+        self.history = {}
+        self.tick_ms = deque(maxlen=window)
+        self.packet_bytes = deque(maxlen=window)
+        self.full_bytes = deque(maxlen=window)
+        self.ticks = 0
+        self.snapshots = 0
+        self.malformed = 0
+        self.start = time.perf_counter()
+
+    def poll(self):
+        now = time.perf_counter()
+        keys = []
+        for data, addr in self.link.receive():
+            if len(data) < INPUT_HEADER.size or data[0] != PACKET_INPUT: continue
+            # O pacote é lido inteiro antes de tudo: truncado ou corrompido, é descartado sem ocupar vaga
+            try:
+                _, seq, ack, held = INPUT_HEADER.unpack_from(data)
+                r = _Reader(memoryview(data)[INPUT_HEADER.size:])
+                first, count = r.u(), r.u()
+                pressed = [r.u() for _ in range(count)]
+            except (IndexError, ValueError):
+                self.malformed += 1
+                continue
+            peer = self.peers.get(addr)
+            if peer is None:
+                free = sorted(set(range(self.slots)) - {p.slot for p in self.peers.values()})
+                if not free: continue
+                peer = self.peers[addr] = _Peer(addr, free[0], now)
+            peer.last_seen = now
+            # Fora de ordem: as teclas seguradas são velhas, mas os eventos ainda valem
+            if seq > peer.input_seq:
+                peer.input_seq, peer.held = seq, held
+                if ack != NO_BASE and (peer.acked == NO_BASE or ack > peer.acked): peer.acked = ack
+            for i, key in enumerate(pressed):
+                if first + i == peer.next_event:
+                    keys.append((peer.slot, key))
+                    peer.next_event += 1
+        for addr, peer in list(self.peers.items()):
+            if now - peer.last_seen > CLIENT_TIMEOUT: del self.peers[addr]
+        return keys
+
+    def held(self):
+        return {peer.slot: peer.held for peer in self.peers.values()}
+
+    def tick_done(self, seconds):
+        self.ticks += 1
+        self.tick_ms.append(seconds * 1000.0)
+
+    def send(self, snap):
+        self.history[snap.tick] = snap
+        while len(self.history) > HISTORY: del self.history[min(self.history)]
+        self.snapshots += 1
+        if not self.peers: return
+        # O tamanho sem diferença, só para a métrica de compressão
+        self.full_bytes.append(len(_pack_snapshot(snap, None, 0, 0, 0)))
+        for peer in self.peers.values():
+            packet = _pack_snapshot(snap, self.history.get(peer.acked), peer.slot, peer.input_seq, peer.next_event)
+            self.packet_bytes.append(len(packet))
+            self.link.send(packet, peer.addr)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        ms = list(self.tick_ms)
+        ticks = max(self.ticks, 1)
+        packets, full = list(self.packet_bytes), list(self.full_bytes)
+        return {
+            'ticks': self.ticks,
+            'tick_rate': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'tick_p50_ms': percentile(ms, 50),
+            'tick_p99_ms': percentile(ms, 99),
+            'tick_max_ms': max(ms, default=0.0),
+            'snapshots': self.snapshots,
+            'players': len(self.peers),
+            'bytes_per_tick': self.link.bytes_sent / ticks,
+            'snapshot_bytes_mean': sum(packets) / len(packets) if packets else 0.0,
+            'snapshot_bytes_p99': percentile(packets, 99),
+            'full_bytes_mean': sum(full) / len(full) if full else 0.0,
+            'received_bytes_per_tick': self.link.bytes_received / ticks,
+            'malformed': self.malformed,
+        }
+
+    def close(self):
+        self.link.close()
+
+
+class NetClient:
+    # Lado do cliente: envia as teclas (os eventos são reenviados até o servidor confirmar) e guarda os
+    # snapshots numa fila por tick, de onde advance() tira os dois em volta do instante desenhado
+    def __init__(self, server, window=600, **link):
+        self.link = Endpoint(('0.0.0.0', 0), **link)
+        # Resolvido uma vez: poll() só aceita pacotes que vêm deste endereço
+        self.server = (socket.gethostbyname(server[0]), server[1])
+        self.slot = None
+        self.seq = 0
+        self.events = []
+        self.next_event = 0
+        self.received = {}
+        self.latest = None
+        self.buffer = []
+        self.clock = None
+        self.sent_at = {}
+        self.rtt_ms = deque(maxlen=window)
+        self.packet_bytes = deque(maxlen=window)
+        self.echoed = -1
+        self.undecodable = 0
+        self.underruns = 0
+        self.frames = 0
+
+    def send_input(self, held, keys=()):
+        for key in keys:
+            self.events.append((self.next_event, key))
+            self.next_event += 1
+        out = bytearray(INPUT_HEADER.pack(PACKET_INPUT, self.seq, self.latest.tick if self.latest else NO_BASE, held))
+        _put_u(out, self.events[0][0] if self.events else self.next_event)
+        _put_u(out, len(self.events))
+        for _, key in self.events: _put_u(out, key)
+        self.sent_at[self.seq] = time.perf_counter()
+        self.sent_at.pop(self.seq - 256, None)
+        self.seq += 1
+        self.link.send(bytes(out), self.server)
+
+    def poll(self):
+        # Devolve os snapshots novos, já decodificados
+        new = []
+        for data, addr in self.link.receive():
+            if addr != self.server or len(data) < SNAPSHOT_HEADER.size or data[0] != PACKET_SNAPSHOT: continue
+            _, flags, slot, tick, base_tick, input_seq, next_event = SNAPSHOT_HEADER.unpack_from(data)
+            if tick in self.received: continue
+            base = None
+            if base_tick != NO_BASE:
+                base = self.received.get(base_tick)
+                if base is None:
+                    self.undecodable += 1
+                    continue
+            # Um payload que não decodifica conta junto com os sem base e fica de fora, como um pacote perdido
+            try:
+                payload = data[SNAPSHOT_HEADER.size:]
+                if flags & FLAG_ZLIB:
+                    inflate = zlib.decompressobj()
+                    payload = inflate.decompress(payload, MAX_PAYLOAD)
+                    if inflate.unconsumed_tail: raise ValueError('snapshot grande demais')
+                snap = decode_snapshot(tick, payload, base)
+            except (zlib.error, KeyError, IndexError, ValueError):
+                self.undecodable += 1
+                continue
+            self.slot = slot
+            self.packet_bytes.append(len(data))
+            self.events = [e for e in self.events if e[0] >= next_event]
+            if input_seq > self.echoed and input_seq in self.sent_at:
+                self.echoed = input_seq
+                self.rtt_ms.append((time.perf_counter() - self.sent_at[input_seq]) * 1000.0)
+            self.received[tick] = snap
+            if self.latest is None or tick > self.latest.tick: self.latest = snap
+            while len(self.received) > HISTORY: del self.received[min(self.received)]
+            if not self.buffer or tick > self.buffer[0].tick: insort(self.buffer, snap, key=lambda s: s.tick)
+            new.append(snap)
+        return new
+
+    def advance(self, dt, tick_s, delay):
+        # Relógio em ticks do servidor, `delay` segundos atrás do snapshot mais novo: anda com o tempo local e
+        # é puxado aos poucos para o alvo, sem saltos. Devolve (a, b, fração) ou None antes do primeiro snapshot
+        if not self.buffer: return None
+        self.frames += 1
+        target = self.buffer[-1].tick - delay / tick_s
+        if self.clock is None or abs(target - self.clock) > 2 * delay / tick_s: self.clock = target
+        else: self.clock += dt / tick_s + (target - self.clock) * 0.05
+        while len(self.buffer) > 2 and self.buffer[1].tick <= self.clock: self.buffer.pop(0)
+        a = self.buffer[0]
+        if self.clock > self.buffer[-1].tick:
+            # Sem snapshot depois do instante desenhado: fica parado no último, não extrapola
+            self.underruns += 1
+            return self.buffer[-1], self.buffer[-1], 1.0
+        if len(self.buffer) == 1 or self.clock <= a.tick: return a, a, 1.0
+        b = self.buffer[1]
+        return a, b, (self.clock - a.tick) / (b.tick - a.tick)
+
+    def report(self):
+        packets, rtt = list(self.packet_bytes), list(self.rtt_ms)
+        return {
+            'slot': self.slot,
+            'snapshots': len(packets),
+            'snapshot_bytes_mean': sum(packets) / len(packets) if packets else 0.0,
+            'rtt_p50_ms': percentile(rtt, 50),
+            'rtt_p99_ms': percentile(rtt, 99),
+            'undecodable': self.undecodable,
+            'underruns': self.underruns,
+            'frames': self.frames,
+            'sent_bytes': self.link.bytes_sent,
+            'received_bytes': self.link.bytes_received,
+        }
+
+    def close(self):
+        self.link.close()
@@ -0,0 +1,336 @@
+import sys
+import time
+import json
+import random
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+
+import numpy as np
+import pygame
+from pygame.locals import *
+
+from main import (GameState, Renderer, LoopState, open_window, handle_event, handle_view_event, update_game,
+                  update_falling_stars, SIM_DT, MAX_FRAME_TIME, BURST_SIZE, PROFILED_SECTIONS, DIFFICULTY_ORDER,
+                  GAME_MODE_MULTI, STATE_MENU, STATE_PLAYING, STATE_GAMEOVER, STATE_WIN, STATE_WAITING)
+from net import (NetServer, NetClient, Snapshot, Endpoint, NET_PORT, INPUT_HEADER, PACKET_INPUT, SNAPSHOT_HEADER,
+                 PACKET_SNAPSHOT, FLAG_ZLIB, NO_BASE, encode_snapshot)
+from pacing import FramePacer
+from profiler import FrameProfiler
+
+# Rede: o servidor roda update_game no passo fixo e manda um snapshot a cada NET_SEND_EVERY passos (30 por
+# segundo); o cliente desenha NET_DELAY segundos atrás do snapshot mais novo, interpolando entre os dois em volta
+NET_SEND_EVERY = 4
+NET_DELAY = 0.1
+# As explosões ficam meio segundo nos snapshots, para chegarem mesmo com pacotes perdidos
+NET_BURST_TICKS = 60
+# Ponto fixo: posições em 1/256 de unidade, tempo e ângulo da lua em centésimos, giro em 1/8 de grau
+Q_POS = 256.0
+Q_TIME = 100.0
+Q_ROT = 8.0
+# O cliente manda as teclas como as do jogador 1 (as setas valem como WASD); o servidor traduz para a vaga 2
+NET_KEYS = {K_LEFT: K_a, K_RIGHT: K_d, K_UP: K_w, K_DOWN: K_s}
+NET_FORWARDED = (K_a, K_d, K_w, K_s, K_RETURN, K_p, K_ESCAPE)
+P2_KEYS = {K_a: K_LEFT, K_d: K_RIGHT, K_w: K_UP, K_s: K_DOWN}
+HELD_LEFT = 1
+HELD_RIGHT = 2
+# Posição do primeiro campo de cada jogador nos escalares do snapshot
+P1_FIELD = 8
+P2_FIELD = 15
+
+@dataclass
+class NetView:
+    # O que o cliente de rede lembra entre quadros: posição no pool de cada id, última explosão mostrada e estado
+    uids: dict = field(default_factory=dict)
+    last_burst: int = -1
+    state_id: int = STATE_WAITING
+
+def capture_snapshot(state, tick, bursts):
+    def player(p): return (round(p.x * Q_POS), round(p.z * Q_POS), int(p.active), p.lives, p.score, int(p.dead), p.speed_level)
+    scalars = (state.state_id, state.game_mode, DIFFICULTY_ORDER.index(state.current_difficulty),
+               round(state.time_elapsed * Q_TIME), round(state.max_time * Q_TIME), round(state.moon_angle * Q_TIME),
+               state.end_screen_selection, state.pause_selection) + player(state.p1) + player(state.p2)
+    pool = state.stars; idx = pool.active()
+    columns = (pool.kind[idx], np.rint(pool.pos[idx, 0] * Q_POS), np.rint(pool.pos[idx, 2] * Q_POS),
+               np.rint(pool.rot[idx] % 360.0 * Q_ROT) % (360 * Q_ROT), np.rint(pool.size[idx] * Q_POS))
+    entities = dict(zip(pool.uid[idx].tolist(), zip(*[c.astype(np.int64).tolist() for c in columns])))
+    return Snapshot(tick, scalars, entities, list(bursts))
+
+def collect_bursts(state, tick, bursts):
+    for origin, color, count, speed, life in state.explosions.log:
+        bursts.append((tick, *[round(v * Q_POS) for v in origin], *[round(c * 255) for c in color],
+                       count, round(speed * Q_TIME), round(life * Q_TIME)))
+    state.explosions.log.clear()
+    while bursts and bursts[0][0] <= tick - NET_BURST_TICKS: bursts.popleft()
+
+def apply_snapshots(state, a, b, uids):
+    # a e b cercam o instante desenhado: o "anterior" de tudo vem de a e o atual de b, e o Renderer interpola
+    # entre os dois como faz entre dois passos da simulação
+    s = b.scalars
+    state.state_id, state.game_mode, difficulty, elapsed, max_time, moon, state.end_screen_selection, state.pause_selection = s[:P1_FIELD]
+    state.current_difficulty = DIFFICULTY_ORDER[difficulty]
+    state.time_elapsed, state.max_time, state.moon_angle = elapsed / Q_TIME, max_time / Q_TIME, moon / Q_TIME
+    for p, i in ((state.p1, P1_FIELD), (state.p2, P2_FIELD)):
+        x, z, active, lives, score, dead, speed_level = s[i:i + 7]
+        p.prev_x, p.x, p.z = a.scalars[i] / Q_POS, x / Q_POS, z / Q_POS
+        p.active, p.lives, p.score, p.dead, p.speed_level = bool(active), lives, score, bool(dead), speed_level
+
+    pool = state.stars
+    gone = [uids.pop(uid) for uid in [uid for uid in uids if uid not in b.entities]]
+    if gone: pool.remove(np.array(gone, np.int32))
+    for uid, (kind, x, z, rot, size) in b.entities.items():
+        i = uids.get(uid)
+        if i is None: i = uids[uid] = pool.spawn(x / Q_POS, 0.0, z / Q_POS, kind, size / Q_POS)
+        pool.pos[i] = (x / Q_POS, 0.0, z / Q_POS)
+        pool.rot[i] = rot / Q_ROT
+        before = a.entities.get(uid)
+        if before is None:
+            pool.prev_pos[i], pool.prev_rot[i] = pool.pos[i], pool.rot[i]
+            continue
+        pool.prev_pos[i] = (before[1] / Q_POS, 0.0, before[2] / Q_POS)
+        # O giro vai módulo 360: a volta mais curta entre os dois
+        turn = (rot - before[3]) / Q_ROT
+        pool.prev_rot[i] = pool.rot[i] - (turn - 360.0 * round(turn / 360.0))
+
+def play_bursts(state, snap, after, until):
+    # Explosões do snapshot com tick em (after, until], uma vez cada; devolve até onde foram mostradas
+    shown = after
+    for t, x, y, z, r, g, b, count, speed, life in snap.events:
+        if not after < t <= until: continue
+        state.explosions.emit((x / Q_POS, y / Q_POS, z / Q_POS), (r / 255, g / 255, b / 255), count, speed / Q_TIME, life / Q_TIME)
+        # Vida perdida, moeda (dourada) ou alienígena
+        sound = state.snd_life if count > BURST_SIZE else state.snd_coin if r > 128 else state.snd_item
+        if sound: sound.play()
+        shown = max(shown, t)
+    return shown
+
+def run_server(net, state, seconds=None, stop=None, log_every=5.0):
+    # Servidor autoritativo sem janela: update_game no passo fixo com as teclas das duas vagas
+    loop = LoopState()
+    pacer = FramePacer(round(1.0 / SIM_DT))
+    bursts = deque()
+    state.explosions.log = []
+    tick = 0
+    next_log = time.perf_counter() + log_every
+    while loop.running and not (stop and stop.is_set()) and (seconds is None or tick * SIM_DT < seconds):
+        pacer.tick()
+        start = time.perf_counter()
+        for slot, key in net.poll():
+            if slot == 1: key = P2_KEYS.get(key, key)
+            handle_event(state, loop, pygame.event.Event(KEYDOWN, key=key))
+        # Não há menu na rede: "menu principal" recomeça a partida, que espera as duas vagas
+        if state.state_id == STATE_MENU: state.reset(); state.state_id = STATE_WAITING
+        full = len(net.peers) == net.slots
+        if state.state_id == STATE_WAITING and full: state.state_id = STATE_PLAYING
+        elif state.state_id != STATE_WAITING and not full: state.state_id = STATE_WAITING
+
+        keys = defaultdict(bool)
+        for slot, held in net.held().items():
+            left, right = (K_a, K_d) if slot == 0 else (K_LEFT, K_RIGHT)
+            keys[left], keys[right] = bool(held & HELD_LEFT), bool(held & HELD_RIGHT)
+        update_game(state, SIM_DT, keys)
+        tick += 1
+        collect_bursts(state, tick, bursts)
+        if tick % NET_SEND_EVERY == 0: net.send(capture_snapshot(state, tick, bursts))
+        net.tick_done(time.perf_counter() - start)
+
+        if log_every and time.perf_counter() >= next_log:
+            next_log += log_every
+            print(format_server_report(net.report()))
+    return net.report()
+
+def format_server_report(r):
+    return (f"servidor: {r['ticks']} passos ({r['tick_rate']:.1f}/s), {r['players']} jogadores  "
+            f"passo p50 {r['tick_p50_ms']:.2f}  p99 {r['tick_p99_ms']:.2f}  máx {r['tick_max_ms']:.2f} ms  "
+            f"{r['bytes_per_tick']:.0f} B/passo enviados  snapshot {r['snapshot_bytes_mean']:.0f} B "
+            f"(p99 {r['snapshot_bytes_p99']:.0f}, completo {r['full_bytes_mean']:.0f} B)  {r['malformed']} pacotes inválidos")
+
+def format_client_report(r):
+    return (f"cliente {r['slot']}: {r['snapshots']} snapshots de {r['snapshot_bytes_mean']:.0f} B  "
+            f"rtt p50 {r['rtt_p50_ms']:.1f}  p99 {r['rtt_p99_ms']:.1f} ms  "
+            f"{r['underruns']} de {r['frames']} quadros sem snapshot à frente  {r['undecodable']} sem base ou inválidos")
+
+def client_frame(state, loop, net, view, frame_dt, events, keys, renderer=None, profiler=None):
+    # Um quadro do cliente: manda as teclas, recebe snapshots e monta o estado interpolado; devolve o alpha
+    pressed = []
+    for event in events:
+        handle_view_event(state, loop, event, renderer, profiler)
+        if event.type != KEYDOWN: continue
+        if event.key == K_r: state.cam_yaw = state.cam_pitch = 0.0
+        key = NET_KEYS.get(event.key, event.key)
+        if key in NET_FORWARDED: pressed.append(key)
+    held = (HELD_LEFT if keys[K_a] or keys[K_LEFT] else 0) | (HELD_RIGHT if keys[K_d] or keys[K_RIGHT] else 0)
+    net.send_input(held, pressed)
+    net.poll()
+
+    update_falling_stars(state, frame_dt)
+    frame = net.advance(frame_dt, SIM_DT, NET_DELAY)
+    alpha = 1.0
+    if frame:
+        a, b, alpha = frame
+        apply_snapshots(state, a, b, view.uids)
+        # Quem entra no meio da partida não vê as explosões de antes
+        if view.last_burst < 0: view.last_burst = int(net.clock)
+        view.last_burst = play_bursts(state, net.latest, view.last_burst, net.clock)
+        if state.state_id != view.state_id:
+            if view.state_id == STATE_WIN and state.snd_win_music: state.snd_win_music.stop()
+            if state.state_id == STATE_GAMEOVER and state.snd_gameover: state.snd_gameover.play()
+            if state.state_id == STATE_WIN and state.snd_win_music: state.snd_win_music.play()
+            view.state_id = state.state_id
+    state.explosions.update(frame_dt)
+    return alpha
+
+def net_link(args):
+    return dict(loss=args.loss, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0)
+
+def new_server_state(difficulty):
+    state = GameState(game_mode=GAME_MODE_MULTI, current_difficulty=difficulty)
+    state.reset()
+    state.state_id = STATE_WAITING
+    return state
+
+def run_client(args):
+    host, _, port = args.connect.partition(':')
+    pygame.init(); pygame.mixer.init()
+    vsync = open_window(args.vsync)
+    pygame.display.set_caption("Defensores da Terra - rede")
+    state = GameState(state_id=STATE_WAITING, game_mode=GAME_MODE_MULTI, falling_stars_count=args.stars)
+    renderer = Renderer(state); renderer.init_gl()
+    profiler = renderer.profiler = FrameProfiler()
+    profiler.attach(renderer, PROFILED_SECTIONS)
+    pacer = renderer.pacer = FramePacer(args.fps, 'vsync' if vsync else 'target', idle_fps=args.idle_fps)
+    net = NetClient((host or '127.0.0.1', int(port or NET_PORT)), **net_link(args))
+    loop = LoopState(vsync=vsync)
+    view = NetView()
+    while loop.running:
+        # Minimizado continua recebendo e mandando, a outra ponta não para
+        frame_dt = min(pacer.tick(not pygame.display.get_active()) / 1000.0, MAX_FRAME_TIME)
+        alpha = client_frame(state, loop, net, view, frame_dt, pacer.events(), pygame.key.get_pressed(), renderer, profiler)
+        if pygame.display.get_active():
+            renderer.draw(alpha)
+            pygame.display.flip()
+            profiler.end_frame()
+    print(format_client_report(net.report()))
+    net.close()
+    pygame.quit()
+
+def malformed_input(rng):
+    # Cabeçalho de entrada válido seguido de um varint cortado no meio (ou de nada): o servidor tem de descartar
+    return INPUT_HEADER.pack(PACKET_INPUT, rng.randrange(2 ** 32), NO_BASE, 0) + bytes(rng.randrange(0x80, 0x100) for _ in range(rng.randrange(3)))
+
+# Ticks que o servidor do teste nunca chega a usar, para os snapshots falsos
+FAKE_TICK = 1 << 31
+
+def corrupt_snapshot(rng, tick):
+    # Impossível de decodificar: zlib inválido, varint cortado ou a remoção de uma entidade que não existe
+    kind = rng.randrange(3)
+    if kind == 0: flags, payload = FLAG_ZLIB, b'\xff' + bytes(rng.randrange(256) for _ in range(8))
+    elif kind == 1: flags, payload = 0, bytes(rng.randrange(0x80, 0x100) for _ in range(rng.randrange(4)))
+    else: flags, payload = 0, bytes((0, 0, 1, 5))
+    return SNAPSHOT_HEADER.pack(PACKET_SNAPSHOT, flags, 0, tick, NO_BASE, 0, 0) + payload
+
+def run_net_test(args):
+    # Servidor e dois clientes sem janela no mesmo processo, pelo loopback, com a perda e o atraso pedidos nos dois
+    # sentidos. Os clientes apertam teclas ao acaso e cada snapshot decodificado é comparado com o que o
+    # servidor montou naquele tick.
+    # As duas pontas dividem o GIL; com a troca padrão de 5 ms, um lado esperando o outro viraria tempo de passo
+    sys.setswitchinterval(0.0005)
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 31)
+    random.seed(seed); np.random.seed(seed)
+    link = net_link(args)
+    state = new_server_state(args.difficulty)
+    net = NetServer(0, seed=seed, **link)
+    stop = threading.Event()
+    result = {}
+    server = threading.Thread(target=lambda: result.update(run_server(net, state, stop=stop, log_every=0)))
+    server.start()
+
+    # Um terceiro endereço manda pacotes inválidos o tempo todo, a começar por uma rajada com as vagas ainda livres
+    noise, noise_rng, noise_sent = Endpoint(), random.Random(seed + 3), 0
+    foreign_sent = corrupt_sent = 0
+    server_addr = ('127.0.0.1', net.link.port)
+    for _ in range(8):
+        noise.send(malformed_input(noise_rng), server_addr); noise_sent += 1
+    time.sleep(0.05)
+    bots = [NetClient(('127.0.0.1', net.link.port), seed=seed + i + 1, **link) for i in range(2)]
+    states = [GameState(state_id=STATE_WAITING, game_mode=GAME_MODE_MULTI) for _ in bots]
+    views = [NetView() for _ in bots]
+    loops = [LoopState() for _ in bots]
+    held = [defaultdict(bool) for _ in bots]
+    rng = random.Random(seed)
+    pacer = FramePacer(60)
+    checked = differ = 0
+    last_checked = [None] * len(bots)
+    end = time.perf_counter() + args.net_test
+    try:
+        while time.perf_counter() < end:
+            frame_dt = pacer.tick() / 1000.0
+            if noise_rng.random() < 0.1:
+                noise.send(malformed_input(noise_rng), server_addr); noise_sent += 1
+            # O cliente 0 recebe snapshots válidos de outro endereço, que tem de ignorar, e pacotes corrompidos
+            # saídos do socket do servidor, que tem de descartar
+            target = bots[0]
+            if target.latest and noise_rng.random() < 0.05:
+                fake = Snapshot(FAKE_TICK, target.latest.scalars, target.latest.entities)
+                packet = SNAPSHOT_HEADER.pack(PACKET_SNAPSHOT, 0, 0, FAKE_TICK, NO_BASE, 0, 0) + encode_snapshot(fake)
+                noise.send(packet, ('127.0.0.1', target.link.port)); foreign_sent += 1
+            if noise_rng.random() < 0.05:
+                net.link.sock.sendto(corrupt_snapshot(noise_rng, FAKE_TICK + 1 + corrupt_sent), ('127.0.0.1', target.link.port))
+                corrupt_sent += 1
+            for i, bot in enumerate(bots):
+                if rng.random() < 0.05: held[i] = defaultdict(bool, {rng.choice((K_a, K_d, K_LEFT, K_RIGHT)): rng.random() < 0.8})
+                events = []
+                if rng.random() < 0.01: events.append(pygame.event.Event(KEYDOWN, key=rng.choice((K_w, K_s, K_UP, K_DOWN))))
+                if states[i].state_id in (STATE_GAMEOVER, STATE_WIN) and rng.random() < 0.02:
+                    events.append(pygame.event.Event(KEYDOWN, key=K_RETURN))
+                client_frame(states[i], loops[i], bot, views[i], frame_dt, events, held[i])
+                latest = bot.latest
+                if latest is not None and latest is not last_checked[i]:
+                    last_checked[i] = latest
+                    sent = net.history.get(latest.tick)
+                    if sent is not None:
+                        checked += 1
+                        differ += sent != latest
+    finally:
+        stop.set()
+        server.join()
+    if not result:
+        print("o servidor caiu durante o teste")
+        return False
+    print(format_server_report(result))
+    for bot in bots: print(format_client_report(bot.report()))
+    intruder = any(peer.addr[1] == noise.port for peer in net.peers.values())
+    print(f"pacotes inválidos: {noise_sent} enviados, {result.get('malformed', 0)} descartados pelo servidor"
+          f"{', um deles ocupou uma vaga' if intruder else ''}")
+    accepted = any(tick >= FAKE_TICK for tick in bots[0].received)
+    print(f"cliente 0: {foreign_sent} snapshots de outro endereço{', um deles aceito' if accepted else ' ignorados'}, "
+          f"{corrupt_sent} corrompidos do servidor e {bots[0].undecodable} sem base ou inválidos")
+    print(f"snapshots conferidos: {checked}, diferentes do servidor: {differ}  "
+          f"(perda {args.loss:.0%}, atraso {args.latency:.0f}+{args.jitter:.0f} ms, semente {seed})")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'server': result, 'clients': [bot.report() for bot in bots], 'checked': checked, 'differ': differ}, f, indent=2)
+    for bot in bots: bot.close()
+    noise.close()
+    net.close()
+    return (checked > 0 and differ == 0 and result.get('malformed', 0) > 0 and not intruder and not accepted
+            and bots[0].undecodable >= corrupt_sent)
+
+def run(args):
+    # --net-test, --server e --connect de main.py
+    if args.net_test:
+        if not run_net_test(args): sys.exit(1)
+        return
+    if args.server is not None:
+        seed = args.seed if args.seed is not None else random.randrange(2 ** 31)
+        random.seed(seed); np.random.seed(seed)
+        net = NetServer(args.server, **net_link(args))
+        print(f"servidor na porta {net.link.port}, dificuldade {args.difficulty}")
+        try: report = run_server(net, new_server_state(args.difficulty))
+        except KeyboardInterrupt: report = net.report()
+        print(format_server_report(report))
+        if args.out:
+            with open(args.out, 'w') as f: json.dump(report, f, indent=2)
+        net.close()
+        return
+    run_client(args)
@@ -0,0 +1,114 @@
+import time
+from collections import deque
+
+import pygame
+
+# Nenhum monitor atualiza mais rápido que isso; com vsync, flips mais curtos querem dizer que ele não vale
+VSYNC_MIN_MS = 1000.0 / 360
+
+
+class FramePacer:
+    # Marca o ritmo do laço principal.
+    #   target: dorme até o próximo prazo, a uma taxa fixa; dorme quase tudo e gira só o último trecho,
+    #           com a margem ajustada pelo atraso medido do sleep
+    #   vsync: o flip já espera o monitor; aqui só se mede (e volta a target em fps se o driver ignorar o vsync)
+    #   uncapped: não espera
+    # Quadros ociosos (menus, pausa, janela minimizada) esperam por eventos até idle_fps em qualquer modo,
+    # mesmo com fps 0; sem idle_fps, só um evento acorda o laço. A variação do intervalo entre quadros ativos fica em stats().
+    def __init__(self, fps=60, mode='target', idle_fps=30, window=240, quiet_events=()):
+        self.mode = mode if fps or mode != 'target' else 'uncapped'
+        self.interval = 1.0 / fps if fps else 0.0
+        self.idle_interval = 1.0 / idle_fps if idle_fps else None
+        self.quiet_events = set(quiet_events)
+        self.intervals = deque(maxlen=window)
+        self.work = deque(maxlen=window)
+        self.oversleep = deque([0.0005], maxlen=60)
+        self.woken = []
+        self.last = self.deadline = time.perf_counter()
+        self.raw_ms = 0.0
+        self.frame_count = 0
+        self.cached = None
+        self.cached_frame = 0
+
+    def tick(self, idle=False):
+        # Chamado uma vez por quadro; devolve os milissegundos desde a chamada anterior
+        start = time.perf_counter()
+        work = start - self.last
+        # O primeiro quadro nunca espera, para a janela não ficar vazia até o primeiro evento
+        if idle and self.frame_count:
+            self._wait_events(start)
+        elif self.mode == 'target':
+            # Um quadro atrasado não é compensado depois: encurtar os seguintes também é variação
+            self.deadline = max(self.deadline + self.interval, start)
+            self._sleep_until(self.deadline)
+        now = time.perf_counter()
+        dt = now - self.last
+        self.last = now
+        self.raw_ms = work * 1000.0
+        self.frame_count += 1
+        if idle:
+            self.deadline = now
+        else:
+            self.intervals.append(dt * 1000.0)
+            self.work.append(work * 1000.0)
+            if self.mode == 'vsync': self._check_vsync()
+        return dt * 1000.0
+
+    def events(self):
+        # Eventos que acordaram a espera ociosa, antes dos que ainda estão na fila
+        events, self.woken = self.woken + pygame.event.get(), []
+        return events
+
+    def _sleep_until(self, deadline):
+        margin = max(self.oversleep) + 0.0002
+        remaining = deadline - time.perf_counter()
+        if remaining > margin:
+            before = time.perf_counter()
+            time.sleep(remaining - margin)
+            self.oversleep.append(max(0.0, time.perf_counter() - before - (remaining - margin)))
+        while time.perf_counter() < deadline:
+            pass
+
+    def _wait_events(self, start):
+        # pygame.event.wait bloqueia sem gastar CPU; eventos de quiet_events (timers) não acordam o laço
+        end = start + self.idle_interval if self.idle_interval else None
+        while True:
+            timeout = -1 if end is None else int((end - time.perf_counter()) * 1000)
+            if end is not None and timeout <= 0: return
+            event = pygame.event.wait(timeout)
+            if event.type == pygame.NOEVENT: return
+            self.woken.append(event)
+            if event.type not in self.quiet_events: return
+
+    def _check_vsync(self):
+        if len(self.intervals) == self.intervals.maxlen:
+            median = sorted(self.intervals)[len(self.intervals) // 2]
+            if median < VSYNC_MIN_MS and self.interval:
+                self.mode = 'target'
+                self.deadline = time.perf_counter()
+
+    def get_rawtime(self):
+        return self.raw_ms
+
+    def get_fps(self):
+        recent = list(self.intervals)[-10:]
+        return 1000.0 * len(recent) / sum(recent) if recent else 0.0
+
+    def stats(self, every=30):
+        # Recalculado a cada `every` quadros: média, desvio padrão (jitter), p99, quadros atrasados e
+        # a fração do tempo gasta trabalhando em vez de esperando
+        if self.cached is None or self.frame_count - self.cached_frame >= every:
+            self.cached = self._stats()
+            self.cached_frame = self.frame_count
+        return self.cached
+
+    def _stats(self):
+        intervals = sorted(self.intervals)
+        if not intervals: return None
+        n = len(intervals)
+        mean = sum(intervals) / n
+        jitter = (sum((x - mean) ** 2 for x in intervals) / n) ** 0.5
+        late = sum(x > self.interval * 1500.0 for x in intervals) if self.interval else 0
+        return {'mode': self.mode, 'fps': 1000.0 / mean, 'mean_ms': mean, 'jitter_ms': jitter,
+                'p99_ms': intervals[min(n - 1, int(n * 0.99))], 'late': late,
+                'busy': sum(self.work) / sum(intervals)}
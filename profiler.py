@@ -0,0 +1,203 @@
+import os
+import csv
+import json
+import time
+import ctypes
+from collections import deque
+
+import numpy as np
+from OpenGL.GL import glGenQueries, glQueryCounter, glGetQueryObjectiv, GL_TIMESTAMP, GL_QUERY_RESULT, GL_QUERY_RESULT_AVAILABLE
+# O wrapper do PyOpenGL não converte GLuint64; a versão crua recebe um ponteiro
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+
+_UNSET = object()
+
+
+class FrameProfiler:
+    # Desligado, nada fica instrumentado: as seções só são embrulhadas em enable()
+    def __init__(self, window=600, log_path=None, log_every=120, gpu=True):
+        self.enabled = False
+        self.window = window
+        self.log_path = log_path
+        self.log_every = log_every
+        self.want_gpu = gpu
+        self.gpu = False
+        self.targets = []
+        self.gl_modules = []
+        self.patched = []
+        self.frames = deque(maxlen=window)
+        self.calls = deque(maxlen=window)
+        self.cpu = {}
+        self.gpu_ms = {}
+        self.frame_cpu = {}
+        self.frame_queries = []
+        self.pending = deque()
+        self.free_queries = []
+        self.gl_calls = 0
+        self.last_frame = None
+        self.frame_count = 0
+        self.log_fields = None
+        self.overlay = None
+        self.overlay_frame = 0
+
+    def attach(self, obj, names):
+        self.targets.append((obj, list(names)))
+        if self.enabled: self._patch(obj, names)
+
+    def watch_gl(self, *modules):
+        self.gl_modules.extend(modules)
+        if self.enabled:
+            for m in modules: self._patch_gl(m)
+
+    def toggle(self):
+        if self.enabled: self.disable()
+        else: self.enable()
+
+    def enable(self):
+        if self.enabled: return
+        self.enabled = True
+        self.gpu = self.want_gpu and self._gpu_available()
+        for obj, names in self.targets: self._patch(obj, names)
+        for m in self.gl_modules: self._patch_gl(m)
+        self.last_frame = None
+
+    def disable(self):
+        if not self.enabled: return
+        self.enabled = False
+        for obj, name, original in reversed(self.patched):
+            if original is _UNSET: delattr(obj, name)
+            else: setattr(obj, name, original)
+        self.patched.clear()
+        self.pending.clear()
+        self.frame_queries.clear()
+
+    def _gpu_available(self):
+        try:
+            return bool(glQueryCounter) and bool(glGetQueryObjectui64v)
+        except Exception:
+            return False
+
+    def _patch(self, obj, names):
+        for name in names:
+            original = vars(obj).get(name, _UNSET)
+            setattr(obj, name, self.timed(name, getattr(obj, name)))
+            self.patched.append((obj, name, original))
+
+    def _patch_gl(self, module):
+        # Troca as funções gl* do módulo por versões que contam as chamadas
+        for name, fn in list(vars(module).items()):
+            if name.startswith('gl') and callable(fn):
+                setattr(module, name, self._counted(fn))
+                self.patched.append((module, name, fn))
+
+    def _counted(self, fn):
+        def wrapper(*args, **kwargs):
+            self.gl_calls += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            q = self._query() if self.gpu else None
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.frame_cpu[name] = self.frame_cpu.get(name, 0.0) + (time.perf_counter() - start) * 1000.0
+                if q is not None: self.frame_queries.append((name, q, self._query()))
+        return wrapper
+
+    def _query(self):
+        if not self.free_queries: self.free_queries.extend(int(q) for q in glGenQueries(32))
+        q = self.free_queries.pop()
+        glQueryCounter(q, GL_TIMESTAMP)
+        return q
+
+    def _read_gpu(self):
+        # Lê os resultados de quadros anteriores só quando já estão prontos, sem travar a GPU,
+        # a não ser que a fila passe de alguns quadros
+        out = ctypes.c_uint64()
+        while self.pending:
+            queries = self.pending[0]
+            if queries and len(self.pending) <= 3 and not glGetQueryObjectiv(queries[-1][2], GL_QUERY_RESULT_AVAILABLE): return
+            self.pending.popleft()
+            frame = {}
+            for name, q0, q1 in queries:
+                glGetQueryObjectui64v(q0, GL_QUERY_RESULT, ctypes.byref(out)); t0 = out.value
+                glGetQueryObjectui64v(q1, GL_QUERY_RESULT, ctypes.byref(out)); t1 = out.value
+                frame[name] = frame.get(name, 0.0) + (t1 - t0) / 1e6
+                self.free_queries += (q0, q1)
+            for name, ms in frame.items():
+                self.gpu_ms.setdefault(name, deque(maxlen=self.window)).append(ms)
+
+    def end_frame(self):
+        if not self.enabled: return
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frames.append((now - self.last_frame) * 1000.0)
+            self.calls.append(self.gl_calls)
+            for name, ms in self.frame_cpu.items():
+                self.cpu.setdefault(name, deque(maxlen=self.window)).append(ms)
+        self.last_frame = now
+        self.frame_cpu = {}
+        self.gl_calls = 0
+        if self.gpu:
+            self.pending.append(self.frame_queries)
+            self.frame_queries = []
+            self._read_gpu()
+        self.frame_count += 1
+        if self.log_path and self.frame_count % self.log_every == 0: self.write_log()
+
+    def summary(self):
+        if not self.frames: return None
+        frames = np.asarray(self.frames)
+        p50, p95, p99 = np.percentile(frames, [50, 95, 99])
+        return {
+            'time': time.time(),
+            'frames': len(frames),
+            'fps': 1000.0 / frames.mean(),
+            'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+            'gl_calls': float(np.mean(self.calls)),
+            'cpu_ms': {name: float(np.mean(v)) for name, v in self.cpu.items()},
+            'gpu_ms': {name: float(np.mean(v)) for name, v in self.gpu_ms.items()},
+        }
+
+    def write_log(self):
+        s = self.summary()
+        if s is None: return
+        if self.log_path.endswith('.csv'):
+            if self.log_fields is None:
+                names = [n for _, names in self.targets for n in names]
+                self.log_fields = ['time', 'frames', 'fps', 'p50_ms', 'p95_ms', 'p99_ms', 'gl_calls'] + \
+                    [f'cpu:{n}' for n in names] + [f'gpu:{n}' for n in names]
+            row = {k: s[k] for k in self.log_fields if k in s}
+            row.update({f'cpu:{n}': v for n, v in s['cpu_ms'].items()})
+            row.update({f'gpu:{n}': v for n, v in s['gpu_ms'].items()})
+            new = not os.path.exists(self.log_path)
+            with open(self.log_path, 'a', newline='') as f:
+                w = csv.DictWriter(f, self.log_fields, extrasaction='ignore')
+                if new: w.writeheader()
+                w.writerow(row)
+        else:
+            # Uma linha JSON por janela
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(s) + '\n')
+
+    def overlay_lines(self, top=8, every=30):
+        # Refeito só a cada alguns quadros: texto que muda todo quadro não aproveita o cache do TextRenderer
+        if self.overlay is None or self.frame_count - self.overlay_frame >= every:
+            self.overlay = self._overlay_lines(top)
+            self.overlay_frame = self.frame_count
+        return self.overlay
+
+    def _overlay_lines(self, top):
+        s = self.summary()
+        if s is None: return ["Perfil: coletando..."]
+        lines = [
+            f"FPS {s['fps']:.0f}  quadro p50 {s['p50_ms']:.1f}  p95 {s['p95_ms']:.1f}  p99 {s['p99_ms']:.1f} ms",
+            f"Chamadas GL/quadro: {s['gl_calls']:.0f}" + ("" if self.gpu else "  (sem timer de GPU)"),
+        ]
+        for name, ms in sorted(s['cpu_ms'].items(), key=lambda kv: -kv[1])[:top]:
+            gpu = s['gpu_ms'].get(name)
+            lines.append(f"{name:<22} cpu {ms:6.2f} ms" + (f"  gpu {gpu:6.2f} ms" if gpu is not None else ""))
+        return lines
@@ -0,0 +1,66 @@
+import json
+import time
+
+
+def percentile(values, p):
+    if not values: return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+class Recorder:
+    # Uma linha JSON por quadro: cabeçalho com a semente, quadros e rodapé com o resumo do estado final
+    def __init__(self, path, seed, game, **meta):
+        self.file = open(path, 'w')
+        self.frames = 0
+        self._write({'game': game, 'seed': seed, **meta})
+
+    def _write(self, obj):
+        self.file.write(json.dumps(obj, separators=(',', ':')) + '\n')
+
+    def frame(self, data):
+        self._write(data)
+        self.frames += 1
+
+    def close(self, digest):
+        if self.file.closed: return
+        self._write({'end': True, 'frames': self.frames, 'digest': digest})
+        self.file.close()
+
+
+class Replay:
+    def __init__(self, path):
+        with open(path) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        self.header = lines[0]
+        self.seed = self.header['seed']
+        self.footer = lines[-1] if len(lines) > 1 and isinstance(lines[-1], dict) and lines[-1].get('end') else None
+        self.frames = lines[1:-1] if self.footer else lines[1:]
+        self.times = []
+
+    def __iter__(self):
+        # O tempo entre entregar um quadro e pedir o próximo é o custo daquele quadro
+        self.times.clear()
+        for frame in self.frames:
+            t = time.perf_counter()
+            yield frame
+            self.times.append(time.perf_counter() - t)
+
+    def report(self, digest):
+        ms = [t * 1000.0 for t in self.times]
+        elapsed = sum(self.times)
+        expected = self.footer['digest'] if self.footer else None
+        return {
+            'game': self.header.get('game'),
+            'seed': self.seed,
+            'frames': len(ms),
+            'elapsed_s': elapsed,
+            'fps': len(ms) / elapsed if elapsed > 0 else float('inf'),
+            'p50_ms': percentile(ms, 50),
+            'p95_ms': percentile(ms, 95),
+            'p99_ms': percentile(ms, 99),
+            'max_ms': max(ms, default=0.0),
+            'digest': digest,
+            'expected_digest': expected,
+            'match': None if expected is None else expected == digest,
+        }
@@ -0,0 +1,123 @@
+import pygame
+import numpy as np
+from OpenGL.GL import *
+
+from gl_state import GLState
+
+# Fontes usadas pelo jogo: (nomes do sistema, tamanho em pixels)
+FONT_SMALL = ('helvetica,arial,dejavusans', 12)
+FONT_MEDIUM = ('helvetica,arial,dejavusans', 18)
+FONT_TITLE = ('timesnewroman,times,dejavuserif', 24)
+
+ATLAS_W = 512
+CHARSET = [chr(c) for c in range(32, 127)] + [chr(c) for c in range(160, 256)]
+
+
+class Glyph:
+    def __init__(self, x, y, w, h, advance):
+        self.x, self.y, self.w, self.h = x, y, w, h
+        self.advance = advance
+
+
+class TextRenderer:
+    def __init__(self, fonts=(FONT_SMALL, FONT_MEDIUM, FONT_TITLE), max_cached=512, gl=None):
+        self.fonts = fonts
+        self.gl = gl or GLState()
+        self.glyphs = {}
+        self.ascent = {}
+        self.height = {}
+        self.texture = None
+        self.atlas_size = (ATLAS_W, 1)
+        self.cache = {}
+        self.max_cached = max_cached
+        self.queue = []
+
+    def init_gl(self):
+        pygame.font.init()
+        rendered = []
+        for key in self.fonts:
+            names, size = key
+            font = pygame.font.SysFont(names, size)
+            self.ascent[key] = font.get_ascent()
+            self.height[key] = font.get_height()
+            metrics = font.metrics(''.join(CHARSET))
+            for ch, m in zip(CHARSET, metrics):
+                if m is None or font.size(ch)[0] == 0: continue
+                rendered.append((key, ch, font.render(ch, True, (255, 255, 255)), m[4]))
+
+        # Empacota os glifos em linhas de largura fixa
+        x = y = row_h = 0
+        places = []
+        for key, ch, surf, advance in rendered:
+            w, h = surf.get_size()
+            if x + w + 1 > ATLAS_W: x, y, row_h = 0, y + row_h + 1, 0
+            places.append((x, y))
+            x += w + 1; row_h = max(row_h, h)
+        atlas_h = y + row_h
+        atlas = pygame.Surface((ATLAS_W, atlas_h), pygame.SRCALPHA)
+        atlas.fill((255, 255, 255, 0))
+        for (key, ch, surf, advance), (gx, gy) in zip(rendered, places):
+            atlas.blit(surf, (gx, gy))
+            self.glyphs[(key, ch)] = Glyph(gx, gy, surf.get_width(), surf.get_height(), advance)
+
+        self.atlas_size = (ATLAS_W, atlas_h)
+        self.texture = glGenTextures(1)
+        self.gl.bind_texture(self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, ATLAS_W, atlas_h, 0, GL_RGBA, GL_UNSIGNED_BYTE,
+                     pygame.image.tostring(atlas, 'RGBA'))
+
+    def measure(self, text, font=FONT_MEDIUM):
+        width = sum(self.glyphs[(font, c)].advance for c in text if (font, c) in self.glyphs)
+        return width, self.height.get(font, 0)
+
+    def _build(self, text, x, y, font, color):
+        glyphs = [self.glyphs[(font, c)] for c in text if (font, c) in self.glyphs]
+        n = len(glyphs)
+        verts = np.empty((n, 4, 2), np.float32)
+        tex = np.empty((n, 4, 2), np.float32)
+        aw, ah = self.atlas_size
+        top = y - self.ascent[font]
+        pen = x
+        for i, g in enumerate(glyphs):
+            x0, x1, y0, y1 = pen, pen + g.w, top, top + g.h
+            verts[i] = ((x0, y0), (x1, y0), (x1, y1), (x0, y1))
+            u0, u1, v0, v1 = g.x / aw, (g.x + g.w) / aw, g.y / ah, (g.y + g.h) / ah
+            tex[i] = ((u0, v0), (u1, v0), (u1, v1), (u0, v1))
+            pen += g.advance
+        colors = np.tile(np.asarray(color, np.float32), (n * 4, 1))
+        return verts.reshape(-1, 2), tex.reshape(-1, 2), colors
+
+    def draw(self, text, x, y, font=FONT_MEDIUM, color=(1.0, 1.0, 1.0, 1.0)):
+        # x, y: início da linha de base, em coordenadas de tela (y para baixo)
+        if len(color) == 3: color = (*color, 1.0)
+        key = (font, text, x, y, color)
+        batch = self.cache.get(key)
+        if batch is None:
+            if len(self.cache) >= self.max_cached: self.cache.clear()
+            batch = self.cache[key] = self._build(text, x, y, font, color)
+        self.queue.append(batch)
+
+    def flush(self):
+        # Desenha todo o texto enfileirado com uma única chamada
+        if not self.queue or self.texture is None:
+            self.queue.clear()
+            return
+        if len(self.queue) == 1:
+            verts, tex, colors = self.queue[0]
+        else:
+            verts = np.concatenate([b[0] for b in self.queue])
+            tex = np.concatenate([b[1] for b in self.queue])
+            colors = np.concatenate([b[2] for b in self.queue])
+        self.queue.clear()
+        if not len(verts): return
+        gl = self.gl
+        gl.enable(GL_TEXTURE_2D); gl.bind_texture(self.texture)
+        gl.enable(GL_BLEND); gl.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnableClientState(GL_VERTEX_ARRAY); glEnableClientState(GL_TEXTURE_COORD_ARRAY); glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, verts)
+        glTexCoordPointer(2, GL_FLOAT, 0, tex)
+        glColorPointer(4, GL_FLOAT, 0, colors)
+        glDrawArrays(GL_QUADS, 0, len(verts))
+        glDisableClientState(GL_COLOR_ARRAY); glDisableClientState(GL_TEXTURE_COORD_ARRAY); glDisableClientState(GL_VERTEX_ARRAY)